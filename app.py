@@ -1,451 +1,530 @@
-import tkinter as tk
-from tkinter import scrolledtext, simpledialog, messagebox, ttk
-import subprocess
-import threading
-import json
-import os
-
-class FileDecisionDialog:
-    def __init__(self, parent, changes_data):
-        self.result = {}
-        self.changes_data = changes_data
-        
-        # Create dialog window
-        self.dialog = tk.Toplevel(parent)
-        self.dialog.title("File Decision Manager")
-        self.dialog.geometry("900x700")
-        self.dialog.grab_set()  # Make modal
-        self.dialog.resizable(True, True)
-        
-        self.setup_ui()
-        
-    def setup_ui(self):
-        # Main frame with scrollbar
-        main_frame = tk.Frame(self.dialog)
-        main_frame.pack(fill='both', expand=True, padx=10, pady=10)
-        
-        # Title
-        title_label = tk.Label(main_frame, text="Individual File Decisions", 
-                              font=("Arial", 14, "bold"))
-        title_label.pack(pady=(0, 10))
-        
-        # Instructions
-        instructions = tk.Label(main_frame, 
-                               text="Choose what to do with each file. Your workspace will be updated based on these decisions.",
-                               font=("Arial", 10), wraplength=800)
-        instructions.pack(pady=(0, 10))
-        
-        # Create notebook for different change types
-        self.notebook = ttk.Notebook(main_frame)
-        self.notebook.pack(fill='both', expand=True, pady=(0, 10))
-        
-        self.file_vars = {}
-        
-        # Added Files Tab
-        if self.changes_data.get('added'):
-            self.create_added_files_tab()
-        
-        # Modified Files Tab  
-        if self.changes_data.get('modified'):
-            self.create_modified_files_tab()
-            
-        # Deleted Files Tab
-        if self.changes_data.get('deleted'):
-            self.create_deleted_files_tab()
-        
-        # Buttons frame
-        button_frame = tk.Frame(main_frame)
-        button_frame.pack(pady=10)
-        
-        # Bulk action buttons
-        bulk_frame = tk.Frame(button_frame)
-        bulk_frame.pack(pady=(0, 10))
-        
-        tk.Button(bulk_frame, text="Keep All Changes", command=self.keep_all_changes,
-                 bg="lightgreen", width=15).pack(side='left', padx=5)
-        tk.Button(bulk_frame, text="Revert All Changes", command=self.revert_all_changes,
-                 bg="lightcoral", width=15).pack(side='left', padx=5)
-        
-        # Action buttons
-        action_frame = tk.Frame(button_frame)
-        action_frame.pack()
-        
-        tk.Button(action_frame, text="Apply Decisions", command=self.apply_decisions,
-                 bg="lightblue", width=15, font=("Arial", 10, "bold")).pack(side='left', padx=5)
-        tk.Button(action_frame, text="Cancel", command=self.cancel,
-                 width=15).pack(side='left', padx=5)
-    
-    def create_added_files_tab(self):
-        """Create tab for added files"""
-        added_frame = ttk.Frame(self.notebook)
-        self.notebook.add(added_frame, text=f"Added Files ({len(self.changes_data['added'])})")
-        
-        # Create scrollable frame
-        canvas = tk.Canvas(added_frame)
-        scrollbar = ttk.Scrollbar(added_frame, orient="vertical", command=canvas.yview)
-        scrollable_frame = ttk.Frame(canvas)
-        
-        canvas.configure(yscrollcommand=scrollbar.set)
-        canvas.bind('<Configure>', lambda e: canvas.configure(scrollregion=canvas.bbox("all")))
-        canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
-        
-        canvas.pack(side="left", fill="both", expand=True)
-        scrollbar.pack(side="right", fill="y")
-        
-        # Instructions for added files
-        info_label = tk.Label(scrollable_frame, 
-                             text="These files were created during your session:",
-                             font=("Arial", 10, "bold"), fg="green")
-        info_label.pack(anchor='w', pady=(5, 10))
-        
-        self.file_vars['added'] = {}
-        
-        for file_path in self.changes_data['added']:
-            file_frame = tk.Frame(scrollable_frame, relief='ridge', bd=1)
-            file_frame.pack(fill='x', padx=5, pady=2)
-            
-            # File path label
-            path_label = tk.Label(file_frame, text=file_path, font=("Courier", 9), anchor='w')
-            path_label.pack(side='left', fill='x', expand=True, padx=5, pady=5)
-            
-            # Decision variable
-            var = tk.StringVar(value="keep")
-            self.file_vars['added'][file_path] = var
-            
-            # Radio buttons
-            radio_frame = tk.Frame(file_frame)
-            radio_frame.pack(side='right', padx=5)
-            
-            tk.Radiobutton(radio_frame, text="Keep", variable=var, value="keep",
-                          fg="green").pack(side='left')
-            tk.Radiobutton(radio_frame, text="Delete", variable=var, value="delete",
-                          fg="red").pack(side='left')
-    
-    def create_modified_files_tab(self):
-        """Create tab for modified files"""
-        modified_frame = ttk.Frame(self.notebook)
-        self.notebook.add(modified_frame, text=f"Modified Files ({len(self.changes_data['modified'])})")
-        
-        # Create scrollable frame
-        canvas = tk.Canvas(modified_frame)
-        scrollbar = ttk.Scrollbar(modified_frame, orient="vertical", command=canvas.yview)
-        scrollable_frame = ttk.Frame(canvas)
-        
-        canvas.configure(yscrollcommand=scrollbar.set)
-        canvas.bind('<Configure>', lambda e: canvas.configure(scrollregion=canvas.bbox("all")))
-        canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
-        
-        canvas.pack(side="left", fill="both", expand=True)
-        scrollbar.pack(side="right", fill="y")
-        
-        # Instructions for modified files
-        info_label = tk.Label(scrollable_frame, 
-                             text="These files were changed during your session:",
-                             font=("Arial", 10, "bold"), fg="orange")
-        info_label.pack(anchor='w', pady=(5, 10))
-        
-        self.file_vars['modified'] = {}
-        
-        for file_path in self.changes_data['modified']:
-            file_frame = tk.Frame(scrollable_frame, relief='ridge', bd=1)
-            file_frame.pack(fill='x', padx=5, pady=2)
-            
-            # File path label
-            path_label = tk.Label(file_frame, text=file_path, font=("Courier", 9), anchor='w')
-            path_label.pack(side='left', fill='x', expand=True, padx=5, pady=5)
-            
-            # Decision variable
-            var = tk.StringVar(value="keep")
-            self.file_vars['modified'][file_path] = var
-            
-            # Radio buttons
-            radio_frame = tk.Frame(file_frame)
-            radio_frame.pack(side='right', padx=5)
-            
-            tk.Radiobutton(radio_frame, text="Keep Changes", variable=var, value="keep",
-                          fg="green").pack(side='left')
-            tk.Radiobutton(radio_frame, text="Revert to Original", variable=var, value="revert",
-                          fg="red").pack(side='left')
-    
-    def create_deleted_files_tab(self):
-        """Create tab for deleted files"""
-        deleted_frame = ttk.Frame(self.notebook)
-        self.notebook.add(deleted_frame, text=f"Deleted Files ({len(self.changes_data['deleted'])})")
-        
-        # Create scrollable frame
-        canvas = tk.Canvas(deleted_frame)
-        scrollbar = ttk.Scrollbar(deleted_frame, orient="vertical", command=canvas.yview)
-        scrollable_frame = ttk.Frame(canvas)
-        
-        canvas.configure(yscrollcommand=scrollbar.set)
-        canvas.bind('<Configure>', lambda e: canvas.configure(scrollregion=canvas.bbox("all")))
-        canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
-        
-        canvas.pack(side="left", fill="both", expand=True)
-        scrollbar.pack(side="right", fill="y")
-        
-        # Instructions for deleted files
-        info_label = tk.Label(scrollable_frame, 
-                             text="These files were deleted during your session:",
-                             font=("Arial", 10, "bold"), fg="red")
-        info_label.pack(anchor='w', pady=(5, 10))
-        
-        self.file_vars['deleted'] = {}
-        
-        for file_path in self.changes_data['deleted']:
-            file_frame = tk.Frame(scrollable_frame, relief='ridge', bd=1)
-            file_frame.pack(fill='x', padx=5, pady=2)
-            
-            # File path label
-            path_label = tk.Label(file_frame, text=file_path, font=("Courier", 9), anchor='w')
-            path_label.pack(side='left', fill='x', expand=True, padx=5, pady=5)
-            
-            # Decision variable
-            var = tk.StringVar(value="restore")
-            self.file_vars['deleted'][file_path] = var
-            
-            # Radio buttons
-            radio_frame = tk.Frame(file_frame)
-            radio_frame.pack(side='right', padx=5)
-            
-            tk.Radiobutton(radio_frame, text="Restore File", variable=var, value="restore",
-                          fg="green").pack(side='left')
-            tk.Radiobutton(radio_frame, text="Keep Deleted", variable=var, value="keep_deleted",
-                          fg="red").pack(side='left')
-    
-    def keep_all_changes(self):
-        """Set all files to keep current state"""
-        for category in self.file_vars:
-            for file_path, var in self.file_vars[category].items():
-                if category == 'added':
-                    var.set("keep")
-                elif category == 'modified':
-                    var.set("keep")
-                elif category == 'deleted':
-                    var.set("keep_deleted")
-    
-    def revert_all_changes(self):
-        """Set all files to revert to original state"""
-        for category in self.file_vars:
-            for file_path, var in self.file_vars[category].items():
-                if category == 'added':
-                    var.set("delete")
-                elif category == 'modified':
-                    var.set("revert")
-                elif category == 'deleted':
-                    var.set("restore")
-    
-    def apply_decisions(self):
-        """Apply the user's decisions"""
-        decisions = {}
-        
-        for category in self.file_vars:
-            decisions[category] = {}
-            for file_path, var in self.file_vars[category].items():
-                decisions[category][file_path] = var.get()
-        
-        self.result = decisions
-        self.dialog.destroy()
-    
-    def cancel(self):
-        """Cancel without making changes"""
-        self.result = {}
-        self.dialog.destroy()
-
-class SecureWorkspaceUI:
-    def __init__(self, root):
-        self.root = root
-        self.root.title("Secure Workspace - Enhanced File Control")
-        self.root.geometry("900x700")
-
-        self.status_label = tk.Label(root, text="Status: Idle", fg="blue", font=("Arial", 12))
-        self.status_label.pack(pady=5)
-
-        # Button frame for better organization
-        button_frame = tk.Frame(root)
-        button_frame.pack(pady=10)
-
-        self.timer_button = tk.Button(button_frame, text="Set Session Timer (minutes)", 
-                                     command=self.set_timer, width=25)
-        self.timer_button.pack(pady=2)
-
-        self.start_button = tk.Button(button_frame, text="Start Session", 
-                                     command=self.run_start, width=25, bg="lightgreen")
-        self.start_button.pack(pady=2)
-
-        self.stop_button = tk.Button(button_frame, text="Stop Session", 
-                                    command=self.run_stop, width=25, bg="lightcoral")
-        self.stop_button.pack(pady=2)
-
-        # Log area with frame and label
-        log_frame = tk.Frame(root)
-        log_frame.pack(padx=10, pady=10, fill='both', expand=True)
-        
-        log_label = tk.Label(log_frame, text="Session Log:", font=("Arial", 10, "bold"))
-        log_label.pack(anchor='w')
-
-        self.log = scrolledtext.ScrolledText(log_frame, height=25, width=110, 
-                                           state='disabled', font=("Consolas", 9))
-        self.log.pack(fill='both', expand=True)
-
-        self.session_timer = None
-        self.session_active = False
-        self.pending_changes = None
-        
-        # Update button states
-        self.update_button_states()
-
-    def append_log(self, text):
-        self.log.configure(state='normal')
-        self.log.insert(tk.END, text + '\n')
-        self.log.configure(state='disabled')
-        self.log.see(tk.END)
-        self.root.update_idletasks()
-
-    def update_status(self, status):
-        self.status_label.config(text=f"Status: {status}")
-        if "Started" in status:
-            self.session_active = True
-        elif "Stopped" in status or "Idle" in status:
-            self.session_active = False
-        self.update_button_states()
-
-    def update_button_states(self):
-        if self.session_active:
-            self.start_button.config(state='disabled')
-            self.stop_button.config(state='normal')
-        else:
-            self.start_button.config(state='normal')
-            self.stop_button.config(state='disabled')
-
-    def run_command(self, script):
-        try:
-            # Get the directory of the current script (all files are in same folder)
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-            script_path = os.path.join(script_dir, script)
-            
-            process = subprocess.Popen(
-                ["python3", script_path], 
-                stdout=subprocess.PIPE, 
-                stderr=subprocess.PIPE, 
-                text=True,
-                cwd=script_dir
-            )
-            
-            # Read output in real-time
-            output_buffer = ""
-            while True:
-                output = process.stdout.readline()
-                if output == '' and process.poll() is not None:
-                    break
-                if output:
-                    line = output.strip()
-                    self.append_log(line)
-                    output_buffer += line + "\n"
-                    
-                    # Check for changes detection
-                    if "CHANGES_DETECTED_START" in line:
-                        self.capture_changes_data(process)
-            
-            # Get any remaining output
-            remaining_output, error = process.communicate()
-            if remaining_output:
-                self.append_log(remaining_output.strip())
-            if error:
-                self.append_log("Error:\n" + error.strip())
-
-        except Exception as e:
-            self.append_log(f"Exception: {str(e)}")
-
-    def capture_changes_data(self, process):
-        """Capture the changes data from the process output"""
-        changes_json = ""
-        capturing = True
-        
-        while capturing:
-            line = process.stdout.readline()
-            if not line:
-                break
-            line = line.strip()
-            self.append_log(line)
-            
-            if "CHANGES_DETECTED_END" in line:
-                capturing = False
-            elif "CHANGES_DETECTED_START" not in line:
-                changes_json += line + "\n"
-        
-        try:
-            changes_data = json.loads(changes_json)
-            if any(changes_data.values()):  # If there are any changes
-                self.root.after(500, lambda: self.show_file_decision_dialog(changes_data))
-        except json.JSONDecodeError:
-            self.append_log("Error: Could not parse changes data")
-
-    def show_file_decision_dialog(self, changes_data):
-        """Show the file decision dialog"""
-        dialog = FileDecisionDialog(self.root, changes_data)
-        self.root.wait_window(dialog.dialog)
-        
-        if dialog.result:
-            # Save decisions to file
-            with open("user_choices.json", "w") as f:
-                json.dump(dialog.result, f, indent=2)
-            self.append_log("\nFile decisions saved. Processing changes...")
-        else:
-            # User cancelled - create empty choices file
-            with open("user_choices.json", "w") as f:
-                json.dump({}, f)
-            self.append_log("\nNo decisions made. Keeping all changes by default...")
-
-    def run_start(self):
-        self.update_status("Starting session...")
-        self.append_log("=" * 60)
-        self.append_log("STARTING SECURE WORKSPACE SESSION")
-        self.append_log("=" * 60)
-        threading.Thread(target=self._run_and_log, args=("start_session.py", "Session Started"), daemon=True).start()
-
-    def run_stop(self):
-        self.update_status("Stopping session...")
-        self.append_log("\n" + "=" * 60)
-        self.append_log("STOPPING SECURE WORKSPACE SESSION")
-        self.append_log("=" * 60)
-        if self.session_timer:
-            self.root.after_cancel(self.session_timer)
-            self.session_timer = None
-            self.append_log("Session timer cancelled.")
-        threading.Thread(target=self._run_and_log, args=("stop_session.py", "Session Stopped"), daemon=True).start()
-
-    def _run_and_log(self, script, done_status):
-        self.run_command(script)
-        self.update_status(done_status)
-
-    def set_timer(self):
-        minutes = simpledialog.askinteger("Session Timer", 
-                                        "Enter session duration in minutes:", 
-                                        minvalue=1, maxvalue=480)
-        if minutes:
-            if self.session_timer:
-                self.root.after_cancel(self.session_timer)
-            self.session_timer = self.root.after(minutes * 60 * 1000, self.auto_stop_session)
-            self.append_log(f"Session timer set for {minutes} minute(s)")
-
-    def auto_stop_session(self):
-        self.append_log("\n*** SESSION TIMER EXPIRED - AUTO STOPPING ***")
-        self.run_stop()
-
-    def on_closing(self):
-        if self.session_active:
-            if messagebox.askokcancel("Quit", "A session is active. Stop session before quitting?"):
-                self.run_stop()
-                # Give time for session to stop before closing
-                self.root.after(3000, self.root.destroy)
-            else:
-                return
-        else:
-            self.root.destroy()
-
-if __name__ == "__main__":
-    root = tk.Tk()
-    app = SecureWorkspaceUI(root)
-    root.protocol("WM_DELETE_WINDOW", app.on_closing)
-    root.mainloop()
+import tkinter as tk
+from tkinter import scrolledtext, simpledialog, messagebox, ttk
+import subprocess
+import threading
+import json
+import os
+import queue
+
+import workspace_daemon
+import workspace_events
+from change_decisions import ChangeDecisions, path_filter
+
+DRAIN_INTERVAL_MS = 100  # How often the UI thread renders queued events
+MAX_EVENTS_PER_DRAIN = 2000  # The rest wait for the next tick, so the UI stays responsive
+MAX_LOG_LINES = 5000  # Older lines are dropped from the log view
+
+DIALOG_PAGE_ROWS = 500  # Tree rows inserted at a time, as they scroll into view
+FILTER_DELAY_MS = 300  # Refilter once typing pauses this long
+KIND_FILTERS = ("All", "Added", "Modified", "Deleted")
+# Decision column text per change kind: (reverted, kept)
+DECISION_LABELS = {
+    "added": ("Delete", "Keep"),
+    "modified": ("Revert to Original", "Keep Changes"),
+    "deleted": ("Restore File", "Keep Deleted"),
+}
+
+class FileDecisionDialog:
+    """Keep/revert decisions for a session's changes, grouped by directory
+
+    Rows are Treeview items, inserted a page at a time: directories as
+    they scroll into view, a directory's files when it is opened. The
+    decisions themselves live in a ChangeDecisions model, so bulk actions
+    only refresh the rows that exist.
+    """
+
+    def __init__(self, parent, changes_data):
+        self.result = None  # The ChangeDecisions once applied; None if cancelled
+        self.model = ChangeDecisions(changes_data)
+        self.predicate, self.kinds = None, None  # The current filter
+        self.groups, self.directories = {}, []
+        self.rows = {}  # Treeview item -> ("dir", directory) or ("file", path)
+        self.more_rows = {}  # "N more" item -> (parent item, entries, next index)
+        self.filter_job = None
+        
+        # Create dialog window
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.title("File Decision Manager")
+        self.dialog.geometry("900x700")
+        self.dialog.grab_set()  # Make modal
+        self.dialog.resizable(True, True)
+        
+        self.setup_ui()
+        self.refresh()
+        
+    def setup_ui(self):
+        main_frame = tk.Frame(self.dialog)
+        main_frame.pack(fill='both', expand=True, padx=10, pady=10)
+        
+        # Title
+        title_label = tk.Label(main_frame, text="Individual File Decisions", 
+                              font=("Arial", 14, "bold"))
+        title_label.pack(pady=(0, 10))
+        
+        # Instructions
+        instructions = tk.Label(main_frame, 
+                               text="Choose what to do with each file. Your workspace will be updated based on these decisions. "
+                                    "Select a directory to decide for all of its files shown; press Space to toggle.",
+                               font=("Arial", 10), wraplength=800)
+        instructions.pack(pady=(0, 10))
+
+        # Filter: substring or glob, and change kind
+        filter_frame = tk.Frame(main_frame)
+        filter_frame.pack(fill='x', pady=(0, 5))
+        tk.Label(filter_frame, text="Filter (text or glob, e.g. *.log):").pack(side='left')
+        self.filter_var = tk.StringVar()
+        self.filter_var.trace_add('write', lambda *args: self.schedule_refresh())
+        tk.Entry(filter_frame, textvariable=self.filter_var, width=40).pack(side='left', padx=5)
+        self.kind_var = tk.StringVar(value=KIND_FILTERS[0])
+        kind_box = ttk.Combobox(filter_frame, textvariable=self.kind_var, values=KIND_FILTERS,
+                                state='readonly', width=10)
+        kind_box.pack(side='left', padx=5)
+        kind_box.bind('<<ComboboxSelected>>', lambda e: self.refresh())
+        self.count_label = tk.Label(filter_frame, text="", fg="gray")
+        self.count_label.pack(side='right')
+
+        # Change tree
+        tree_frame = tk.Frame(main_frame)
+        tree_frame.pack(fill='both', expand=True, pady=(0, 10))
+        self.tree = ttk.Treeview(tree_frame, columns=("change", "decision"), selectmode='extended')
+        self.tree.heading("#0", text="Path")
+        self.tree.heading("change", text="Change")
+        self.tree.heading("decision", text="Decision")
+        self.tree.column("#0", width=560)
+        self.tree.column("change", width=120, anchor='center')
+        self.tree.column("decision", width=160, anchor='center')
+        self.tree.tag_configure("added", foreground="green")
+        self.tree.tag_configure("modified", foreground="orange")
+        self.tree.tag_configure("deleted", foreground="red")
+        self.tree.tag_configure("more", foreground="gray")
+        scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=lambda first, last: self.on_scroll(scrollbar, first, last))
+        self.tree.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
+        self.tree.bind('<<TreeviewOpen>>', self.on_open)
+        self.tree.bind('<<TreeviewSelect>>', self.on_select)
+        self.tree.bind('<space>', lambda e: self.toggle_selected())
+        self.tree.bind('<Double-1>', lambda e: self.toggle_selected())
+        
+        # Buttons frame
+        button_frame = tk.Frame(main_frame)
+        button_frame.pack(pady=10)
+        
+        # Bulk action buttons
+        bulk_frame = tk.Frame(button_frame)
+        bulk_frame.pack(pady=(0, 10))
+        
+        tk.Button(bulk_frame, text="Keep Selected", command=lambda: self.decide_selected(True),
+                 bg="lightgreen", width=15).pack(side='left', padx=5)
+        tk.Button(bulk_frame, text="Revert Selected", command=lambda: self.decide_selected(False),
+                 bg="lightcoral", width=15).pack(side='left', padx=5)
+        tk.Button(bulk_frame, text="Keep All Shown", command=lambda: self.decide_shown(True),
+                 bg="lightgreen", width=15).pack(side='left', padx=5)
+        tk.Button(bulk_frame, text="Revert All Shown", command=lambda: self.decide_shown(False),
+                 bg="lightcoral", width=15).pack(side='left', padx=5)
+        
+        # Action buttons
+        action_frame = tk.Frame(button_frame)
+        action_frame.pack()
+        
+        tk.Button(action_frame, text="Apply Decisions", command=self.apply_decisions,
+                 bg="lightblue", width=15, font=("Arial", 10, "bold")).pack(side='left', padx=5)
+        tk.Button(action_frame, text="Cancel", command=self.cancel,
+                 width=15).pack(side='left', padx=5)
+
+    def schedule_refresh(self):
+        """Refilter once typing pauses"""
+        if self.filter_job:
+            self.dialog.after_cancel(self.filter_job)
+        self.filter_job = self.dialog.after(FILTER_DELAY_MS, self.refresh)
+
+    def refresh(self):
+        """Rebuild the tree for the current filter"""
+        self.filter_job = None
+        self.predicate = path_filter(self.filter_var.get())
+        kind = self.kind_var.get().lower()
+        self.kinds = None if kind == "all" else (kind,)
+        self.groups = self.model.grouped(self.predicate, self.kinds)
+        self.directories = sorted(self.groups)
+        self.tree.delete(*self.tree.get_children())
+        self.rows.clear()
+        self.more_rows.clear()
+        self.insert_page("", self.directories, 0)
+        shown = sum(len(paths) for paths in self.groups.values())
+        self.count_label.config(text=f"{shown} of {len(self.model)} changes shown")
+
+    def insert_page(self, parent, entries, start):
+        """Insert ``entries[start:]`` under ``parent``, a page at a time"""
+        end = start + DIALOG_PAGE_ROWS
+        for entry in entries[start:end]:
+            if parent == "":
+                item = self.tree.insert("", 'end', text=f"{entry or '(workspace root)'}/",
+                                        values=self.directory_values(entry))
+                self.tree.insert(item, 'end', text="")  # Placeholder until opened
+                self.rows[item] = ("dir", entry)
+            else:
+                kind = self.model.kinds[entry]
+                item = self.tree.insert(parent, 'end', text=entry.rpartition("/")[2], tags=(kind,),
+                                        values=(kind.capitalize(), self.decision_label(entry)))
+                self.rows[item] = ("file", entry)
+        if end < len(entries):
+            item = self.tree.insert(parent, 'end', text=f"... {len(entries) - end} more", tags=("more",))
+            self.more_rows[item] = (parent, entries, end)
+
+    def load_more(self, item):
+        parent, entries, start = self.more_rows.pop(item)
+        self.tree.delete(item)
+        self.insert_page(parent, entries, start)
+
+    def on_scroll(self, scrollbar, first, last):
+        scrollbar.set(first, last)
+        if self.more_rows:
+            self.dialog.after_idle(self.load_visible)
+
+    def load_visible(self):
+        """Load the next page wherever a "more" row has scrolled into view"""
+        for item in list(self.more_rows):
+            if item in self.more_rows and self.tree.bbox(item):
+                self.load_more(item)
+
+    def on_open(self, event):
+        item = self.tree.focus()
+        if self.rows.get(item, ("",))[0] == "dir" and not self.rows.get(self.tree.get_children(item)[0]):
+            self.tree.delete(*self.tree.get_children(item))
+            self.insert_page(item, self.groups[self.rows[item][1]], 0)
+
+    def on_select(self, event):
+        for item in self.tree.selection():
+            if item in self.more_rows:
+                self.load_more(item)
+
+    def decision_label(self, path):
+        return DECISION_LABELS[self.model.kinds[path]][self.model.keeps(path)]
+
+    def directory_values(self, directory):
+        paths = self.groups[directory]
+        kept = sum(1 for path in paths if self.model.keeps(path))
+        return (f"{len(paths)} files", f"{kept} keep, {len(paths) - kept} revert")
+
+    def refresh_rows(self):
+        """Show the current decisions on every inserted row"""
+        for item, (row_type, key) in self.rows.items():
+            if row_type == "dir":
+                self.tree.item(item, values=self.directory_values(key))
+            else:
+                self.tree.set(item, "decision", self.decision_label(key))
+
+    def decide_selected(self, keep):
+        for item in self.tree.selection():
+            row_type, key = self.rows.get(item, (None, None))
+            if row_type == "dir":
+                self.model.decide_directory(key, keep, self.predicate, self.kinds)
+            elif row_type == "file":
+                self.model.decide(key, keep)
+        self.refresh_rows()
+
+    def toggle_selected(self):
+        for item in self.tree.selection():
+            row_type, key = self.rows.get(item, (None, None))
+            if row_type == "file":
+                self.model.decide(key, not self.model.keeps(key))
+        self.refresh_rows()
+
+    def decide_shown(self, keep):
+        """Decide every change the filter shows, loaded or not"""
+        self.model.decide_all(keep, self.predicate, self.kinds)
+        self.refresh_rows()
+    
+    def apply_decisions(self):
+        """Apply the user's decisions"""
+        self.result = self.model
+        self.dialog.destroy()
+    
+    def cancel(self):
+        """Cancel without making changes"""
+        self.result = None
+        self.dialog.destroy()
+
+class SecureWorkspaceUI:
+    def __init__(self, root):
+        self.root = root
+        self.root.title("Secure Workspace - Enhanced File Control")
+        self.root.geometry("900x700")
+
+        self.status_label = tk.Label(root, text="Status: Idle", fg="blue", font=("Arial", 12))
+        self.status_label.pack(pady=5)
+
+        self.progress_label = tk.Label(root, text="", font=("Arial", 9))
+        self.progress_label.pack()
+        self.progress_bar = ttk.Progressbar(root, length=400, mode='determinate')
+        self.progress_bar.pack(pady=(0, 5))
+
+        # Button frame for better organization
+        button_frame = tk.Frame(root)
+        button_frame.pack(pady=10)
+
+        self.timer_button = tk.Button(button_frame, text="Set Session Timer (minutes)", 
+                                     command=self.set_timer, width=25)
+        self.timer_button.pack(pady=2)
+
+        self.start_button = tk.Button(button_frame, text="Start Session", 
+                                     command=self.run_start, width=25, bg="lightgreen")
+        self.start_button.pack(pady=2)
+
+        self.stop_button = tk.Button(button_frame, text="Stop Session", 
+                                    command=self.run_stop, width=25, bg="lightcoral")
+        self.stop_button.pack(pady=2)
+
+        self.watch_var = tk.BooleanVar(value=False)
+        self.watch_check = tk.Checkbutton(button_frame, text="Watch for changes (faster stop, Linux)",
+                                          variable=self.watch_var)
+        self.watch_check.pack(pady=2)
+
+        # Log area with frame and label
+        log_frame = tk.Frame(root)
+        log_frame.pack(padx=10, pady=10, fill='both', expand=True)
+        
+        log_label = tk.Label(log_frame, text="Session Log:", font=("Arial", 10, "bold"))
+        log_label.pack(anchor='w')
+
+        self.log = scrolledtext.ScrolledText(log_frame, height=25, width=110, 
+                                           state='disabled', font=("Consolas", 9))
+        self.log.pack(fill='both', expand=True)
+
+        self.session_timer = None
+        self.session_active = False
+        self.pending_changes = None
+        self.daemon = None  # workspace_daemon client, connected on first use
+        self.daemon_lock = threading.Lock()  # One request on the connection at a time
+        # Worker threads never touch widgets: they queue events (see
+        # workspace_events, plus "status" and "call") for drain_events
+        self.events = queue.Queue()
+        
+        # Update button states
+        self.update_button_states()
+        self.root.after(DRAIN_INTERVAL_MS, self.drain_events)
+
+    def post(self, kind, **fields):
+        """Queue an event for the UI thread; safe from any thread"""
+        self.events.put(workspace_events.event(kind, **fields))
+
+    def append_log(self, text):
+        self.post("log", line=text)
+
+    def update_status(self, status):
+        self.post("status", status=status)
+
+    def on_ui_thread(self, function):
+        self.post("call", function=function)
+
+    def drain_events(self):
+        """Render queued events in one batch: one log insert, the latest progress"""
+        lines, progress = [], None
+        for _ in range(MAX_EVENTS_PER_DRAIN):
+            try:
+                message = self.events.get_nowait()
+            except queue.Empty:
+                break
+            kind = message["event"]
+            if kind == "log":
+                lines.append(message["line"])
+            elif kind == "progress":
+                progress = message
+            elif kind == "error":
+                where = f"{message['path']}: " if message.get("path") else ""
+                lines.append(f"Error: {where}{message['message']}")
+            elif kind == "status":
+                self.show_status(message["status"])
+            elif kind == "call":
+                self.root.after_idle(message["function"])  # May open a modal dialog
+            # "changes" needs no rendering: the worker that asked for them
+            # opens the decision dialog through decide_on_changes
+        if lines:
+            self.log.configure(state='normal')
+            self.log.insert(tk.END, "\n".join(lines) + "\n")
+            excess = int(self.log.index('end-1c').split('.')[0]) - 1 - MAX_LOG_LINES
+            if excess > 0:
+                self.log.delete("1.0", f"{excess + 1}.0")
+            self.log.configure(state='disabled')
+            self.log.see(tk.END)
+        if progress is not None:
+            self.show_progress(progress)
+        self.root.after(DRAIN_INTERVAL_MS, self.drain_events)
+
+    def show_progress(self, message):
+        phase, done, total = message["phase"].capitalize(), message["done"], message.get("total")
+        if total:
+            self.progress_bar.configure(mode='determinate', maximum=total, value=done)
+            self.progress_label.config(text=f"{phase}: {done}/{total} files")
+        else:
+            # Still walking: the total isn't known yet
+            self.progress_bar.configure(mode='indeterminate')
+            self.progress_bar.step(5)
+            self.progress_label.config(text=f"{phase}: {done} files")
+
+    def show_status(self, status):
+        self.status_label.config(text=f"Status: {status}")
+        if "Started" in status:
+            self.session_active = True
+        elif "Stopped" in status or "Idle" in status:
+            self.session_active = False
+        self.update_button_states()
+
+    def update_button_states(self):
+        if self.session_active:
+            self.start_button.config(state='disabled')
+            self.stop_button.config(state='normal')
+        else:
+            self.start_button.config(state='normal')
+            self.stop_button.config(state='disabled')
+
+    def run_command(self, script, args=()):
+        try:
+            # Get the directory of the current script (all files are in same folder)
+            script_dir = os.path.dirname(os.path.abspath(__file__))
+            script_path = os.path.join(script_dir, script)
+            
+            process = subprocess.Popen(
+                ["python3", script_path, "--events", *args], 
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE, 
+                stderr=subprocess.STDOUT, 
+                text=True,
+                cwd=script_dir
+            )
+            
+            # Read events in real-time; anything else (a traceback) is logged as is
+            for line in process.stdout:
+                message = workspace_events.parse_event(line)
+                if message is None:
+                    self.append_log(line.rstrip("\n"))
+                elif message["event"] == "changes" and "--keep-from-stdin" in args:
+                    # stop_session.py waits for the paths to keep before reverting
+                    changes = {kind: message[kind] for kind in ("added", "modified", "deleted")}
+                    keep = self.decide_on_changes(changes) if any(changes.values()) else []
+                    process.stdin.write(json.dumps(keep) + "\n")
+                    process.stdin.flush()
+                else:
+                    self.events.put(message)
+            process.stdin.close()
+            process.wait()
+
+        except Exception as e:
+            self.append_log(f"Exception: {str(e)}")
+
+    def call_daemon(self, method, **params):
+        """Run ``method`` on the workspace daemon, starting it if needed
+
+        Returns None when no daemon can be reached, so callers fall back to
+        running the scripts.
+        """
+        with self.daemon_lock:
+            if self.daemon is None:
+                self.daemon = workspace_daemon.ensure_daemon()
+                if self.daemon is None:
+                    return None
+            try:
+                return self.daemon.call(method, on_log=self.append_log, on_event=self.events.put, **params)
+            except OSError:
+                self.daemon = None  # The daemon went away; reconnect next time
+                raise
+
+    def decide_on_changes(self, changes_data):
+        """Ask the user about ``changes_data`` on the UI thread; returns paths to keep"""
+        done = threading.Event()
+        decisions = []
+
+        def ask():
+            dialog = FileDecisionDialog(self.root, changes_data)
+            self.root.wait_window(dialog.dialog)
+            decisions.append(dialog.result)
+            done.set()
+        self.on_ui_thread(ask)
+        done.wait()
+
+        if decisions[0] is None:
+            self.append_log("\nNo decisions made. Keeping all changes by default...")
+            return [path for paths in changes_data.values() for path in paths]
+        self.append_log("\nFile decisions saved. Processing changes...")
+        return decisions[0].keep_paths()
+
+    def run_start(self):
+        self.update_status("Starting session...")
+        self.append_log("=" * 60)
+        self.append_log("STARTING SECURE WORKSPACE SESSION")
+        self.append_log("=" * 60)
+        threading.Thread(target=self._start_session, args=(self.watch_var.get(),), daemon=True).start()
+
+    def run_stop(self):
+        self.update_status("Stopping session...")
+        self.append_log("\n" + "=" * 60)
+        self.append_log("STOPPING SECURE WORKSPACE SESSION")
+        self.append_log("=" * 60)
+        if self.session_timer:
+            self.root.after_cancel(self.session_timer)
+            self.session_timer = None
+            self.append_log("Session timer cancelled.")
+        threading.Thread(target=self._stop_session, daemon=True).start()
+
+    def _start_session(self, watch):
+        try:
+            result = self.call_daemon("start", watch=watch)
+        except (workspace_daemon.DaemonError, OSError) as e:
+            self.append_log(f"Error: {e}")
+            self.update_status("Idle")
+            return
+        if result is None:
+            self._run_and_log("start_session.py", "Session Started", ["--watch"] if watch else [])
+            return
+        self.append_log(f"Session started in {result['seconds']:.2f} seconds with {result['files']} files.")
+        self.update_status("Session Started")
+
+    def _stop_session(self):
+        try:
+            changes = self.call_daemon("detect")
+            if changes is None:
+                self._run_and_log("stop_session.py", "Session Stopped", ["--keep-from-stdin"])
+                return
+            keep = self.decide_on_changes(changes) if any(changes.values()) else []
+            outcome = self.call_daemon("stop", keep=keep, changes=changes)
+        except (workspace_daemon.DaemonError, OSError) as e:
+            self.append_log(f"Error: {e}")
+            self.update_status("Session Started")
+            return
+        self.append_log(f"Revert complete: {outcome['summary']}.")
+        self.update_status("Session Stopped")
+
+    def _run_and_log(self, script, done_status, args=()):
+        self.run_command(script, args)
+        self.update_status(done_status)
+
+    def set_timer(self):
+        minutes = simpledialog.askinteger("Session Timer", 
+                                        "Enter session duration in minutes:", 
+                                        minvalue=1, maxvalue=480)
+        if minutes:
+            if self.session_timer:
+                self.root.after_cancel(self.session_timer)
+            self.session_timer = self.root.after(minutes * 60 * 1000, self.auto_stop_session)
+            self.append_log(f"Session timer set for {minutes} minute(s)")
+
+    def auto_stop_session(self):
+        self.append_log("\n*** SESSION TIMER EXPIRED - AUTO STOPPING ***")
+        self.run_stop()
+
+    def on_closing(self):
+        if self.session_active:
+            if messagebox.askokcancel("Quit", "A session is active. Stop session before quitting?"):
+                self.run_stop()
+                # Give time for session to stop before closing
+                self.root.after(3000, self.root.destroy)
+            else:
+                return
+        else:
+            self.root.destroy()
+
+if __name__ == "__main__":
+    root = tk.Tk()
+    app = SecureWorkspaceUI(root)
+    root.protocol("WM_DELETE_WINDOW", app.on_closing)
+    root.mainloop()
@@ -0,0 +1,582 @@
+"""Backup storage helpers for SecureWorkspace.
+
+``FileCopier`` copies a file with the cheapest mechanism the filesystem
+offers: a ``FICLONE`` reflink (btrfs, xfs, ...), then ``os.copy_file_range``
+(in-kernel copy, no round trip through user space), then a plain buffered
+copy. Strategies that fail with "not supported" for a pair of devices are
+remembered so later files go straight to the next one.
+
+``ObjectStore`` keeps large files as fixed-size blocks, each stored once
+by digest, so a backup only writes the blocks no earlier backup holds and
+a restore only rewrites the blocks of the target that differ. Objects can
+be compressed (gzip-framed zlib or xz-framed lzma), which matters when the
+backup directory lives on a RAM-backed tmpfs.
+"""
+import errno
+import fcntl
+import gzip
+import hashlib
+import json
+import lzma
+import os
+import shutil
+import threading
+import time
+import zlib
+
+import disk_order
+
+FICLONE = 0x40049409  # _IOW(0x94, 9, int)
+
+STRATEGIES = ("reflink", "copy_file_range", "copy")
+
+INGEST_CHUNK_SIZE = 1024 * 1024
+
+# Object compression: the file suffix says how an object is encoded, so a
+# store can hold raw and compressed objects side by side
+COMPRESSIONS = ("zlib", "lzma")
+_SUFFIXES = {"zlib": ".gz", "lzma": ".xz"}
+_READERS = {"": open, ".gz": gzip.open, ".xz": lzma.open}
+_WRITERS = {
+    ".gz": lambda path: gzip.open(path, 'wb', compresslevel=6),
+    ".xz": lambda path: lzma.open(path, 'wb', preset=3),
+}
+
+# Entropy probe: data that zlib's fastest level can't shrink below this
+# ratio (archives, media, already compressed files) is stored raw
+COMPRESSION_PROBE_BYTES = 64 * 1024
+INCOMPRESSIBLE_RATIO = 0.9
+
+# errnos meaning "this strategy can't work here", as opposed to a real I/O error
+_UNSUPPORTED = {errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL,
+                errno.ENOSYS, errno.EBADF, errno.ETXTBSY}
+
+
+class FileCopier:
+    """Copy files with reflink -> copy_file_range -> plain copy fallback"""
+
+    def __init__(self, strategy="auto"):
+        if strategy != "auto" and strategy not in STRATEGIES:
+            raise ValueError(f"Unknown copy strategy: {strategy}")
+        self.strategies = STRATEGIES if strategy == "auto" else STRATEGIES[STRATEGIES.index(strategy):]
+        self.counts = {name: 0 for name in STRATEGIES}
+        self.bytes_copied = 0  # Data actually written
+        self.bytes_cloned = 0  # Data shared through reflinks
+        self._unsupported = set()  # (strategy, src_dev, dst_dev)
+        self._lock = threading.Lock()
+
+    def copy(self, src, dst):
+        """Copy ``src`` to ``dst`` with metadata and return the strategy used"""
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            src_dev = os.fstat(fsrc.fileno()).st_dev
+            dst_dev = os.fstat(fdst.fileno()).st_dev
+            size = os.fstat(fsrc.fileno()).st_size
+            for strategy in self.strategies:
+                if (strategy, src_dev, dst_dev) in self._unsupported:
+                    continue
+                try:
+                    getattr(self, f"_{strategy}")(fsrc, fdst, size)
+                except OSError as e:
+                    if strategy == "copy" or e.errno not in _UNSUPPORTED:
+                        raise
+                    with self._lock:
+                        self._unsupported.add((strategy, src_dev, dst_dev))
+                    # Start over from a clean destination for the next strategy
+                    fsrc.seek(0)
+                    fdst.seek(0)
+                    fdst.truncate()
+                    continue
+                break
+        shutil.copystat(src, dst)
+        with self._lock:
+            self.counts[strategy] += 1
+            if strategy == "reflink":
+                self.bytes_cloned += size
+            else:
+                self.bytes_copied += size
+        return strategy
+
+    def clone(self, src, dst):
+        """Reflink ``src`` to ``dst``; False where the filesystem can't"""
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            try:
+                self._reflink(fsrc, fdst, 0)
+            except OSError as e:
+                if e.errno not in _UNSUPPORTED:
+                    raise
+                return False
+        return True
+
+    def _reflink(self, fsrc, fdst, size):
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+
+    def _copy_file_range(self, fsrc, fdst, size):
+        if not hasattr(os, "copy_file_range"):
+            raise OSError(errno.ENOSYS, "copy_file_range unavailable")
+        remaining = size
+        while remaining > 0:
+            copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), min(remaining, 1 << 30))
+            if copied == 0:
+                # Some filesystems report 0 instead of failing, and the file
+                # may have shrunk: either way let plain copying redo the file
+                raise OSError(errno.EINVAL, f"copy_file_range stopped {remaining} bytes short")
+            remaining -= copied
+
+    def _copy(self, fsrc, fdst, size):
+        shutil.copyfileobj(fsrc, fdst, 1024 * 1024)
+
+    def summary(self):
+        used = ", ".join(f"{name}: {count}" for name, count in self.counts.items() if count)
+        return (f"strategies used ({used or 'none'}); "
+                f"{format_bytes(self.bytes_copied)} copied, "
+                f"{format_bytes(self.bytes_cloned)} shared via reflink")
+
+
+def temp_path_beside(target):
+    """Hidden temp name in ``target``'s directory, so os.replace is atomic"""
+    target = os.fspath(target)
+    head, name = os.path.split(target)
+    return os.path.join(head, f".{name}.sw-restore-{threading.get_ident()}")
+
+
+def replace_atomically(target, write):
+    """Call ``write(tmp)`` and move the result over ``target`` in one rename
+
+    ``target`` is either left untouched or fully replaced; the temp file is
+    removed if ``write`` fails.
+    """
+    tmp = temp_path_beside(target)
+    try:
+        result = write(tmp)
+        os.replace(tmp, target)
+    except BaseException:
+        if os.path.lexists(tmp):
+            os.unlink(tmp)
+        raise
+    return result
+
+
+def replace_durably(target, write):
+    """``replace_atomically``, with the new file and the rename fsynced
+
+    After a crash or power loss ``target`` holds either its old contents
+    or all of the new ones, never a truncated file.
+    """
+    def write_synced(tmp):
+        result = write(tmp)
+        _fsync_path(tmp)
+        return result
+    result = replace_atomically(target, write_synced)
+    try:
+        _fsync_path(os.path.dirname(os.fspath(target)) or ".")  # Persist the rename
+    except OSError:
+        pass  # Some filesystems can't fsync a directory
+    return result
+
+
+def _fsync_path(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def format_bytes(count):
+    for unit in ("B", "KB", "MB", "GB"):
+        if count < 1024 or unit == "GB":
+            return f"{count:.1f} {unit}" if unit != "B" else f"{count} B"
+        count /= 1024
+
+
+class ObjectStore:
+    """Content-addressed backup store with a path -> digest manifest
+
+    Each unique file body is kept once under ``objects/<d[:2]>/<d[2:]>``
+    (a git-style fan-out keeps directories small). The manifest records,
+    per workspace path, the digest plus the mode and timestamps that the
+    shared object cannot carry for every path pointing at it.
+    """
+
+    MANIFEST_VERSION = 1
+
+    def __init__(self, backup_dir, copier=None, compression=None, cache_hints=False):
+        if compression is not None and compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression: {compression}")
+        self.compression = compression
+        self.cache_hints = cache_hints  # fadvise source reads, drop their pages after
+        self.root = os.path.join(backup_dir, "objects")
+        self.manifest_file = os.path.join(backup_dir, "manifest.json")
+        self.copier = copier or FileCopier()
+        # rel_path -> {"digest", "size", "mode", "atime_ns", "mtime_ns"}, plus
+        # "blocks" and "block_size" for files stored as blocks
+        self.manifest = {}
+        self.objects_stored = 0
+        self.bytes_stored = 0  # On disk, after compression
+        self.bytes_original = 0  # Uncompressed size of the objects stored
+        self.bytes_compressed = 0  # Input to the compressor
+        self.compress_seconds = 0.0  # Summed over threads
+        self.stored_raw = 0  # Objects the entropy probe kept uncompressed
+        self.bytes_read = 0  # Source bytes read by single-pass ingest
+        self.duplicates = 0
+        self.bytes_deduplicated = 0
+        self._lock = threading.Lock()
+
+    def object_path(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:])
+
+    def stored_path(self, digest):
+        """Path of the object for ``digest`` in whatever encoding, or None"""
+        base = self.object_path(digest)
+        for suffix in _READERS:
+            if os.path.exists(base + suffix):
+                return base + suffix
+        return None
+
+    def has(self, digest):
+        return self.stored_path(digest) is not None
+
+    def open_object(self, digest):
+        """Readable stream of an object's original bytes, decompressing as it goes"""
+        path = self.stored_path(digest)
+        if path is None:
+            raise FileNotFoundError(f"No object {digest}")
+        suffix = next((suffix for suffix in _WRITERS if path.endswith(suffix)), "")
+        return _READERS[suffix](path, 'rb')
+
+    def add_file(self, rel_path, src, digest, hash_file):
+        """Store ``src`` unless an identical object exists; returns its digest
+
+        ``digest`` is the snapshot hash, or None when it can't be trusted
+        for the file's current contents. Untrusted copies, and files that
+        change while being copied, are hashed with ``hash_file`` after the
+        copy so an object's name always matches what it holds.
+        """
+        st = os.stat(src)
+        if digest is not None and self.has(digest):
+            self._count_duplicate(st.st_size)
+        else:
+            tmp = self._incoming_path()
+            self.copier.copy(src, tmp)
+            after = os.stat(src)
+            if digest is None or (after.st_size, after.st_mtime_ns, after.st_ctime_ns) != \
+                    (st.st_size, st.st_mtime_ns, st.st_ctime_ns):
+                digest = hash_file(tmp)
+                if digest is None:
+                    os.unlink(tmp)
+                    raise OSError(f"Could not hash backup copy of {rel_path}")
+            self._commit(tmp, digest, st.st_size)
+        self._record(rel_path, digest, st)
+        return digest
+
+    def ingest(self, rel_path, src):
+        """Hash and store ``src`` with a single read
+
+        Every chunk goes to the hasher and the object file together, so the
+        digest always describes exactly the bytes that were stored. Returns
+        ``(digest, stat)`` with the stat taken before reading.
+        """
+        tmp = self._incoming_path()
+        hasher = hashlib.md5()
+        try:
+            with open(src, 'rb') as fsrc, open(tmp, 'wb') as fdst:
+                st = os.fstat(fsrc.fileno())
+                if self.cache_hints:
+                    disk_order.advise_sequential(fsrc.fileno(), st.st_size)
+                while chunk := fsrc.read(INGEST_CHUNK_SIZE):
+                    hasher.update(chunk)
+                    fdst.write(chunk)
+                if self.cache_hints:
+                    disk_order.advise_done(fsrc.fileno())
+        except OSError:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        digest = hasher.hexdigest()
+        with self._lock:
+            self.bytes_read += st.st_size
+        self._commit(tmp, digest, st.st_size)
+        self._record(rel_path, digest, st)
+        return digest, st
+
+    def add_blocks(self, rel_path, src, block_size, make_digest, map_blocks=map):
+        """Store ``src`` as ``block_size`` blocks; returns the file's digest
+
+        Every block is read and hashed, but only blocks missing from the
+        store are written, so backing up a large file that changed in a few
+        places costs a read plus a few block writes. ``make_digest(size,
+        raw_block_digests)`` names the whole file and ``map_blocks`` (e.g. an
+        executor's ``map``) may process blocks in parallel.
+        """
+        with open(src, 'rb') as f:
+            st = os.fstat(f.fileno())
+            fd = f.fileno()
+            written = []
+            if self.cache_hints:
+                disk_order.advise_sequential(fd, st.st_size)
+
+            def store_block(offset):
+                data = os.pread(fd, block_size, offset)
+                if self.cache_hints:
+                    disk_order.advise_done(fd, offset, block_size)
+                block = hashlib.md5(data).hexdigest()
+                if self.has(block):
+                    with self._lock:
+                        self.bytes_deduplicated += len(data)
+                else:
+                    self._write_object(block, data)
+                    written.append(block)
+                return block
+
+            blocks = list(map_blocks(store_block, range(0, st.st_size, block_size)))
+        with self._lock:
+            self.bytes_read += st.st_size
+            if not written:
+                self.duplicates += 1  # Every block was already stored
+        digest = make_digest(st.st_size, b"".join(bytes.fromhex(block) for block in blocks))
+        self._record(rel_path, digest, st, blocks=blocks, block_size=block_size)
+        return digest
+
+    def _write_object(self, digest, data):
+        dst = self.object_path(digest)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        tmp = f"{dst}.incoming-{threading.get_ident()}"
+        encoded, suffix = self._compress_bytes(data)
+        with open(tmp, 'wb') as f:
+            f.write(encoded)
+        os.replace(tmp, dst + suffix)
+        with self._lock:
+            self.objects_stored += 1
+            self.bytes_stored += len(encoded)
+            self.bytes_original += len(data)
+
+    def record(self, rel_path, digest, st):
+        """Point ``rel_path`` at an object that is already stored"""
+        self._count_duplicate(st.st_size)
+        self._record(rel_path, digest, st)
+
+    def record_blocks(self, rel_path, digest, tree, block_size, st):
+        """Point ``rel_path`` at stored blocks; False if any block is missing"""
+        blocks = [block.hex() for block in tree]
+        if not all(self.has(block) for block in blocks):
+            return False
+        self._count_duplicate(st.st_size)
+        self._record(rel_path, digest, st, blocks=blocks, block_size=block_size)
+        return True
+
+    def _incoming_path(self):
+        os.makedirs(self.root, exist_ok=True)
+        return os.path.join(self.root, f"incoming-{threading.get_ident()}")
+
+    def _commit(self, tmp, digest, size):
+        """Move a finished temp copy into place, or drop it if it's a duplicate"""
+        if self.has(digest):
+            os.unlink(tmp)
+            self._count_duplicate(size)
+            return
+        dst = self.object_path(digest)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        tmp, suffix = self._compress_file(tmp, size)
+        stored = os.path.getsize(tmp)
+        os.replace(tmp, dst + suffix)
+        with self._lock:
+            self.objects_stored += 1
+            self.bytes_stored += stored
+            self.bytes_original += size
+
+    def _worth_compressing(self, sample):
+        if self.compression is None or not sample:
+            return False
+        if len(zlib.compress(sample, 1)) <= len(sample) * INCOMPRESSIBLE_RATIO:
+            return True
+        with self._lock:
+            self.stored_raw += 1
+        return False
+
+    def _compress_file(self, tmp, size):
+        """Compress a raw temp copy; returns the file to commit and its suffix"""
+        with open(tmp, 'rb') as f:
+            sample = f.read(COMPRESSION_PROBE_BYTES)
+        if not self._worth_compressing(sample):
+            return tmp, ""
+        suffix = _SUFFIXES[self.compression]
+        start = time.perf_counter()
+        try:
+            with open(tmp, 'rb') as fsrc, _WRITERS[suffix](tmp + suffix) as fdst:
+                shutil.copyfileobj(fsrc, fdst, INGEST_CHUNK_SIZE)
+        except BaseException:
+            if os.path.exists(tmp + suffix):
+                os.unlink(tmp + suffix)
+            raise
+        finally:
+            os.unlink(tmp)
+        self._count_compression(size, time.perf_counter() - start)
+        return tmp + suffix, suffix
+
+    def _compress_bytes(self, data):
+        if not self._worth_compressing(data[:COMPRESSION_PROBE_BYTES]):
+            return data, ""
+        start = time.perf_counter()
+        if self.compression == "zlib":
+            encoded = gzip.compress(data, compresslevel=6, mtime=0)
+        else:
+            encoded = lzma.compress(data, preset=3)
+        self._count_compression(len(data), time.perf_counter() - start)
+        return encoded, _SUFFIXES[self.compression]
+
+    def _count_compression(self, size, seconds):
+        with self._lock:
+            self.bytes_compressed += size
+            self.compress_seconds += seconds
+
+    def _count_duplicate(self, size):
+        with self._lock:
+            self.duplicates += 1
+            self.bytes_deduplicated += size
+
+    def _record(self, rel_path, digest, st, **extra):
+        with self._lock:
+            self.manifest[rel_path] = {
+                "digest": digest,
+                "size": st.st_size,
+                "mode": st.st_mode & 0o7777,
+                "atime_ns": st.st_atime_ns,
+                "mtime_ns": st.st_mtime_ns,
+                **extra,
+            }
+
+    def save_manifest(self):
+        def write(tmp):
+            with open(tmp, 'w') as f:
+                json.dump({"version": self.MANIFEST_VERSION, "files": self.manifest}, f)
+        replace_durably(self.manifest_file, write)
+
+    def load_manifest(self):
+        """Load the manifest; returns False if there is none"""
+        try:
+            with open(self.manifest_file, 'r') as f:
+                data = json.load(f)
+            self.manifest = data["files"] if data.get("version") == self.MANIFEST_VERSION else {}
+        except (OSError, ValueError, KeyError):
+            self.manifest = {}
+        return bool(self.manifest)
+
+    def restore(self, rel_path, target):
+        """Replace ``target`` with the backup of ``rel_path``; False if not stored
+
+        The file is written under a temp name and renamed over ``target``,
+        so an interrupted restore never leaves it half-written.
+        """
+        entry = self.manifest.get(rel_path)
+        if not entry:
+            return False
+        if "blocks" in entry:
+            if not all(self.has(block) for block in entry["blocks"]):
+                return False
+            replace_atomically(target, lambda tmp: self.restore_blocks(rel_path, tmp, None))
+            return True
+        if not self.has(entry["digest"]):
+            return False
+
+        def write(tmp):
+            path = self.stored_path(entry["digest"])
+            if path == self.object_path(entry["digest"]):
+                self.copier.copy(path, tmp)
+            else:
+                # Decompress in a stream, never holding the whole file
+                with self.open_object(entry["digest"]) as fsrc, open(tmp, 'wb') as fdst:
+                    shutil.copyfileobj(fsrc, fdst, INGEST_CHUNK_SIZE)
+            self._apply_metadata(entry, tmp)
+        replace_atomically(target, write)
+        return True
+
+    def block_digests(self, rel_path):
+        """Raw per-block digests of a file stored as blocks, or None"""
+        entry = self.manifest.get(rel_path)
+        if not entry or "blocks" not in entry:
+            return None
+        return [bytes.fromhex(block) for block in entry["blocks"]]
+
+    def restore_blocks(self, rel_path, target, current, tree=None, block_size=None):
+        """Rewrite only the blocks of ``target`` that differ from the backup
+
+        ``current`` holds the raw digests of the target's blocks as it is
+        now (None when it is missing or unreadable). ``tree`` and
+        ``block_size`` describe a whole-file object by the chunk digests
+        taken at snapshot time; files stored as blocks carry their own.
+        The target is patched in place; callers wanting an atomic restore
+        patch a clone or copy and rename it. Returns the number of bytes written.
+        """
+        entry = self.manifest[rel_path]
+        source = None
+        if "blocks" in entry:
+            tree, block_size, size = self.block_digests(rel_path), entry["block_size"], entry["size"]
+        else:
+            source = self.open_object(entry["digest"])
+            # Manifests from before sizes were recorded only have raw objects
+            size = entry["size"] if "size" in entry else os.path.getsize(self.object_path(entry["digest"]))
+        written = 0
+        try:
+            fd = os.open(target, os.O_WRONLY | os.O_CREAT, entry["mode"])
+            try:
+                for index, wanted in enumerate(tree):
+                    if current is not None and index < len(current) and current[index] == wanted:
+                        continue
+                    offset = index * block_size
+                    if source is None:
+                        with self.open_object(wanted.hex()) as f:
+                            data = f.read()
+                    else:
+                        # Forward seeks on compressed objects decompress and discard
+                        source.seek(offset)
+                        data = source.read(block_size)
+                    os.pwrite(fd, data, offset)
+                    written += len(data)
+                os.ftruncate(fd, size)
+            finally:
+                os.close(fd)
+        finally:
+            if source is not None:
+                source.close()
+        self._apply_metadata(entry, target)
+        return written
+
+    def _apply_metadata(self, entry, target):
+        os.chmod(target, entry["mode"])
+        os.utime(target, ns=(entry["atime_ns"], entry["mtime_ns"]))
+
+    def prune(self):
+        """Delete objects no manifest entry points at (e.g. from old sessions)"""
+        referenced = set()
+        for entry in self.manifest.values():
+            referenced.update(entry.get("blocks", (entry["digest"],)))
+        removed = 0
+        if not os.path.isdir(self.root):
+            return 0
+        for fanout in os.scandir(self.root):
+            if not fanout.is_dir():
+                os.unlink(fanout.path)  # Leftover incoming-* temp file
+                continue
+            for obj in os.scandir(fanout.path):
+                # Leftover block temp files never match a digest either
+                name = obj.name
+                for suffix in _WRITERS:
+                    name = name.removesuffix(suffix)
+                if fanout.name + name not in referenced:
+                    os.unlink(obj.path)
+                    removed += 1
+        return removed
+
+    def summary(self):
+        text = (f"{self.objects_stored} unique objects stored ({format_bytes(self.bytes_stored)}), "
+                f"{self.duplicates} files already stored ({format_bytes(self.bytes_deduplicated)} not rewritten)")
+        if self.compression is not None:
+            text += f"; {self.compression}: {self.compression_summary()}"
+        return text
+
+    def compression_summary(self):
+        saved = self.bytes_original - self.bytes_stored
+        rate = self.bytes_compressed / self.compress_seconds if self.compress_seconds else 0
+        return (f"{format_bytes(self.bytes_original)} stored as {format_bytes(self.bytes_stored)} "
+                f"({format_bytes(saved)} saved), compressing at {format_bytes(rate)}/s per thread, "
+                f"{self.stored_raw} incompressible objects kept raw")
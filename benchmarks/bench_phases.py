@@ -0,0 +1,293 @@
+"""Phase benchmark: scan, backup, detect and restore on a synthetic workspace.
+
+Generates a reproducible workspace (``synthetic.make_workspace``: file
+count, depth, size distribution, duplicate ratio), then runs a session
+against it: ``scan_directory_fast``, ``backup_files``, a change to
+``--changed`` of the files, ``detect_changes`` and the restore that undoes
+it. The restore puts the tree back as it was, so the session runs once
+with a cold page cache and once with a warm one on the same files.
+
+For each phase it reports seconds, files/s, MB/s and the peak RSS during
+the phase, and writes everything as JSON (``--output``). Pass an earlier
+JSON file as ``--compare`` to see how this version does against it.
+
+Cold runs drop the page cache through /proc/sys/vm/drop_caches when
+running as root, and otherwise evict the workspace and backup files one by
+one with posix_fadvise (directory and inode caches then stay warm); the
+JSON records which.
+
+    python benchmarks/bench_phases.py [--files 10000] [--sizes mixed] [--changed 0.05] \\
+        [--output bench_phases.json] [--compare old.json]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from secure_workspace import RACY_MTIME_WINDOW_NS, SecureWorkspace  # noqa: E402
+from synthetic import SIZE_DISTRIBUTIONS, change_workspace, make_workspace  # noqa: E402
+
+RESULTS_VERSION = 1
+
+
+def drop_page_cache(paths):
+    """Evict ``paths`` from the page cache; returns the method used"""
+    os.sync()
+    try:
+        with open("/proc/sys/vm/drop_caches", "w") as f:
+            f.write("3\n")
+        return "drop_caches"
+    except OSError:
+        pass
+    if not hasattr(os, "posix_fadvise"):
+        return "none"
+    for top in paths:
+        for dirpath, _, names in os.walk(top):
+            for name in names:
+                try:
+                    fd = os.open(os.path.join(dirpath, name), os.O_RDONLY)
+                except OSError:
+                    continue
+                try:
+                    os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+                finally:
+                    os.close(fd)
+    return "fadvise"
+
+
+def warm_page_cache(paths):
+    """Read every file under ``paths`` once"""
+    for top in paths:
+        for dirpath, _, names in os.walk(top):
+            for name in names:
+                try:
+                    with open(os.path.join(dirpath, name), "rb") as f:
+                        while f.read(1024 * 1024):
+                            pass
+                except OSError:
+                    continue
+
+
+def reset_peak_rss():
+    """Start a new RSS high-water mark (Linux); False if not supported"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_bytes():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # Whole-process peak; kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def io_counters():
+    """Bytes this process read and wrote through syscalls, where known"""
+    try:
+        with open("/proc/self/io") as f:
+            fields = dict(line.split(": ") for line in f.read().splitlines())
+        return int(fields["rchar"]), int(fields["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def measure(phase, func, files, size, verbose=False):
+    """Run ``func`` and time it; ``files``/``size`` are what the phase covers"""
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    reset_peak_rss()
+    io_before = io_counters()
+    with output:
+        start = time.perf_counter()
+        result = func()
+        seconds = time.perf_counter() - start
+    io_after = io_counters()
+    stats = {
+        "seconds": round(seconds, 4),
+        "files": files,
+        "bytes": size,
+        "files_per_sec": round(files / seconds, 1) if seconds else None,
+        "mb_per_sec": round(size / (1024 * 1024) / seconds, 2) if seconds else None,
+        "peak_rss_mb": round(peak_rss_bytes() / (1024 * 1024), 1),
+    }
+    if io_before and io_after:
+        stats["read_mb"] = round((io_after[0] - io_before[0]) / (1024 * 1024), 1)
+        stats["written_mb"] = round((io_after[1] - io_before[1]) / (1024 * 1024), 1)
+    print(f"  {phase:<8} {seconds:8.3f}s  {stats['files_per_sec'] or 0:>10.0f} files/s  "
+          f"{stats['mb_per_sec'] or 0:>8.1f} MB/s  peak RSS {stats['peak_rss_mb']:7.1f} MB")
+    return result, stats
+
+
+def wait_out_racy_window():
+    """Let fresh mtimes age, or every file would look racy and be rehashed"""
+    time.sleep(RACY_MTIME_WINDOW_NS / 1e9 + 0.1)
+
+
+def run_session(args, home, backup_dir, cache, files, size):
+    """One scan/backup/detect/restore cycle; returns ({phase: stats}, cache method)"""
+    shutil.rmtree(backup_dir, ignore_errors=True)
+    sw = SecureWorkspace(home_dir=home, backup_dir=backup_dir, max_depth=args.depth, use_index=False,
+                         max_workers=args.workers, walk_workers=args.walk_workers,
+                         compression=args.compress)
+    method = "warm"
+
+    def prepare(paths):
+        nonlocal method
+        if cache == "cold":
+            method = drop_page_cache(paths)
+        else:
+            warm_page_cache(paths)
+
+    results = {}
+    prepare([home])
+    (hashes, snapshot_stats), results["scan"] = measure(
+        "scan", sw.scan_directory_fast, files, size, args.verbose)
+    sw.snapshot, sw.snapshot_stats = hashes, snapshot_stats
+
+    prepare([home])
+    _, results["backup"] = measure("backup", sw.backup_files, files, size, args.verbose)
+
+    changes = change_workspace(home, args.changed, args.sizes, seed=args.seed + 1)
+    wait_out_racy_window()
+    prepare([home])
+    # A stat per file, plus reading whatever changed
+    read = sum(os.path.getsize(os.path.join(home, path)) for path in changes["added"] + changes["modified"])
+    (added, modified, deleted), results["detect"] = measure(
+        "detect", sw.detect_changes, files, read, args.verbose)
+    for kind, found in (("added", added), ("modified", modified), ("deleted", deleted)):
+        if sorted(found) != sorted(changes[kind]):
+            print(f"  Warning: detect_changes found {len(found)} {kind} files, expected {len(changes[kind])}")
+
+    prepare([home, backup_dir])
+    restored = modified + deleted
+    restored_size = sum(max(0, snapshot_stats[path][0]) for path in restored)
+    outcome, results["restore"] = measure(
+        "restore", lambda: sw.revert_changes(added, modified, deleted), len(added) + len(restored),
+        restored_size, args.verbose)
+    failed = [result for result in outcome if result.status == "failed"]
+    if failed:
+        print(f"  Warning: {len(failed)} restores failed, e.g. {failed[0].path}: {failed[0].detail}")
+    wait_out_racy_window()
+    return results, method
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).resolve().parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, previous_path):
+    with open(previous_path) as f:
+        previous = json.load(f)
+    print(f"\nCompared with {previous_path} ({previous.get('revision') or 'unknown revision'}):")
+    if previous.get("config") != current["config"]:
+        print("  Note: the runs used different settings; see \"config\" in both files.")
+    for cache, phases in current["results"].items():
+        for phase, stats in phases.items():
+            old = previous.get("results", {}).get(cache, {}).get(phase)
+            if not old or not old.get("seconds"):
+                continue
+            ratio = stats["seconds"] / old["seconds"]
+            verdict = "slower" if ratio > 1.1 else "faster" if ratio < 0.9 else "same"
+            print(f"  {cache:<5} {phase:<8} {old['seconds']:8.3f}s -> {stats['seconds']:8.3f}s  "
+                  f"({ratio:5.2f}x time, {verdict})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=10000)
+    parser.add_argument("--depth", type=int, default=3, help="directory levels below the workspace root")
+    parser.add_argument("--files-per-dir", type=int, default=50)
+    parser.add_argument("--sizes", default="mixed", choices=sorted(SIZE_DISTRIBUTIONS),
+                        help="file size distribution (see benchmarks/synthetic.py)")
+    parser.add_argument("--duplicates", type=float, default=0.1,
+                        help="fraction of files repeating another file's content")
+    parser.add_argument("--changed", type=float, default=0.05,
+                        help="fraction of files modified, deleted or added before detect")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cache", default="cold,warm",
+                        help="comma-separated page cache states to run: cold, warm")
+    parser.add_argument("--workers", type=int, help="hashing threads (default: sized as usual)")
+    parser.add_argument("--walk-workers", type=int, help="directory listing threads (default: as usual)")
+    parser.add_argument("--compress", choices=["zlib", "lzma"], help="compress backup objects")
+    parser.add_argument("--root", help="where to create the workspace (default: the temp dir); "
+                                       "use the filesystem you want to measure")
+    parser.add_argument("--output", default="bench_phases.json", help="JSON results file")
+    parser.add_argument("--compare", metavar="JSON", help="results of an earlier run to compare with")
+    parser.add_argument("--keep", action="store_true", help="keep the generated workspace")
+    parser.add_argument("--verbose", action="store_true", help="show the workspace's own output")
+    args = parser.parse_args()
+    caches = [cache.strip() for cache in args.cache.split(",") if cache.strip()]
+    if not caches or set(caches) - {"cold", "warm"}:
+        parser.error("--cache takes cold, warm or both")
+
+    work = Path(tempfile.mkdtemp(prefix="sw-bench-", dir=args.root))
+    home, backup_dir = work / "workspace", work / "backup"
+    try:
+        print(f"Generating {args.files} files ({args.sizes} sizes, {args.duplicates:.0%} duplicates) "
+              f"in {home}...")
+        files, size = make_workspace(home, args.files, args.depth, args.files_per_dir, args.sizes,
+                                     args.duplicates, args.seed)
+        print(f"Workspace: {files} files, {size / (1024 * 1024):.1f} MB")
+        wait_out_racy_window()
+
+        current = {
+            "version": RESULTS_VERSION,
+            "revision": git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "config": {
+                "files": args.files, "depth": args.depth, "files_per_dir": args.files_per_dir,
+                "sizes": args.sizes, "duplicates": args.duplicates, "changed": args.changed,
+                "seed": args.seed, "workers": args.workers, "walk_workers": args.walk_workers,
+                "compress": args.compress,
+            },
+            "workspace": {"files": files, "bytes": size},
+            "cache_methods": {},
+            "results": {},
+        }
+        for cache in caches:
+            print(f"\n{cache.capitalize()} page cache:")
+            results, method = run_session(args, home, backup_dir, cache, files, size)
+            current["results"][cache] = results
+            current["cache_methods"][cache] = method
+
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+        print(f"\nResults saved to {args.output}")
+        if args.compare:
+            compare(current, args.compare)
+    finally:
+        if args.keep:
+            print(f"Workspace kept in {work}")
+        else:
+            shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
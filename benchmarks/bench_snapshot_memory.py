@@ -0,0 +1,120 @@
+"""Memory benchmark for in-memory snapshot representations.
+
+Builds the same synthetic snapshot (paths laid out like ``synthetic.py``
+trees, random MD5 digests, stat signatures) as the plain dicts snapshots
+used to be and as a ``CompactSnapshot``, and reports the heap each one
+holds (via tracemalloc) plus lookup throughput. A mapped ``BinarySnapshot``
+of the same data is listed for reference: its entries live in the page
+cache, not on the Python heap.
+
+    python benchmarks/bench_snapshot_memory.py [--files 500000]
+"""
+import argparse
+import gc
+import hashlib
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import snapshot_format  # noqa: E402
+from compact_snapshot import CompactSnapshot  # noqa: E402
+
+
+def synthetic_entries(files, files_per_dir=50, fanout=20, seed=0):
+    """Yield (path, hex digest, signature) for ``files`` entries"""
+    rng = random.Random(seed)
+    written = 0
+    depth = 1
+    while written < files:
+        for index in range(fanout ** depth):
+            parts, rest = [], index
+            for _ in range(depth):
+                parts.append(f"d{rest % fanout:02d}")
+                rest //= fanout
+            directory = "projects/" + "/".join(reversed(parts))
+            for i in range(min(files_per_dir, files - written)):
+                path = f"{directory}/file_{i:03d}.txt"
+                digest = hashlib.md5(path.encode()).hexdigest()
+                signature = (rng.randint(1, 1 << 20), 1700000000000000000 + written,
+                             1000000 + written, 1700000000000000000 + written)
+                yield path, digest, signature
+                written += 1
+            if written >= files:
+                return
+        depth += 1
+
+
+def build_dicts(files):
+    hashes, stats = {}, {}
+    for path, digest, signature in synthetic_entries(files):
+        hashes[path] = digest
+        stats[path] = signature
+    return hashes, stats
+
+
+def build_compact(files):
+    snapshot = CompactSnapshot()
+    for path, digest, signature in synthetic_entries(files):
+        snapshot[path] = digest
+        snapshot.stats[path] = signature
+    return snapshot, snapshot.stats
+
+
+def write_binary(files, path):
+    hashes, stats = build_compact(files)
+    snapshot_format.write_snapshot(path, hashes, stats)
+
+
+def open_binary(path):
+    snapshot = snapshot_format.BinarySnapshot(path)
+    return snapshot, snapshot.stats
+
+
+def measure(label, build, files, probes):
+    tracemalloc.start()
+    start = time.perf_counter()
+    hashes, stats = build()
+    elapsed = time.perf_counter() - start
+    gc.collect()  # Count only what the snapshot keeps alive
+    heap = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for path in probes:
+        hashes[path]
+        stats[path]
+    lookups = len(probes) / (time.perf_counter() - start)
+    print(f"{label:<22} {heap / (1024 * 1024):9.1f} MB  {heap / files:7.0f} B/file  "
+          f"build {elapsed:6.2f}s  {lookups:>10.0f} lookups/s")
+    return heap
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=500000)
+    parser.add_argument("--probes", type=int, default=100000, help="random lookups to time")
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    paths = [path for path, _, _ in synthetic_entries(args.files)]
+    probes = [rng.choice(paths) for _ in range(args.probes)]
+    del paths
+
+    print(f"Snapshot of {args.files} files:")
+    before = measure("dict + dict of tuples", lambda: build_dicts(args.files), args.files, probes)
+    after = measure("CompactSnapshot", lambda: build_compact(args.files), args.files, probes)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "snapshot.bin")
+        write_binary(args.files, path)  # Outside the measurement: only the mapping counts
+        measure("BinarySnapshot (mmap)", lambda: open_binary(path), args.files, probes)
+    print(f"CompactSnapshot uses {before / after:.1f}x less memory than the dicts.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Synthetic workspace generator shared by the benchmark scripts."""
+import math
+import os
+import random
+import struct
+from pathlib import Path
+
+KB, MB = 1024, 1024 * 1024
+
+
+def _mixed_size(rng):
+    """Mostly small source-like files, some medium ones, a few large ones"""
+    roll = rng.random()
+    if roll < 0.85:
+        return rng.randint(1, 16 * KB)
+    if roll < 0.995:
+        return rng.randint(16 * KB, 512 * KB)
+    return rng.randint(MB, 8 * MB)
+
+
+# File size distributions for make_workspace: rng -> size in bytes
+SIZE_DISTRIBUTIONS = {
+    "small": lambda rng: rng.randint(1, 4 * KB),
+    "mixed": _mixed_size,
+    "large": lambda rng: rng.randint(1, 16) * MB,
+}
+
+
+def make_tree(root, files=200000, files_per_dir=50, fanout=20, depth=3,
+              size=512, excluded_ratio=0.05, seed=0):
+    """Create ``files`` small files spread over a ``fanout``-ary tree
+
+    Directories are filled breadth-first down to ``depth`` levels below
+    ``root``. About ``excluded_ratio`` of the files land in paths the
+    default exclusion rules should skip (``node_modules``, ``.git``,
+    ``*.swp``) so the matcher does real work. Returns the number of files
+    written. An existing tree with a matching marker is reused.
+    """
+    root = Path(root)
+    marker = root / f".synthetic-{files}-{files_per_dir}-{fanout}-{depth}-{size}-{seed}"
+    if marker.exists():
+        return files
+    rng = random.Random(seed)
+    payload = os.urandom(size)
+
+    dirs = []
+    level = [root]
+    for _ in range(depth):
+        level = [parent / f"d{i:02d}" for parent in level for i in range(fanout)]
+        dirs.extend(level)
+        if len(dirs) * files_per_dir >= files:
+            break
+
+    written = 0
+    for dir_path in dirs:
+        if written >= files:
+            break
+        roll = rng.random()
+        if roll < excluded_ratio / 2:
+            dir_path = dir_path / "node_modules"
+        elif roll < excluded_ratio:
+            dir_path = dir_path / ".git"
+        dir_path.mkdir(parents=True, exist_ok=True)
+        for i in range(min(files_per_dir, files - written)):
+            name = f"f{i:03d}.swp" if rng.random() < excluded_ratio / 4 else f"f{i:03d}.txt"
+            with open(dir_path / name, "wb") as f:
+                f.write(payload[:rng.randint(1, size)])
+            written += 1
+    marker.touch()
+    return written
+
+
+def make_workspace(root, files=20000, depth=3, files_per_dir=50, sizes="mixed",
+                   duplicate_ratio=0.1, seed=0):
+    """Create ``files`` files in directories exactly ``depth`` levels down
+
+    The fanout is whatever spreads ``files_per_dir`` files per directory
+    over that depth. Sizes follow ``SIZE_DISTRIBUTIONS[sizes]``; about
+    ``duplicate_ratio`` of the files repeat an earlier file's content, so
+    the backup store's deduplication has work to do. The same arguments
+    always produce the same tree. Returns ``(files, total bytes)``.
+    """
+    root = Path(root)
+    rng = random.Random(seed)
+    size_of = SIZE_DISTRIBUTIONS[sizes]
+    block = random.Random(seed).randbytes(17 * MB)  # Contents are slices of it
+    leaves = max(1, math.ceil(files / files_per_dir))
+    fanout = max(1, math.ceil(leaves ** (1 / depth))) if depth else 1
+
+    recipes = []  # (unique id, offset, size) of every distinct content
+    written = total = 0
+    for leaf in range(leaves):
+        parts, rest = [], leaf
+        for _ in range(depth):
+            parts.append(f"d{rest % fanout:03d}")
+            rest //= fanout
+        dir_path = root.joinpath(*reversed(parts))
+        dir_path.mkdir(parents=True, exist_ok=True)
+        for i in range(min(files_per_dir, files - written)):
+            if recipes and rng.random() < duplicate_ratio:
+                recipe = rng.choice(recipes)
+            else:
+                size = size_of(rng)
+                recipe = (len(recipes), rng.randint(0, len(block) - size), size)
+                recipes.append(recipe)
+            total += _write_content(dir_path / f"f{i:03d}.dat", block, recipe)
+            written += 1
+    return written, total
+
+
+def _write_content(path, block, recipe):
+    unique, offset, size = recipe
+    header = struct.pack("<Q", unique)[:size]  # Keeps distinct contents distinct
+    with open(path, "wb") as f:
+        f.write(header)
+        f.write(block[offset:offset + size - len(header)])
+    return size
+
+
+def change_workspace(root, changed_ratio=0.05, sizes="mixed", seed=1):
+    """Modify, delete and add files: ``changed_ratio`` of the tree in all
+
+    Of the changes, 60% append to existing files, 20% delete files and
+    20% add new ones next to existing files. Deterministic for a given
+    tree and seed. Returns ``{"added": [...], "modified": [...],
+    "deleted": [...]}`` with paths relative to ``root``.
+    """
+    root = Path(root)
+    rng = random.Random(seed)
+    existing = sorted(str(path.relative_to(root)) for path in root.rglob("*.dat"))
+    count = round(len(existing) * changed_ratio)
+    chosen = rng.sample(existing, min(count, len(existing)))
+    cut = round(len(chosen) * 0.6), round(len(chosen) * 0.8)
+    modified, deleted = chosen[:cut[0]], chosen[cut[0]:cut[1]]
+    added = []
+    for path in modified:
+        with open(root / path, "ab") as f:
+            f.write(b"changed during the session\n")
+    for path in deleted:
+        os.unlink(root / path)
+    for index, near in enumerate(chosen[cut[1]:]):
+        path = f"{os.path.dirname(near)}/added_{index:05d}.dat"
+        with open(root / path, "wb") as f:
+            f.write(rng.randbytes(SIZE_DISTRIBUTIONS[sizes](rng)))
+        added.append(path)
+    return {"added": added, "modified": modified, "deleted": deleted}
@@ -0,0 +1,89 @@
+"""Keep/revert decisions for the changes found when a session stops.
+
+A session can end with tens of thousands of changed files, so decisions
+are not stored one per file. Every change starts with its kind's default
+(added and modified files are kept, deleted ones restored). A decision
+about many files at once (a directory, a pattern, everything shown) is
+one rule, and a decision about a single file is an override. A file gets
+the most recent decision that covers it, so a bulk decision costs the
+same however many files it covers.
+"""
+import itertools
+
+from secure_workspace import PathMatcher
+
+KINDS = ("added", "modified", "deleted")
+DEFAULT_KEEP = {"added": True, "modified": True, "deleted": False}
+GLOB_CHARS = set("*?[")
+
+
+def path_filter(text):
+    """Predicate for a search string, or None if it is empty
+
+    Text with glob characters (or a leading "/") is a pattern in the
+    exclusion syntax (see PathMatcher); anything else matches as a
+    case-insensitive substring.
+    """
+    text = text.strip()
+    if not text:
+        return None
+    if GLOB_CHARS & set(text) or text.startswith("/"):
+        return PathMatcher([text]).matches
+    lowered = text.lower()
+    return lambda path: lowered in path.lower()
+
+
+def _everything(path):
+    return True
+
+
+class ChangeDecisions:
+    """Which of a session's changes to keep; see the module docstring"""
+
+    def __init__(self, changes):
+        self.kinds = {}  # path -> "added", "modified" or "deleted"
+        for kind in KINDS:
+            for path in changes.get(kind, ()):
+                self.kinds[path] = kind
+        self._rules = []  # (sequence, predicate, kinds or None, keep), oldest first
+        self._overrides = {}  # path -> (sequence, keep)
+        self._sequence = itertools.count()
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def keeps(self, path):
+        """Whether the change to ``path`` is kept (False: it is reverted)"""
+        kind = self.kinds[path]
+        sequence, keep = self._overrides.get(path, (-1, DEFAULT_KEEP[kind]))
+        for rule_sequence, predicate, kinds, rule_keep in reversed(self._rules):
+            if rule_sequence < sequence:
+                break  # The override is newer than every remaining rule
+            if (kinds is None or kind in kinds) and predicate(path):
+                return rule_keep
+        return keep
+
+    def decide(self, path, keep):
+        self._overrides[path] = (next(self._sequence), keep)
+
+    def decide_all(self, keep, predicate=None, kinds=None):
+        """Decide every change matching ``predicate`` and of one of ``kinds``"""
+        self._rules.append((next(self._sequence), predicate or _everything, kinds, keep))
+
+    def decide_directory(self, directory, keep, predicate=None, kinds=None):
+        """Decide the changes directly in ``directory`` ("" for the workspace root)"""
+        def in_directory(path):
+            return path.rpartition("/")[0] == directory and (predicate is None or predicate(path))
+        self.decide_all(keep, in_directory, kinds)
+
+    def grouped(self, predicate=None, kinds=None):
+        """``{directory: [path, ...]}`` of the matching changes, paths sorted"""
+        groups = {}
+        for path in sorted(self.kinds):
+            if (kinds is None or self.kinds[path] in kinds) and (predicate is None or predicate(path)):
+                groups.setdefault(path.rpartition("/")[0], []).append(path)
+        return groups
+
+    def keep_paths(self):
+        """Paths whose change is kept, as ``revert_changes(keep=...)`` wants them"""
+        return [path for path in self.kinds if self.keeps(path)]
@@ -0,0 +1,329 @@
+"""Linux inotify watcher that journals paths touched during a session.
+
+The watcher runs as a detached process started by ``start_session.py
+--watch`` (or the GUI). It appends every path under the workspace that sees
+a create/modify/delete/move event to a journal file, so ``detect_changes``
+only has to verify those paths instead of rescanning the whole tree.
+
+Journal lines are workspace-relative paths; lines starting with ``#`` are
+control records:
+
+    #READY <home>   all watches are installed, the session may start
+    #SYNC <n>       events queued before the last <n> sync requests are journaled
+    #OVERFLOW       events were lost, the journal cannot be trusted
+    #STOPPED        the watcher exited cleanly
+
+Writes through a shared ``mmap`` do not generate inotify events; use
+``stop_session.py --paranoid`` if the session may have done that.
+"""
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import signal
+import struct
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+JOURNAL_NAME = "watch.journal"
+PID_NAME = "watch.pid"
+
+
+def inotify_available():
+    """inotify is Linux-only and needs a libc that exports it"""
+    return sys.platform.startswith("linux") and _load_libc() is not None
+
+
+def _load_libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class InotifyWatcher:
+    """Watch every scanned directory of a workspace and journal touched paths"""
+
+    def __init__(self, workspace, journal_file):
+        self.workspace = workspace
+        self.home = workspace.home
+        self.journal_file = Path(journal_file)
+        self.libc = _load_libc()
+        self.fd = -1
+        self.wd_paths = {}  # watch descriptor -> workspace-relative dir
+        self.seen = set()
+        self.journal = None
+        self._stop = False
+        self._sync_requests = 0
+
+    def add_tree(self, rel_dir):
+        """Watch ``rel_dir`` and every directory below it that the scan visits"""
+        top = self.home / rel_dir
+        for root, dirs, _ in os.walk(top):
+            root_path = Path(root)
+            depth = len(root_path.relative_to(self.home).parts)
+            if depth > self.workspace.max_depth or self.workspace.should_skip_directory(root_path):
+                dirs.clear()
+                continue
+            dirs[:] = [d for d in dirs if not self.workspace.should_skip_directory(root_path / d)]
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(root_path), WATCH_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+                    continue  # Vanished or unreadable, nothing to watch
+                # ENOSPC: out of inotify watches, coverage is incomplete
+                raise OSError(err, os.strerror(err), str(root_path))
+            rel = root_path.relative_to(self.home).as_posix()
+            self.wd_paths[wd] = "" if rel == "." else rel
+
+    def record(self, rel_path):
+        if rel_path and rel_path not in self.seen:
+            self.seen.add(rel_path)
+            self.journal.write(rel_path + "\n")
+            self.journal.flush()
+
+    def mark(self, record):
+        self.journal.write(f"#{record}\n")
+        self.journal.flush()
+
+    def handle_events(self, data):
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, name_len = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + name_len].rstrip(b"\0")
+            offset += name_len
+
+            if mask & IN_Q_OVERFLOW:
+                self.mark("OVERFLOW")
+                continue
+            if mask & IN_IGNORED:
+                self.wd_paths.pop(wd, None)
+                continue
+            parent = self.wd_paths.get(wd)
+            if parent is None:
+                continue
+            rel_path = os.path.join(parent, os.fsdecode(name)) if name else parent
+            self.record(rel_path)
+
+            # New or moved-in directories need watches of their own; re-adding
+            # an already watched directory refreshes its recorded path.
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                try:
+                    self.add_tree(rel_path)
+                except OSError:
+                    self.mark("OVERFLOW")
+                # Files created before the watch existed are still journaled,
+                # because the whole directory is rescanned on detect.
+
+    def drain(self):
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return
+            if not data:
+                return
+            self.handle_events(data)
+
+    def run(self):
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGUSR1, self._on_sync)
+
+        with open(self.journal_file, "w", errors="surrogateescape") as self.journal:
+            try:
+                self.add_tree("")
+            except OSError as e:
+                self.mark(f"OVERFLOW {e}")
+                return
+            self.mark(f"READY {self.home}")
+
+            while not self._stop:
+                ready, _, _ = select.select([self.fd], [], [], 0.2)
+                if ready:
+                    self.drain()
+                if self._sync_requests:
+                    # inotify queues events synchronously with the syscall,
+                    # so one drain covers everything before the request
+                    self.drain()
+                    self.mark(f"SYNC {self._sync_requests}")
+                    self._sync_requests = 0
+            self.drain()
+            self.mark("STOPPED")
+        os.close(self.fd)
+
+    def _on_stop(self, signum, frame):
+        self._stop = True
+
+    def _on_sync(self, signum, frame):
+        self._sync_requests += 1
+
+
+def _read_pid(workspace):
+    try:
+        pid = int((workspace.backup_dir / PID_NAME).read_text().strip())
+        os.kill(pid, 0)
+        return pid
+    except (OSError, ValueError):
+        return None
+
+
+def _journal_lines(journal_file):
+    try:
+        with open(journal_file, "r", errors="surrogateescape") as f:
+            return f.read().splitlines()
+    except OSError:
+        return []
+
+
+def start_watcher(workspace, timeout=120):
+    """Spawn the watcher and wait until its watches are in place
+
+    Returns True once the watcher reports READY, False if inotify is not
+    available or the watcher could not cover the tree.
+    """
+    if not inotify_available():
+        print("Change watcher unavailable (needs Linux inotify); stop will do a full scan.")
+        return False
+    stop_watcher(workspace)
+    workspace.backup_dir.mkdir(parents=True, exist_ok=True)
+    journal_file = workspace.backup_dir / JOURNAL_NAME
+    journal_file.unlink(missing_ok=True)
+
+    print("Starting change watcher...")
+    process = subprocess.Popen(
+        # The watcher must skip what the scan skips, the backups above all
+        [sys.executable, os.path.abspath(__file__), str(workspace.home), str(journal_file),
+         str(workspace.max_depth), str(workspace.backup_dir), *workspace.exclude],
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        start_new_session=True,  # Outlive start_session.py
+    )
+    (workspace.backup_dir / PID_NAME).write_text(str(process.pid))
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        lines = _journal_lines(journal_file)
+        if any(line.startswith("#OVERFLOW") for line in lines):
+            print("Change watcher could not watch the whole tree; stop will do a full scan.")
+            stop_watcher(workspace)
+            return False
+        if any(line.startswith("#READY") for line in lines):
+            print(f"Change watcher running (pid {process.pid}).")
+            return True
+        if process.poll() is not None:
+            break
+        time.sleep(0.1)
+    print("Change watcher failed to start; stop will do a full scan.")
+    stop_watcher(workspace)
+    return False
+
+
+def read_journal(workspace, timeout=10):
+    """Return the set of journaled paths, or None if a full scan is needed
+
+    The watcher is asked to flush everything queued so far (SIGUSR1) and the
+    journal is only trusted once that sync is acknowledged. A dead watcher,
+    an overflow or a journal for another workspace all return None.
+    """
+    journal_file = workspace.backup_dir / JOURNAL_NAME
+    if not (workspace.backup_dir / PID_NAME).exists():
+        return None  # No watcher was started for this session
+    pid = _read_pid(workspace)
+    if pid is None:
+        print("Change watcher died; falling back to a full scan.")
+        return None
+
+    expected = sum(1 for line in _journal_lines(journal_file) if line.startswith("#SYNC")) + 1
+    try:
+        os.kill(pid, signal.SIGUSR1)
+    except OSError:
+        return None
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        lines = _journal_lines(journal_file)
+        # Signals can coalesce, so any newer sync record acknowledges ours
+        if sum(1 for line in lines if line.startswith("#SYNC")) >= expected:
+            break
+        time.sleep(0.05)
+    else:
+        print("Change watcher did not respond; falling back to a full scan.")
+        return None
+
+    if not lines or lines[0] != f"#READY {workspace.home}":
+        return None
+    paths = set()
+    for line in lines:
+        if line.startswith("#OVERFLOW") or line == "#STOPPED":
+            print("Change journal is incomplete; falling back to a full scan.")
+            return None
+        if line and not line.startswith("#"):
+            paths.add(line)
+    return paths
+
+
+def stop_watcher(workspace, timeout=10):
+    """Stop a running watcher and forget its journal"""
+    pid = _read_pid(workspace)
+    if pid is not None:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except OSError:
+            pass
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            try:
+                # Reap it if this process started the watcher
+                if os.waitpid(pid, os.WNOHANG)[0] == pid:
+                    break
+            except ChildProcessError:
+                pass
+            try:
+                os.kill(pid, 0)
+            except OSError:
+                break
+            time.sleep(0.05)
+    (workspace.backup_dir / PID_NAME).unlink(missing_ok=True)
+
+
+def main():
+    from secure_workspace import SecureWorkspace
+
+    home, journal_file, max_depth, backup_dir = sys.argv[1], sys.argv[2], int(sys.argv[3]), sys.argv[4]
+    workspace = SecureWorkspace(home_dir=home, max_depth=max_depth, use_index=False,
+                                backup_dir=backup_dir, exclude_patterns=sys.argv[5:])
+    InotifyWatcher(workspace, journal_file).run()
+
+
+if __name__ == "__main__":
+    main()
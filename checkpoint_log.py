@@ -0,0 +1,126 @@
+"""Named savepoints within a session, stored as deltas.
+
+A checkpoint records only what changed since its parent: the checkpoint
+the workspace was at when it was taken, or the session start. The state
+at a checkpoint is the session snapshot with every delta on its chain
+applied, oldest first. File contents live in the session's object store
+next to the start-of-session backup.
+
+    checkpoints/HEAD          checkpoint the workspace is at ("" = session start)
+    checkpoints/<name>.json   {"version", "name", "parent", "created",
+                               "files": {path: [digest, *signature] or null if deleted},
+                               "manifest": {path: object store entry}}
+"""
+import json
+import re
+import shutil
+import time
+from pathlib import Path
+
+from backup_store import replace_durably
+
+CHECKPOINT_DIR = "checkpoints"
+FORMAT_VERSION = 1
+VALID_NAME = re.compile(r"[A-Za-z0-9][A-Za-z0-9._-]*\Z")
+SESSION_START = "start"  # Rollback target meaning the session start, never a checkpoint name
+
+
+class CheckpointError(ValueError):
+    """A checkpoint name is invalid, already taken or unknown"""
+
+
+class CheckpointLog:
+    """The checkpoints of one session, kept under backup_dir/checkpoints"""
+
+    def __init__(self, backup_dir):
+        self.root = Path(backup_dir) / CHECKPOINT_DIR
+        self._records = {}
+
+    def _path(self, name):
+        return self.root / f"{name}.json"
+
+    def head(self):
+        try:
+            return (self.root / "HEAD").read_text().strip()
+        except OSError:
+            return ""
+
+    def set_head(self, name):
+        self.root.mkdir(parents=True, exist_ok=True)
+        replace_durably(self.root / "HEAD", lambda tmp: Path(tmp).write_text(name))
+
+    def exists(self, name):
+        return self._path(name).exists()
+
+    def names(self):
+        """Checkpoint names, oldest first"""
+        if not self.root.is_dir():
+            return []
+        records = [self.load(path.stem) for path in self.root.glob("*.json")]
+        return [record["name"] for record in sorted(records, key=lambda record: record["created"])]
+
+    def load(self, name):
+        if name not in self._records:
+            try:
+                with open(self._path(name), 'r') as f:
+                    record = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CheckpointError(f"No readable checkpoint named {name!r}: {e}")
+            if record.get("version") != FORMAT_VERSION:
+                raise CheckpointError(f"Checkpoint {name!r} has an unsupported format")
+            self._records[name] = record
+        return self._records[name]
+
+    def chain(self, name):
+        """Records from the session start to ``name``, oldest first"""
+        records = []
+        while name:
+            if any(record["name"] == name for record in records):
+                raise CheckpointError(f"Checkpoint chain loops at {name!r}")
+            records.append(self.load(name))
+            name = records[-1]["parent"]
+        return records[::-1]
+
+    def overlay(self, name):
+        """``(files, manifest)`` deltas of ``name``'s chain, merged oldest first"""
+        files, manifest = {}, {}
+        for record in self.chain(name):
+            files.update(record["files"])
+            manifest.update(record["manifest"])
+        return files, manifest
+
+    def touched_paths(self):
+        """Every path any checkpoint of the session recorded a change for"""
+        paths = set()
+        for name in self.names():
+            paths.update(self.load(name)["files"])
+        return paths
+
+    def save(self, name, parent, files, manifest):
+        self.validate(name)
+        self.root.mkdir(parents=True, exist_ok=True)
+        record = {
+            "version": FORMAT_VERSION,
+            "name": name,
+            "parent": parent,
+            "created": time.time(),
+            "files": files,
+            "manifest": manifest,
+        }
+        text = json.dumps(record)
+        replace_durably(self._path(name), lambda tmp: Path(tmp).write_text(text))
+        self._records[name] = record
+
+    def validate(self, name):
+        """Raise CheckpointError unless ``name`` is usable for a new checkpoint"""
+        if not VALID_NAME.match(name or ""):
+            raise CheckpointError(f"Invalid checkpoint name {name!r}: use letters, digits, '.', '_' and '-'")
+        if name == SESSION_START:
+            raise CheckpointError(f"{SESSION_START!r} names the session start; choose another name")
+        if self.exists(name):
+            raise CheckpointError(f"Checkpoint {name!r} already exists")
+
+    def clear(self):
+        """Forget every checkpoint, e.g. when a new session starts"""
+        shutil.rmtree(self.root, ignore_errors=True)
+        self._records = {}
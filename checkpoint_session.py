@@ -0,0 +1,59 @@
+from secure_workspace import SecureWorkspace
+from checkpoint_log import SESSION_START, CheckpointError
+from snapshot_format import SnapshotFormatError
+from restore_plan import summarize
+import argparse
+import sys
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Save or roll back to a checkpoint within a session")
+    parser.add_argument("name", nargs="?", help="checkpoint to create")
+    parser.add_argument("--rollback", metavar="NAME",
+                        help="restore the workspace to checkpoint NAME ('start' for the session start)")
+    parser.add_argument("--list", action="store_true", help="list the session's checkpoints")
+    parser.add_argument("--backup-dir",
+                        help="backup directory used by start_session.py "
+                             "(default: $SECURE_WORKSPACE_BACKUP_DIR or the temp dir)")
+    parser.add_argument("--compress", choices=["zlib", "lzma"],
+                        help="compress the checkpoint's backup objects")
+    args = parser.parse_args()
+    if sum(bool(option) for option in (args.name, args.rollback, args.list)) != 1:
+        parser.error("give a checkpoint name, --rollback NAME or --list")
+    return args
+
+def main():
+    args = parse_args()
+    sw = SecureWorkspace(backup_dir=args.backup_dir, use_index=False, compression=args.compress)
+
+    if args.list:
+        try:
+            head = sw.checkpoints.head()
+            for name in sw.checkpoints.names():
+                print(f"{'*' if name == head else ' '} {name}")
+        except CheckpointError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        if not head:
+            print("* (session start)")
+        return
+
+    try:
+        sw.load_snapshot()
+    except SnapshotFormatError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    try:
+        if args.rollback:
+            results = sw.rollback(None if args.rollback == SESSION_START else args.rollback)
+            for result in results:
+                if result.status == "failed":
+                    print(f"- {result.action} {result.path}: {result.detail}")
+            print(f"Rollback complete: {summarize(results)}.")
+        else:
+            sw.checkpoint(args.name)
+    except CheckpointError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
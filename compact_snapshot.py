@@ -0,0 +1,152 @@
+"""Memory-compact in-memory snapshot: path -> hex digest plus stat signatures.
+
+A plain ``{path: hex digest}`` dict with a ``{path: (size, mtime_ns, inode,
+ctime_ns)}`` companion costs several hundred bytes per file: every path
+repeats its directory prefix, every digest is a 32-character string and
+every signature is a tuple of four int objects. ``CompactSnapshot`` keeps
+the same mapping API but stores
+
+- each directory prefix once, with a per-directory ``{name: slot}`` dict,
+- digests as raw bytes in one ``bytearray`` (16 bytes per slot),
+- signatures as int64s in one ``array`` (32 bytes per slot).
+
+Hex strings and tuples are only built when a value is read.
+"""
+from array import array
+from collections.abc import ItemsView, MutableMapping
+
+from snapshot_format import DIGEST_SIZE, MISSING_STAT
+
+STAT_FIELDS = len(MISSING_STAT)
+
+
+class CompactSnapshot(MutableMapping):
+    """Dict-like path -> hex digest mapping; ``stats`` holds the signatures"""
+
+    __slots__ = ("_dir_ids", "_dirs", "_names", "_digests", "_stats", "_free", "_count")
+
+    def __init__(self, hashes=None, stats=None):
+        self._dir_ids = {}  # directory -> id
+        self._dirs = []  # id -> directory
+        self._names = []  # id -> {file name: slot}
+        self._digests = bytearray()
+        self._stats = array("q")
+        self._free = []  # Slots released by deletions
+        self._count = 0
+        for path, digest in (hashes or {}).items():
+            self[path] = digest
+        for path, signature in (stats or {}).items():
+            if path in self:
+                self.stats[path] = signature
+
+    @property
+    def stats(self):
+        # A fresh view each time, so there is no reference cycle to collect
+        return CompactStats(self)
+
+    def _slot(self, path):
+        directory, _, name = path.rpartition("/")
+        dir_id = self._dir_ids.get(directory)
+        return None if dir_id is None else self._names[dir_id].get(name)
+
+    def _allocate(self, path):
+        directory, _, name = path.rpartition("/")
+        dir_id = self._dir_ids.get(directory)
+        if dir_id is None:
+            dir_id = self._dir_ids[directory] = len(self._dirs)
+            self._dirs.append(directory)
+            self._names.append({})
+        if self._free:
+            slot = self._free.pop()
+        else:
+            slot = len(self._digests) // DIGEST_SIZE
+            self._digests.extend(bytes(DIGEST_SIZE))
+            self._stats.extend(MISSING_STAT)
+        self._names[dir_id][name] = slot
+        self._count += 1
+        return slot
+
+    def __getitem__(self, path):
+        slot = self._slot(path) if isinstance(path, str) else None
+        if slot is None:
+            raise KeyError(path)
+        return self._digests[slot * DIGEST_SIZE:(slot + 1) * DIGEST_SIZE].hex()
+
+    def __setitem__(self, path, digest):
+        raw = bytes.fromhex(digest)
+        if len(raw) != DIGEST_SIZE:
+            raise ValueError(f"Unexpected digest size for {path}")
+        slot = self._slot(path)
+        if slot is None:
+            slot = self._allocate(path)
+        self._digests[slot * DIGEST_SIZE:(slot + 1) * DIGEST_SIZE] = raw
+
+    def __delitem__(self, path):
+        directory, _, name = path.rpartition("/")
+        dir_id = self._dir_ids.get(directory)
+        if dir_id is None or name not in self._names[dir_id]:
+            raise KeyError(path)
+        slot = self._names[dir_id].pop(name)
+        self._stats[slot * STAT_FIELDS:(slot + 1) * STAT_FIELDS] = array("q", MISSING_STAT)
+        self._free.append(slot)
+        self._count -= 1
+
+    def __contains__(self, path):
+        return isinstance(path, str) and self._slot(path) is not None
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        for directory, names in zip(self._dirs, self._names):
+            prefix = directory + "/" if directory else ""
+            for name in list(names):
+                yield prefix + name
+
+    def items(self):
+        return _ItemsView(self)
+
+    def iter_items(self):
+        """(path, hex digest) pairs without a lookup per key"""
+        for directory, names in zip(self._dirs, self._names):
+            prefix = directory + "/" if directory else ""
+            for name, slot in list(names.items()):
+                yield prefix + name, self._digests[slot * DIGEST_SIZE:(slot + 1) * DIGEST_SIZE].hex()
+
+
+class CompactStats(MutableMapping):
+    """path -> stat signature view; only paths in the snapshot can have one"""
+
+    __slots__ = ("_snapshot",)
+
+    def __init__(self, snapshot):
+        self._snapshot = snapshot
+
+    def __getitem__(self, path):
+        slot = self._snapshot._slot(path) if isinstance(path, str) else None
+        if slot is None:
+            raise KeyError(path)
+        return tuple(self._snapshot._stats[slot * STAT_FIELDS:(slot + 1) * STAT_FIELDS])
+
+    def __setitem__(self, path, signature):
+        slot = self._snapshot._slot(path)
+        if slot is None:
+            raise KeyError(f"{path} must be added to the snapshot before its stats")
+        self._snapshot._stats[slot * STAT_FIELDS:(slot + 1) * STAT_FIELDS] = array("q", signature)
+
+    def __delitem__(self, path):
+        self[path] = MISSING_STAT
+
+    def __contains__(self, path):
+        return path in self._snapshot
+
+    def __len__(self):
+        return len(self._snapshot)
+
+    def __iter__(self):
+        return iter(self._snapshot)
+
+
+class _ItemsView(ItemsView):
+    def __iter__(self):
+        return self._mapping.iter_items()
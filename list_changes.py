@@ -0,0 +1,74 @@
+from secure_workspace import SecureWorkspace
+from snapshot_format import SnapshotFormatError
+import workspace_daemon
+import workspace_events
+import argparse
+import os
+import sys
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Stream the session's changes as JSON lines on stdout, without reverting anything")
+    parser.add_argument("--paranoid", action="store_true",
+                        help="rehash every file instead of trusting unchanged stat data")
+    parser.add_argument("--backup-dir",
+                        help="backup directory used by start_session.py "
+                             "(default: $SECURE_WORKSPACE_BACKUP_DIR or the temp dir)")
+    parser.add_argument("--walk-workers", type=int,
+                        help="threads listing directories (default: 16 on network filesystems, "
+                             "1 on spinning disks, otherwise up to 8 by CPU count)")
+    parser.add_argument("--io-order", default="auto", choices=["auto", "none", "inode", "extent"],
+                        help="order file reads by inode or physical extent "
+                             "(default: extent on spinning disks, none on SSDs, inode otherwise)")
+    parser.add_argument("--no-cache-hints", action="store_true",
+                        help="don't fadvise reads or drop hashed files from the page cache")
+    parser.add_argument("--no-daemon", action="store_true",
+                        help="run in this process even if workspace_daemon.py is running")
+    parser.add_argument("--events", action="store_true",
+                        help="interleave progress, counts, errors and log lines with the changes "
+                             "(see workspace_events.py)")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    write = workspace_events.JsonLinesSink(sys.stdout)
+    if args.events:
+        on_event = write
+        sys.stdout = workspace_events.PrintedLines(write)
+    else:
+        on_event = None
+        sys.stdout = sys.stderr  # stdout carries only the changes
+
+    options = dict(io_order=args.io_order, cache_hints=not args.no_cache_hints,
+                   walk_workers=args.walk_workers)
+    client = None if args.no_daemon else workspace_daemon.connect(args.backup_dir)
+
+    def forward(message):
+        if on_event is not None or message["event"] == "change":
+            write(message)
+
+    try:
+        if client is not None:
+            counts = client.call("changes", on_event=forward, options=options, paranoid=args.paranoid)
+        else:
+            sw = SecureWorkspace(backup_dir=args.backup_dir, on_event=on_event, **options)
+            sw.load_snapshot()
+            counts = {"added": 0, "modified": 0, "deleted": 0}
+            for change in sw.iter_changes(paranoid=args.paranoid):
+                write(workspace_events.change(*change))
+                counts[change[0]] += 1
+    except (SnapshotFormatError, workspace_daemon.DaemonError) as e:
+        print(f"Error: {e}")
+        if on_event is not None:
+            on_event(workspace_events.event("error", message=str(e)))
+        sys.exit(1)
+    except BrokenPipeError:
+        # The reader went away (e.g. `| head`); don't fail again flushing at exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.__stdout__.fileno())
+        sys.exit(1)
+
+    print(f"Changes - Added: {counts['added']}, Modified: {counts['modified']}, "
+          f"Deleted: {counts['deleted']}")
+
+if __name__ == "__main__":
+    main()
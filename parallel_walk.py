@@ -0,0 +1,127 @@
+"""Directory traversal on a pool of threads with work stealing.
+
+Listing a directory is mostly waiting: on ``readdir`` and on a stat per
+entry, each a network round trip on NFS or SSHFS. ``parallel_walk`` keeps
+several listings in flight. Every worker owns a deque of directories: it
+pushes the subdirectories it finds and pops from the same end, so it
+works depth-first through its own part of the tree, and when it runs dry
+it steals from the other end of someone else's deque, taking the oldest
+(usually biggest) piece of work.
+
+Results still come out in one fixed order, whatever the threads do: the
+generator walks the tree depth-first in the order ``list_directory``
+returns children and waits for each listing, and a directory it waits
+for that no worker has started jumps ahead of every queue. Once
+``max_pending`` listings are waiting to be consumed, workers only take
+directories the consumer will reach next, so memory stays bounded however
+far ahead they could run without the walk slowing to one thread.
+"""
+import threading
+from collections import deque
+
+MAX_PENDING_LISTINGS = 1024
+LOOKAHEAD = 64  # Directories the consumer needs next that workers may take when it lags
+IDLE_WAIT = 0.05  # Seconds an idle worker sleeps between looking for work
+
+
+def parallel_walk(root, list_directory, workers, key=lambda task: task,
+                  max_pending=MAX_PENDING_LISTINGS):
+    """Yield ``list_directory(task)[0]`` for ``root`` and every task below it
+
+    ``list_directory(task)`` returns ``(result, child tasks)``. Output is in
+    depth-first pre-order, children in the order listed, and is identical
+    for any number of workers (with ``workers <= 1`` no threads are used).
+    ``key(task)`` must be hashable and unique per task.
+    """
+    cond = threading.Condition()
+    claimed = set()
+    listings = {}  # key -> (result, children), or the exception raised
+    queues = [deque() for _ in range(workers if workers > 1 else 0)]
+    wanted = None  # The task the consumer is waiting for, if nobody has claimed it
+    stack = [root]  # The consumer's; shared under ``cond``, next task on top
+    stop = False
+
+    def next_task(me):
+        try:
+            return queues[me].pop()  # Own work, newest first
+        except IndexError:
+            pass
+        for other in range(1, len(queues)):
+            try:
+                return queues[(me + other) % len(queues)].popleft()  # Steal the oldest
+            except IndexError:
+                continue
+        return None
+
+    def claim(me):
+        """Next task for worker ``me`` to list, or None to exit; holds ``cond``"""
+        while not stop:
+            if wanted is not None and key(wanted) not in claimed:
+                task = wanted  # The consumer is blocked on it: it goes first
+            elif len(listings) < max_pending:
+                task = next_task(me)
+                if task is None:
+                    cond.wait(IDLE_WAIT)
+                    continue
+                if key(task) in claimed:
+                    continue
+            else:
+                # Far enough ahead: only what the consumer needs soon
+                task = next((task for task in reversed(stack[-LOOKAHEAD:])
+                             if key(task) not in claimed), None)
+                if task is None:
+                    cond.wait()
+                    continue
+            claimed.add(key(task))
+            return task
+        return None
+
+    def work(me):
+        while True:
+            with cond:
+                task = claim(me)
+            if task is None:
+                return
+            try:
+                listing = list_directory(task)
+                queues[me].extend(reversed(listing[1]))  # First child on top
+            except BaseException as e:
+                listing = e
+            with cond:
+                listings[key(task)] = listing
+                cond.notify_all()  # The consumer may wait on it; idle workers can steal
+
+    threads = [threading.Thread(target=work, args=(me,), daemon=True) for me in range(len(queues))]
+    if queues:
+        queues[0].append(root)
+    for thread in threads:
+        thread.start()
+    try:
+        while stack:
+            with cond:
+                task = stack.pop()
+            if threads:
+                with cond:
+                    if key(task) not in claimed:
+                        wanted = task
+                        cond.notify_all()
+                    while key(task) not in listings:
+                        cond.wait()
+                    wanted = None
+                    listing = listings.pop(key(task))
+                    cond.notify_all()  # Room for another pending listing
+                if isinstance(listing, BaseException):
+                    raise listing
+            else:
+                listing = list_directory(task)
+            result, children = listing
+            yield result
+            with cond:
+                stack.extend(reversed(children))
+                cond.notify_all()
+    finally:
+        with cond:
+            stop = True
+            cond.notify_all()
+        for thread in threads:
+            thread.join()
@@ -0,0 +1,84 @@
+"""Plan and run the removals and restores that revert a workspace.
+
+A ``RestorePlan`` knows every action up front, so it creates all the
+directories the restores need once, parents first, and then runs the
+file actions on a thread pool. Each restore replaces its file atomically
+(see ``SecureWorkspace.restore_path``), and every action reports a
+``RestoreResult`` instead of a bare bool.
+"""
+import os
+import shutil
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+# action: "remove" or "restore"
+# status: "removed", "restored", "patched", "missing" or "failed"
+# detail: the error message for failures, otherwise ""
+RestoreResult = namedtuple("RestoreResult", "path action status detail")
+
+
+class RestorePlan:
+    """Every file action needed to revert one session"""
+
+    def __init__(self, workspace, remove=(), restore=()):
+        self.workspace = workspace
+        self.remove = sorted(remove)
+        self.restore = sorted(restore)
+
+    def __len__(self):
+        return len(self.remove) + len(self.restore)
+
+    def directories(self):
+        """Workspace-relative directories the restores need, parents first"""
+        needed = set()
+        for rel_path in self.restore:
+            parent = os.path.dirname(rel_path)
+            while parent and parent not in needed:
+                needed.add(parent)
+                parent = os.path.dirname(parent)
+        return sorted(needed)  # A parent sorts before anything inside it
+
+    def execute(self, max_workers=None):
+        """Run the plan and return one RestoreResult per file"""
+        if not self:
+            return []
+        self.workspace.open_store()  # Load the manifest once, before the workers
+        for rel_dir in self.directories():
+            try:
+                os.mkdir(self.workspace.home / rel_dir)
+            except FileExistsError:
+                pass
+            except OSError:
+                pass  # Restores below it fail and say why
+
+        actions = [("remove", rel_path) for rel_path in self.remove]
+        actions += [("restore", rel_path) for rel_path in self.restore]
+        results = []
+        progress = self.workspace.progress("restore", len(actions))
+        with ThreadPoolExecutor(max_workers=max_workers or self.workspace.max_workers) as executor:
+            for result in executor.map(lambda action: self._run(*action), actions):
+                results.append(result)
+                progress.report(len(results))
+        progress.finish(len(results))
+        return results
+
+    def _run(self, action, rel_path):
+        try:
+            if action == "remove":
+                (self.workspace.home / rel_path).unlink()
+                status = "removed"
+            else:
+                status = self.workspace.restore_path(rel_path)
+        except FileNotFoundError as e:
+            if action == "remove":
+                return RestoreResult(rel_path, action, "missing", "")
+            return RestoreResult(rel_path, action, "failed", str(e))
+        except (OSError, IOError, shutil.Error) as e:
+            return RestoreResult(rel_path, action, "failed", str(e))
+        return RestoreResult(rel_path, action, status, "")
+
+
+def summarize(results):
+    """One-line count of outcomes, e.g. '1 failed, 2 removed, 3 restored'"""
+    counts = Counter(result.status for result in results)
+    return ", ".join(f"{count} {status}" for status, count in sorted(counts.items())) or "nothing to do"
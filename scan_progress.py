@@ -0,0 +1,131 @@
+"""Progress log of a snapshot scan, so an interrupted one can resume.
+
+While ``save_snapshot`` hashes, every file it finishes is appended to
+``backup_dir/scan_progress.jsonl`` as ``[path, digest, *signature]``.
+Lines are buffered and written out, with an fsync, every few seconds, so
+a crash or power loss costs at most that much hashing. The first line
+names the workspace and the hashing settings; a log written under other
+ones is thrown away. A scan that completes deletes its log.
+
+The next scan uses the logged entries as a reference, like the hash
+index: files whose stat signature still matches are not read again, and
+anything touched since (or smudged as racy) is rehashed.
+"""
+import json
+import os
+import threading
+import time
+
+from compact_snapshot import CompactSnapshot
+
+PROGRESS_FILE = "scan_progress.jsonl"
+FORMAT_VERSION = 1
+FLUSH_INTERVAL = 5.0  # Seconds of hashing a crash may cost
+
+
+def _complete_length(f, block=65536):
+    """Length of binary file ``f`` up to the end of its last complete line"""
+    end = f.seek(0, os.SEEK_END)
+    while end > 0:
+        start = max(0, end - block)
+        f.seek(start)
+        newline = f.read(end - start).rfind(b"\n")
+        if newline >= 0:
+            return start + newline + 1
+        end = start
+    return 0
+
+
+class ScanProgress:
+    """Append-only log of the files hashed so far by one snapshot scan"""
+
+    def __init__(self, backup_dir, header):
+        self.path = os.path.join(backup_dir, PROGRESS_FILE)
+        self.header = {"version": FORMAT_VERSION, **header}
+        self._pending = []
+        self._file = None
+        self._flushed_at = 0.0
+        self._lock = threading.Lock()
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def load(self):
+        """``(hashes, stats)`` logged by an interrupted scan, or None
+
+        A torn last line (the crash hit mid-write) is ignored.
+        """
+        hashes = CompactSnapshot()
+        stats = hashes.stats
+        try:
+            with open(self.path, 'r') as f:
+                if json.loads(f.readline() or "null") != self.header:
+                    return None  # Another workspace or other hash settings
+                for line in f:
+                    try:
+                        path, digest, *signature = json.loads(line)
+                        hashes[path] = digest
+                        stats[path] = signature
+                    except (ValueError, TypeError):
+                        break
+        except (OSError, ValueError):
+            return None
+        return hashes, stats
+
+    def start(self, resume):
+        """Open the log for this scan, keeping earlier entries if ``resume``"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if resume:
+            # Drop a torn last line, or the next entry would be glued onto it
+            with open(self.path, 'r+b') as f:
+                f.truncate(_complete_length(f))
+            self._file = open(self.path, 'a')
+        else:
+            self._file = open(self.path, 'w')
+            self._file.write(json.dumps(self.header) + "\n")
+            self._sync()
+        self._flushed_at = time.monotonic()
+
+    def record(self, rel_path, digest, signature):
+        with self._lock:
+            if self._file is None:
+                return
+            self._pending.append(json.dumps([rel_path, digest, *signature]))
+            if time.monotonic() - self._flushed_at >= FLUSH_INTERVAL:
+                try:
+                    self._flush()
+                except (OSError, IOError) as e:
+                    # Losing the log only loses resumability, not the scan
+                    print(f"Could not save scan progress: {e}")
+                    self._file.close()
+                    self._file = None
+
+    def _flush(self):
+        if self._pending and self._file is not None:
+            self._file.write("\n".join(self._pending) + "\n")
+            self._pending = []
+            self._sync()
+        self._flushed_at = time.monotonic()
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        """Write out what is buffered; the log stays for the next scan"""
+        with self._lock:
+            try:
+                self._flush()
+            except (OSError, IOError) as e:
+                print(f"Could not save scan progress: {e}")
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def discard(self):
+        """The scan completed: its log is no longer needed"""
+        self.close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
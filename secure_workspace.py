@@ -1,238 +1,1382 @@
-import os
-import hashlib
-import shutil
-import json
-import tempfile
-from pathlib import Path
-import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
-
-DEFAULT_EXCLUDE = [
-    ".git", ".svn", ".hg", "__pycache__", ".pyc", ".pyo", ".pyd",
-    ".pytest_cache", ".coverage", ".eggs", "node_modules",
-    ".idea", ".vscode", ".vs", "*.swp", "*.swo",
-    ".DS_Store", "Thumbs.db", ".cache", ".tmp", "temp",
-    ".mozilla", ".config", ".local/share", "snap", ".steam",
-    ".wine", "AppData", "Library", ".Trash"
-]
-
-# Common directories to skip for performance
-SKIP_DIRECTORIES = [
-    ".git", ".svn", ".hg", "__pycache__", ".pytest_cache",
-    "node_modules", ".cache", ".tmp", "temp", ".mozilla",
-    ".config/google-chrome", ".config/chromium", ".steam",
-    ".wine", "AppData", "Library", ".Trash", "Downloads/temp",
-    ".local/share/Steam", ".local/share/Trash", "snap"
-]
-
-class SecureWorkspace:
-    def __init__(self, home_dir=None, exclude_patterns=None, max_depth=3, max_workers=4):
-        self.home = Path(home_dir or Path.home())
-        self.exclude = exclude_patterns or DEFAULT_EXCLUDE
-        self.max_depth = max_depth  # Limit directory depth
-        self.max_workers = max_workers  # Parallel processing
-        self.snapshot = {}
-        self.backup_dir = Path(tempfile.gettempdir()) / "secure_workspace_backup"
-        self.snapshot_file = self.backup_dir / "snapshot.json"
-        self._file_count = 0
-        self._processed_count = 0
-
-    def is_excluded(self, path):
-        path_str = str(path)
-        return any(pattern in path_str for pattern in self.exclude)
-
-    def should_skip_directory(self, dir_path):
-        """Check if directory should be skipped entirely"""
-        dir_name = dir_path.name
-        return any(skip_dir in str(dir_path) for skip_dir in SKIP_DIRECTORIES)
-
-    def hash_file(self, file_path):
-        """Fast file hashing with error handling"""
-        try:
-            hasher = hashlib.md5()  # MD5 is faster than SHA256 for our use case
-            with open(file_path, 'rb') as f:
-                # Read in larger chunks for better performance
-                while chunk := f.read(65536):  # 64KB chunks
-                    hasher.update(chunk)
-            return hasher.hexdigest()
-        except (OSError, IOError, PermissionError):
-            return None
-
-    def scan_directory_fast(self):
-        """Fast directory scanning with parallelization and depth limiting"""
-        state = {}
-        files_to_process = []
-        
-        print(f"Scanning workspace (max depth: {self.max_depth})...")
-        
-        # First pass: collect files with depth limiting
-        for root, dirs, files in os.walk(self.home):
-            root_path = Path(root)
-            
-            # Calculate depth from home directory
-            try:
-                relative_path = root_path.relative_to(self.home)
-                depth = len(relative_path.parts)
-                if depth > self.max_depth:
-                    dirs.clear()  # Don't descend deeper
-                    continue
-            except ValueError:
-                continue
-            
-            # Skip excluded directories
-            if self.should_skip_directory(root_path):
-                dirs.clear()  # Don't descend into this directory
-                continue
-            
-            # Filter out directories to skip from further traversal
-            dirs[:] = [d for d in dirs if not self.should_skip_directory(root_path / d)]
-            
-            # Collect files to process
-            for name in files:
-                full_path = root_path / name
-                if self.is_excluded(full_path) or not full_path.is_file():
-                    continue
-                
-                # Skip very large files (>100MB) for performance
-                try:
-                    if full_path.stat().st_size > 100 * 1024 * 1024:
-                        print(f"Skipping large file: {full_path}")
-                        continue
-                except (OSError, IOError):
-                    continue
-                
-                try:
-                    rel_path = full_path.relative_to(self.home)
-                    files_to_process.append((str(rel_path), full_path))
-                except ValueError:
-                    continue
-        
-        self._file_count = len(files_to_process)
-        print(f"Found {self._file_count} files to process...")
-        
-        if not files_to_process:
-            return state
-        
-        # Second pass: hash files in parallel
-        def process_file(file_info):
-            rel_path, full_path = file_info
-            file_hash = self.hash_file(full_path)
-            self._processed_count += 1
-            
-            if self._processed_count % 100 == 0:
-                print(f"Processed {self._processed_count}/{self._file_count} files...")
-            
-            return rel_path, file_hash
-        
-        # Use ThreadPoolExecutor for parallel file processing
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            future_to_file = {executor.submit(process_file, file_info): file_info 
-                            for file_info in files_to_process}
-            
-            for future in as_completed(future_to_file):
-                try:
-                    rel_path, file_hash = future.result()
-                    if file_hash:  # Only store if hash was successful
-                        state[rel_path] = file_hash
-                except Exception as e:
-                    # Silently skip problematic files
-                    continue
-        
-        print(f"Scan complete! Processed {len(state)} files.")
-        return state
-
-    def scan_directory(self):
-        """Use the fast scanning method"""
-        return self.scan_directory_fast()
-
-    def save_snapshot(self):
-        """Save snapshot with progress indication"""
-        self.backup_dir.mkdir(exist_ok=True)
-        print("Creating workspace snapshot...")
-        self.snapshot = self.scan_directory()
-        
-        print("Saving snapshot data...")
-        with open(self.snapshot_file, 'w') as f:
-            json.dump(self.snapshot, f, indent=2)
-        print(f"Snapshot saved with {len(self.snapshot)} files.")
-
-    def load_snapshot(self):
-        """Load snapshot with error handling"""
-        try:
-            with open(self.snapshot_file, 'r') as f:
-                self.snapshot = json.load(f)
-            print(f"Loaded snapshot with {len(self.snapshot)} files.")
-        except (FileNotFoundError, json.JSONDecodeError) as e:
-            print(f"Error loading snapshot: {e}")
-            self.snapshot = {}
-
-    def backup_files(self):
-        """Backup files with progress indication"""
-        if not self.snapshot:
-            print("No files to backup.")
-            return
-        
-        print(f"Backing up {len(self.snapshot)} files...")
-        backed_up = 0
-        
-        for rel_path in self.snapshot:
-            src = self.home / rel_path
-            dst = self.backup_dir / rel_path
-            
-            try:
-                dst.parent.mkdir(parents=True, exist_ok=True)
-                if src.exists():
-                    shutil.copy2(src, dst)
-                    backed_up += 1
-                    
-                    if backed_up % 50 == 0:
-                        print(f"Backed up {backed_up}/{len(self.snapshot)} files...")
-            except (OSError, IOError, shutil.Error):
-                continue  # Skip problematic files
-        
-        print(f"Backup complete! Backed up {backed_up} files.")
-
-    def detect_changes(self):
-        """Fast change detection with progress indication"""
-        print("Detecting changes...")
-        current = self.scan_directory()
-        added, modified, deleted = [], [], []
-
-        # Find added and modified files
-        for path, hash_val in current.items():
-            if path not in self.snapshot:
-                added.append(path)
-            elif self.snapshot[path] != hash_val:
-                modified.append(path)
-
-        # Find deleted files
-        for path in self.snapshot:
-            if path not in current:
-                deleted.append(path)
-
-        print(f"Changes detected - Added: {len(added)}, Modified: {len(modified)}, Deleted: {len(deleted)}")
-        return added, modified, deleted
-
-    def restore_file(self, rel_path):
-        """Restore file with error handling"""
-        backup_file = self.backup_dir / rel_path
-        target_file = self.home / rel_path
-        try:
-            if backup_file.exists():
-                target_file.parent.mkdir(parents=True, exist_ok=True)
-                shutil.copy2(backup_file, target_file)
-                return True
-        except (OSError, IOError, shutil.Error):
-            pass
-        return False
-
-    def remove_file(self, rel_path):
-        """Remove file with error handling"""
-        target_file = self.home / rel_path
-        try:
-            if target_file.exists():
-                target_file.unlink()
-                return True
-        except (OSError, IOError):
-            pass
-        return False
+import os
+import bisect
+import itertools
+import math
+import queue
+import re
+import hashlib
+import shutil
+import stat as stat_module
+import struct
+import json
+import tempfile
+from pathlib import Path
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import change_watcher
+import disk_order
+import snapshot_format
+import storage_info
+import workspace_events
+from backup_store import FileCopier, ObjectStore, format_bytes, replace_atomically, replace_durably
+from checkpoint_log import CheckpointLog
+from compact_snapshot import CompactSnapshot
+from parallel_walk import parallel_walk
+from restore_plan import RestorePlan
+from scan_progress import ScanProgress
+
+# Glob patterns matched against workspace-relative paths, component by
+# component: "node_modules" matches a file or directory of that name at any
+# depth, "*.swp" matches by suffix, ".local/share" matches that run of
+# directories anywhere, and a leading "/" anchors a pattern at the workspace
+# root. A matching directory excludes everything below it.
+DEFAULT_EXCLUDE = [
+    ".git", ".svn", ".hg", "__pycache__", "*.pyc", "*.pyo", "*.pyd",
+    ".pytest_cache", ".coverage", ".eggs", "node_modules",
+    ".idea", ".vscode", ".vs", "*.swp", "*.swo",
+    ".DS_Store", "Thumbs.db", ".cache", ".tmp", "temp",
+    ".mozilla", ".config", ".local/share", "snap", ".steam",
+    ".wine", "AppData", "Library", ".Trash"
+]
+
+# Common directories to skip for performance (same pattern syntax)
+SKIP_DIRECTORIES = [
+    ".git", ".svn", ".hg", "__pycache__", ".pytest_cache",
+    "node_modules", ".cache", ".tmp", "temp", ".mozilla",
+    ".config/google-chrome", ".config/chromium", ".steam",
+    ".wine", "AppData", "Library", ".Trash", "Downloads/temp",
+    ".local/share/Steam", ".local/share/Trash", "snap"
+]
+
+# Files modified this close to the moment they were hashed can change again
+# without their mtime moving (timestamp granularity), so their stat data is
+# "smudged" and they always get rehashed. 2s covers FAT-style timestamps.
+RACY_MTIME_WINDOW_NS = 2 * 1000 * 1000 * 1000
+
+SNAPSHOT_VERSION = 2
+
+# Tasks queued ahead of each hashing worker while the walk keeps going
+PIPELINE_DEPTH_PER_WORKER = 16
+
+# Changes iter_changes holds for a slow consumer before hashing waits
+CHANGE_QUEUE_SIZE = 1024
+
+# Files at or above the large-file threshold follow LARGE_FILE_POLICIES:
+# "track" hashes them as a tree of fixed-size chunks (hashed in parallel,
+# per-chunk digests kept under backup_dir/trees), "stat-only" derives the
+# digest from size/mtime/inode without reading, "skip" leaves them out.
+LARGE_FILE_THRESHOLD = 100 * 1024 * 1024
+LARGE_FILE_POLICIES = ("track", "stat-only", "skip")
+TREE_CHUNK_SIZE = 4 * 1024 * 1024
+
+# How tracked large files are backed up: "blocks" stores each chunk as its
+# own object, so only chunks no earlier backup holds are written; "whole"
+# copies the file like any other (a reflink clone where supported, which
+# the filesystem then copies lazily as blocks change).
+LARGE_FILE_BACKUPS = ("blocks", "whole")
+
+# Files below SMALL_FILE_BYTES are hashed in batches so per-task overhead
+# doesn't dominate; anything larger is its own task, largest first.
+SMALL_FILE_BYTES = 256 * 1024
+BATCH_MAX_FILES = 64
+BATCH_MAX_BYTES = 4 * 1024 * 1024
+
+# Lets start_session.py, stop_session.py and the GUI agree on a backup
+# location without passing flags around, e.g. a directory on the same
+# filesystem as home so reflink backups work.
+BACKUP_DIR_ENV = "SECURE_WORKSPACE_BACKUP_DIR"
+
+
+def default_backup_dir():
+    configured = os.environ.get(BACKUP_DIR_ENV)
+    if configured:
+        return Path(configured).expanduser()
+    return Path(tempfile.gettempdir()) / "secure_workspace_backup"
+
+
+def stat_signature(st):
+    """Stat fields used to decide whether a file needs rehashing"""
+    return (st.st_size, st.st_mtime_ns, st.st_ino, st.st_ctime_ns)
+
+
+def hashed_signature(st):
+    """Signature to record for a file hashed just now, smudged if racy"""
+    signature = stat_signature(st)
+    if signature[1] >= time.time_ns() - RACY_MTIME_WINDOW_NS:
+        # Racily clean: a later write could keep the same mtime
+        signature = (-1,) + signature[1:]
+    return signature
+
+
+def _glob_to_regex(segment):
+    """Translate one path component glob (``*``, ``?``, ``[...]``) to a regex"""
+    out, i = [], 0
+    while i < len(segment):
+        c = segment[i]
+        if c == "*":
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            end = segment.find("]", i + 2 if segment[i + 1:i + 2] in ("!", "]") else i + 1)
+            if end == -1:
+                out.append(re.escape(c))
+            else:
+                body = segment[i + 1:end].replace("\\", "\\\\")
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                out.append(f"[{body}]")
+                i = end
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+
+class PathMatcher:
+    """Exclusion patterns compiled once into a single regex
+
+    Paths are workspace-relative with "/" separators. A pattern matches
+    when its components match a contiguous run of the path's components;
+    "**" spans any number of components. Because a match may end at any
+    component boundary, a hit on a directory also covers its contents.
+    """
+
+    def __init__(self, patterns):
+        floating, anchored = [], []
+        for pattern in patterns:
+            pattern = pattern.strip().replace(os.sep, "/")
+            if not pattern.strip("/"):
+                continue
+            target = anchored if pattern.startswith("/") else floating
+            segments = pattern.strip("/").split("/")
+            # Leading/trailing "**" add nothing: matches float and cover subtrees
+            while len(segments) > 1 and segments[0] == "**" and target is floating:
+                segments.pop(0)
+            while len(segments) > 1 and segments[-1] == "**":
+                segments.pop()
+            parts = []
+            for segment in segments:
+                parts.append("(?:[^/]+(?:/[^/]+)*)?" if segment == "**" else _glob_to_regex(segment))
+            target.append("/".join(parts).replace("/(?:[^/]+(?:/[^/]+)*)?/", "(?:/[^/]+)*/"))
+        alternatives = []
+        if floating:
+            alternatives.append(f"(?:^|/)(?:{'|'.join(floating)})")
+        if anchored:
+            alternatives.append(f"^(?:{'|'.join(anchored)})")
+        self.regex = re.compile(f"(?:{'|'.join(alternatives)})(?:/|$)") if alternatives else None
+
+    def matches(self, rel_path):
+        return self.regex is not None and self.regex.search(rel_path) is not None
+
+
+def stat_only_digest(st):
+    """Pseudo digest for files tracked by metadata alone"""
+    return hashlib.md5(b"stat-only" + struct.pack("<qqq", st.st_size, st.st_mtime_ns, st.st_ino)).hexdigest()
+
+
+def tree_digest(size, chunk_digests):
+    """Root digest of a chunk tree: covers the chunk size, length and every chunk"""
+    return hashlib.md5(b"tree" + struct.pack("<qq", TREE_CHUNK_SIZE, size) + chunk_digests).hexdigest()
+
+
+def default_index_path(home):
+    """Per-workspace location of the persistent hash index"""
+    key = hashlib.md5(str(Path(home).resolve()).encode()).hexdigest()[:12]
+    return Path.home() / ".cache" / "secure_workspace" / f"index-{key}.json"
+
+
+class HashIndex:
+    """Persistent path -> (stat signature, hash) cache that outlives sessions
+
+    Works like git's index: an entry is only trusted while the file's stat
+    signature is unchanged, so a new snapshot hashes just the files that
+    are new or were touched since the index was last written.
+    """
+
+    VERSION = 1
+
+    def __init__(self, index_file, settings=None):
+        self.index_file = Path(index_file)
+        self.settings = settings or {}  # Hashing settings the entries depend on
+        self.hashes = CompactSnapshot()
+        self.stats = self.hashes.stats
+
+    def load(self):
+        """Load the index, starting empty if it is missing or unreadable"""
+        self.hashes = CompactSnapshot()
+        self.stats = self.hashes.stats
+        try:
+            with open(self.index_file, 'r') as f:
+                data = json.load(f)
+            if data.get("version") != self.VERSION or data.get("settings", {}) != self.settings:
+                return  # Digests were computed differently, start over
+            for path, (file_hash, *signature) in data["entries"].items():
+                self.hashes[path] = file_hash
+                self.stats[path] = signature
+        except (OSError, ValueError, KeyError, TypeError):
+            self.hashes = CompactSnapshot()
+            self.stats = self.hashes.stats
+
+    def update(self, hashes, stats):
+        """Replace the index contents with the result of a full scan
+
+        The scan result is shared, not copied; callers don't modify it later.
+        """
+        self.hashes = hashes
+        self.stats = stats
+
+    def reference(self):
+        return self.hashes, self.stats
+
+    def save(self):
+        """Write the index atomically so a crash never leaves it truncated"""
+        try:
+            self.index_file.parent.mkdir(parents=True, exist_ok=True)
+            entries = {path: [file_hash, *self.stats[path]]
+                       for path, file_hash in self.hashes.items() if path in self.stats}
+
+            def write(tmp):
+                with open(tmp, 'w') as f:
+                    json.dump({"version": self.VERSION, "settings": self.settings, "entries": entries}, f)
+            replace_durably(self.index_file, write)
+        except (OSError, IOError) as e:
+            print(f"Could not save hash index: {e}")
+
+class _CloneUnsupported(Exception):
+    """The filesystem can't reflink, so a block patch must go in place"""
+
+
+class SecureWorkspace:
+    def __init__(self, home_dir=None, exclude_patterns=None, max_depth=3, max_workers=None,
+                 index_file=None, use_index=True, backup_dir=None, copy_strategy="auto",
+                 large_file_policy="track", large_file_threshold=LARGE_FILE_THRESHOLD,
+                 large_file_backup="blocks", compression=None, io_order="auto", cache_hints=True,
+                 walk_workers=None, on_event=None, patch_in_place=False):
+        # Resolved, like backup_dir, so the walk's paths can be compared with it
+        self.home = Path(home_dir or Path.home()).expanduser().resolve()
+        self.exclude = exclude_patterns or DEFAULT_EXCLUDE
+        self.max_depth = max_depth  # Limit directory depth
+        if max_workers:
+            self.max_workers, self.storage_type = max_workers, "override"
+        else:
+            # Parallel processing sized from CPUs and the storage under home
+            self.max_workers, self.storage_type = storage_info.default_worker_count(self.home)
+        # Files are read sorted by inode or physical extent where seeks are costly
+        kind = self.storage_type
+        if kind == "override" and (io_order == "auto" or not walk_workers):
+            kind = storage_info.storage_type(self.home)
+        self.io_order = disk_order.resolve_order(io_order, kind)
+        # Threads listing directories during the walk (1 = on the scanning thread)
+        self.walk_workers = walk_workers or storage_info.default_walk_workers(kind)
+        self.cache_hints = cache_hints  # fadvise reads as sequential, drop pages once hashed
+        self.on_event = on_event  # Called with each event dict (see workspace_events)
+        self.snapshot = {}
+        self.snapshot_stats = {}  # rel_path -> (size, mtime_ns, inode, ctime_ns)
+        self.changed_directories = []  # Set by detect_changes
+        # (hashes, stats) of this process's last full rescan: a long-lived
+        # caller (the daemon) only rehashes files touched since then
+        self.stat_cache = None
+        self._sorted_snapshot = None  # Lookup table for dict (JSON) snapshots
+        self.backup_dir = (Path(backup_dir) if backup_dir else default_backup_dir()).expanduser().resolve()
+        self.copy_strategy = copy_strategy  # "auto", "reflink", "copy_file_range" or "copy"
+        self.compression = compression  # None, "zlib" or "lzma" for new backup objects
+        # Patch large files in place where reflinks are unavailable: less I/O,
+        # but an interrupted stop leaves a file half restored
+        self.patch_in_place = patch_in_place
+        self.store = None  # Content-addressed ObjectStore, set up on backup/restore
+        if large_file_policy not in LARGE_FILE_POLICIES:
+            raise ValueError(f"Unknown large file policy: {large_file_policy}")
+        self.large_file_policy = large_file_policy
+        self.large_file_threshold = large_file_threshold
+        if large_file_backup not in LARGE_FILE_BACKUPS:
+            raise ValueError(f"Unknown large file backup mode: {large_file_backup}")
+        self.large_file_backup = large_file_backup
+        self.tree_dir = self.backup_dir / "trees"  # Per-chunk digests of large files
+        # Trees of the last scan, saved to tree_dir once a snapshot or backup records them
+        self._pending_trees = {}
+        self.session_file = self.backup_dir / "session.json"
+        self.checkpoints = CheckpointLog(self.backup_dir)
+        self.index = HashIndex(index_file or default_index_path(self.home),
+                               self.hash_settings()) if use_index else None
+        self._chunk_pool = None
+        self._chunk_buffers = threading.local()
+        self.snapshot_file = self.backup_dir / "snapshot.bin"
+        self.snapshot_json_file = self.backup_dir / "snapshot.json"  # Export / legacy format
+        self._exclude_matcher = PathMatcher(self.exclude)
+        # Directories matching either list are pruned during the walk
+        self._skip_matcher = PathMatcher(list(SKIP_DIRECTORIES) + list(self.exclude))
+        self._file_count = 0
+        self._processed_count = 0
+
+    def emit(self, kind, **fields):
+        """Send an event to ``on_event``, if set"""
+        if self.on_event is not None:
+            self.on_event(workspace_events.event(kind, **fields))
+
+    def progress(self, phase, total=None):
+        return workspace_events.Progress(self.emit, phase, total)
+
+    def hash_settings(self):
+        """Settings that change what digest a file gets"""
+        return {
+            "large_file_policy": self.large_file_policy,
+            "large_file_threshold": self.large_file_threshold,
+            "tree_chunk_size": TREE_CHUNK_SIZE,
+        }
+
+    def _relative(self, path):
+        """Workspace-relative "/"-separated form of ``path`` ("" for home)"""
+        rel = os.path.relpath(path, self.home)
+        return "" if rel == "." else rel.replace(os.sep, "/")
+
+    def is_excluded(self, path):
+        return self._exclude_matcher.matches(self._relative(path))
+
+    def should_skip_directory(self, dir_path):
+        """Check if directory should be skipped entirely"""
+        backup_str = str(self.backup_dir)
+        if str(dir_path) == backup_str or str(dir_path).startswith(backup_str + os.sep):
+            return True  # Never snapshot our own backups
+        return self._skip_matcher.matches(self._relative(dir_path))
+
+    def hash_file(self, file_path):
+        """Fast file hashing with error handling"""
+        try:
+            hasher = hashlib.md5()  # MD5 is faster than SHA256 for our use case
+            with open(file_path, 'rb') as f:
+                # Read in larger chunks for better performance
+                while chunk := f.read(65536):  # 64KB chunks
+                    hasher.update(chunk)
+            return hasher.hexdigest()
+        except (OSError, IOError, PermissionError):
+            return None
+
+    def hash_file_with_stat(self, file_path):
+        """Hash a file and return (digest, stat signature) taken before reading
+
+        Files at or above the large-file threshold are hashed according to
+        the large-file policy instead of as one MD5 stream.
+        """
+        try:
+            with open(file_path, 'rb') as f:
+                st = os.fstat(f.fileno())
+                if st.st_size >= self.large_file_threshold:
+                    return self._large_file_digest(f.fileno(), st), hashed_signature(st)
+                if self.cache_hints:
+                    disk_order.advise_sequential(f.fileno(), st.st_size)
+                hasher = hashlib.md5()
+                while chunk := f.read(65536):
+                    hasher.update(chunk)
+                if self.cache_hints:
+                    disk_order.advise_done(f.fileno())
+            return hasher.hexdigest(), hashed_signature(st)
+        except (OSError, IOError, PermissionError):
+            return None, None
+
+    def digest_for(self, file_path):
+        """Digest of a file under the current size policy, or None"""
+        return self.hash_file_with_stat(file_path)[0]
+
+    def _large_file_digest(self, fd, st):
+        if self.large_file_policy == "stat-only":
+            return stat_only_digest(st)
+        return self._tree_digest(st.st_size, self.hash_chunks(fd, st.st_size))
+
+    def _chunk_executor(self):
+        if self._chunk_pool is None:
+            # Separate from the scan pool: scan workers block on these futures
+            self._chunk_pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        return self._chunk_pool
+
+    def hash_chunks(self, fd, size):
+        """Raw MD5 digests of every TREE_CHUNK_SIZE chunk, hashed in parallel"""
+        offsets = range(0, size, TREE_CHUNK_SIZE)
+        if self.cache_hints:
+            disk_order.advise_sequential(fd, size)
+        return b"".join(self._chunk_executor().map(lambda offset: self._hash_chunk(fd, offset), offsets))
+
+    def _tree_digest(self, size, chunk_digests):
+        digest = tree_digest(size, chunk_digests)
+        self._pending_trees[digest] = chunk_digests
+        return digest
+
+    def _hash_chunk(self, fd, offset):
+        # One reusable buffer per thread; hashlib releases the GIL while hashing
+        buffer = getattr(self._chunk_buffers, "buffer", None)
+        if buffer is None:
+            buffer = self._chunk_buffers.buffer = bytearray(TREE_CHUNK_SIZE)
+        view = memoryview(buffer)
+        filled = 0
+        while filled < TREE_CHUNK_SIZE:
+            count = os.preadv(fd, [view[filled:]], offset + filled)
+            if count == 0:
+                break  # End of file (or the file shrank)
+            filled += count
+        digest = hashlib.md5(view[:filled]).digest()
+        if self.cache_hints:
+            disk_order.advise_done(fd, offset, TREE_CHUNK_SIZE)
+        return digest
+
+    def _save_trees(self, digests):
+        """Keep the pending trees of ``digests``, the ones just recorded"""
+        if not self._pending_trees:
+            return
+        for digest in digests:
+            chunk_digests = self._pending_trees.get(digest)
+            if chunk_digests is None:
+                continue
+            path = self.tree_dir / digest
+            if not path.exists():
+                self.tree_dir.mkdir(parents=True, exist_ok=True)
+                tmp = path.with_suffix(f".tmp-{threading.get_ident()}")
+                tmp.write_bytes(chunk_digests)
+                os.replace(tmp, path)
+
+    def _prune_trees(self):
+        """Delete saved trees that neither the snapshot nor the backup records"""
+        try:
+            stale = {entry.name for entry in os.scandir(self.tree_dir)}
+        except OSError:
+            return 0
+        for entry in self.store.manifest.values():
+            stale.discard(entry["digest"])
+        for _, digest in self.snapshot.items():
+            stale.discard(digest)
+        for name in stale:
+            try:
+                os.unlink(self.tree_dir / name)
+            except OSError:
+                pass
+        return len(stale)
+
+    def load_tree(self, digest):
+        """Per-chunk digests recorded for a tree digest, or None"""
+        data = self._pending_trees.get(digest)
+        if data is None:
+            try:
+                data = (self.tree_dir / digest).read_bytes()
+            except OSError:
+                return None
+        return [data[i:i + 16] for i in range(0, len(data), 16)]
+
+    def _stores_blocks(self, size):
+        """Whether a file of ``size`` bytes is backed up as separate blocks"""
+        return (size >= self.large_file_threshold and self.large_file_policy == "track"
+                and self.large_file_backup == "blocks")
+
+    def _backup_file(self, store, rel_path, src, digest):
+        """Back up one file; ``digest`` is None unless its snapshot hash holds"""
+        st = os.stat(src)
+        if digest is not None and self._record_stored(store, rel_path, digest, st):
+            return digest  # Already stored, nothing to read
+        if self._stores_blocks(st.st_size):
+            return store.add_blocks(rel_path, src, TREE_CHUNK_SIZE, self._tree_digest,
+                                    self._chunk_executor().map)
+        return store.add_file(rel_path, src, digest, self.digest_for)
+
+    def _record_stored(self, store, rel_path, digest, st):
+        """Point ``rel_path`` at content the store already holds, if it does"""
+        if store.has(digest):
+            store.record(rel_path, digest, st)
+            return True
+        tree = self.load_tree(digest) if self._stores_blocks(st.st_size) else None
+        return tree is not None and store.record_blocks(rel_path, digest, tree, TREE_CHUNK_SIZE, st)
+
+    def iter_workspace_files(self, top=None):
+        """Yield (rel_path, full_path, stat) for every tracked file under ``top``
+
+        Walks with ``os.scandir`` so file/directory checks use the type
+        cached from readdir, and each tracked file costs a single stat.
+        Directories are listed on ``walk_workers`` threads (see
+        parallel_walk), but the order is always the same: a directory's
+        files by name, then its subdirectories by name, depth first.
+        """
+        top = str(top) if top else str(self.home)
+        top_rel = self._relative(top)
+        if top_rel.startswith("..") or self.should_skip_directory(top):
+            return
+        # Depth from home directory: files in directories up to max_depth count
+        depth = len(top_rel.split("/")) if top_rel else 0
+        if depth > self.max_depth:
+            return
+        for files in parallel_walk((top, top_rel, depth), self._list_directory, self.walk_workers,
+                                   key=lambda task: task[1]):
+            yield from files
+
+    def _list_directory(self, task):
+        """One step of the walk: ``(files, subdirectory tasks)``"""
+        dir_path, dir_rel, depth = task
+        files, subdirs = [], []
+        try:
+            with os.scandir(dir_path) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            return files, subdirs
+
+        backup_str = str(self.backup_dir)
+        large_limit = self.large_file_threshold if self.large_file_policy == "skip" else math.inf
+        skip = self._skip_matcher.matches
+        exclude = self._exclude_matcher.matches
+        prefix = dir_rel + "/" if dir_rel else ""
+        for entry in entries:
+            rel_path = prefix + entry.name
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    # Skip excluded directories and our own backups
+                    if (depth < self.max_depth and not skip(rel_path)
+                            and entry.path != backup_str):
+                        subdirs.append((entry.path, rel_path, depth + 1))
+                    continue
+                if not entry.is_file() or exclude(rel_path):
+                    continue
+                st = entry.stat()
+            except OSError:
+                continue
+
+            # Large files are only skipped under the "skip" policy
+            if st.st_size >= large_limit:
+                print(f"Skipping large file: {entry.path}")
+                continue
+            files.append((rel_path, entry.path, st))
+        return files, subdirs
+
+    def _tracked_entry(self, full_path):
+        """Return (rel_path, full_path, stat) if ``full_path`` is a file we track"""
+        rel_path = self._relative(full_path)
+        if rel_path.startswith("..") or self._exclude_matcher.matches(rel_path):
+            return None
+        
+        try:
+            st = os.stat(full_path)
+        except (OSError, IOError):
+            return None
+        if not stat_module.S_ISREG(st.st_mode):
+            return None
+
+        # Large files are only skipped under the "skip" policy
+        if self.large_file_policy == "skip" and st.st_size >= self.large_file_threshold:
+            print(f"Skipping large file: {full_path}")
+            return None
+        return rel_path, str(full_path), st
+
+    def is_in_scope(self, rel_path):
+        """Check whether a file path lies inside the scanned directory tree"""
+        parent = (self.home / rel_path).parent
+        parent_rel = self._relative(parent)
+        if parent_rel.startswith(".."):
+            return False
+        depth = len(parent_rel.split("/")) if parent_rel else 0
+        return depth <= self.max_depth and not self.should_skip_directory(parent)
+
+    def scan_directory_fast(self, reference=None, paranoid=False, store=None, progress=None):
+        """Fast directory scanning with parallelization and depth limiting
+
+        ``reference`` is an optional ``(hashes, stats)`` pair from an earlier
+        scan; files whose stat signature still matches reuse the recorded
+        hash instead of being read again. ``paranoid`` rehashes everything.
+        With an ObjectStore as ``store`` each file is backed up in the same
+        read that hashes it.
+        Every file hashed is logged to ``progress`` (a ScanProgress), if given.
+        Returns ``(hashes, stats)``.
+        """
+        print(f"Scanning workspace (max depth: {self.max_depth})...")
+        state = CompactSnapshot()
+        stats = state.stats
+        self._hash_entries(self.iter_workspace_files(), reference, paranoid, state, stats, store,
+                           progress)
+        print(f"Scan complete! Processed {len(state)} files.")
+        return state, stats
+
+    def _snapshot_under(self, rel_path):
+        """(path, digest, stat) for snapshot entries at or below ``rel_path``"""
+        if isinstance(self.snapshot, snapshot_format.BinarySnapshot):
+            return self.snapshot.iter_under(rel_path)  # Binary search, no full pass
+        if self._sorted_snapshot is None:
+            self._sorted_snapshot = sorted(self.snapshot)
+        known = self._sorted_snapshot
+        found = []
+        for path in known[bisect.bisect_left(known, rel_path):]:
+            if path != rel_path and not path.startswith(rel_path + "/"):
+                break
+            found.append((path, self.snapshot[path], self.snapshot_stats.get(path)))
+        return found
+
+    def journaled_changes(self, journal, overlay=None):
+        """Changes among the paths touched during the session
+
+        Subtrees with no journaled path are never visited: only snapshot
+        entries at or below a journaled path are looked up, and only those
+        paths are rescanned. A journaled directory is walked in full.
+        ``overlay`` (path -> [digest, *signature], or None for deleted)
+        replaces snapshot entries, e.g. to compare against a checkpoint.
+        Returns ``(current hashes, current stats, snapshot hashes)``
+        restricted to the journaled subtrees.
+        """
+        roots = []
+        for rel_path in sorted(journal):
+            # Anything below a journaled directory is covered by its walk
+            if not (roots and (roots[-1] == "" or rel_path.startswith(roots[-1] + "/"))):
+                roots.append(rel_path)
+
+        print(f"Rescanning {len(journal)} journaled paths...")
+        old_hashes, old_stats, entries = {}, {}, {}
+        for rel_path in roots:
+            for path, digest, signature in self._snapshot_under(rel_path):
+                old_hashes[path] = digest
+                if signature is not None:
+                    old_stats[path] = tuple(signature)
+            for path, record in (overlay or {}).items():
+                if rel_path and path != rel_path and not path.startswith(rel_path + "/"):
+                    continue
+                old_hashes.pop(path, None)
+                old_stats.pop(path, None)
+                if record is not None:
+                    old_hashes[path], old_stats[path] = record[0], tuple(record[1:])
+
+            full_path = self.home / rel_path
+            if full_path.is_dir() and not full_path.is_symlink():
+                for entry in self.iter_workspace_files(full_path):
+                    entries[entry[0]] = entry
+            elif self.is_in_scope(rel_path):
+                entry = self._tracked_entry(full_path)
+                if entry:
+                    entries[entry[0]] = entry
+
+        state, stats = {}, {}
+        self._hash_entries(entries.values(), (old_hashes, old_stats), False, state, stats)
+        return state, stats, old_hashes
+
+    def changes_since(self, overlay, extra_paths=()):
+        """Changes relative to the snapshot with ``overlay`` applied
+
+        Uses the change journal when a watcher is running, so the cost
+        follows the paths touched this session (plus ``extra_paths``);
+        otherwise the whole tree is scanned, rehashing only files whose
+        stat signature differs. Returns ``(added, modified, deleted,
+        current hashes, current stats)``, the last two covering at least
+        every added and modified file.
+        """
+        journal = change_watcher.read_journal(self)
+        if journal is not None and self.snapshot_stats:
+            current, current_stats, previous = self.journaled_changes(set(journal) | set(extra_paths),
+                                                                      overlay)
+        else:
+            previous = CompactSnapshot()
+            previous_stats = previous.stats
+            if isinstance(self.snapshot, snapshot_format.BinarySnapshot):
+                for path, digest, signature in self.snapshot.iter_entries():
+                    previous[path], previous_stats[path] = digest, signature
+            else:
+                for path, digest in self.snapshot.items():
+                    previous[path] = digest
+                    if path in self.snapshot_stats:
+                        previous_stats[path] = self.snapshot_stats[path]
+            for path, record in overlay.items():
+                previous.pop(path, None)
+                if record is not None:
+                    previous[path], previous_stats[path] = record[0], record[1:]
+            current, current_stats = self.scan_directory(reference=(previous, previous_stats))
+        added = [path for path in current if path not in previous]
+        modified = [path for path in current if path in previous and previous[path] != current[path]]
+        deleted = [path for path in previous if path not in current]
+        return added, modified, deleted, current, current_stats
+
+    def _hash_entries(self, entries, reference, paranoid, state, stats, store=None, progress=None,
+                      on_hashed=None):
+        """Hash ``(rel_path, full_path, stat)`` entries into ``state``/``stats``
+
+        Walking and hashing overlap: this thread pulls entries from
+        ``entries`` (usually a live directory walk) and feeds a bounded
+        queue that the worker pool drains. Hashing starts with the first
+        file, and the pipeline holds at most a few tasks per worker no
+        matter how large the tree is.
+
+        Small files travel in multi-file batches to amortise task overhead.
+        Large files are single tasks in a priority queue keyed on size, so
+        workers always pick the biggest pending file first and a late huge
+        file can't leave the tail of the scan single-threaded. Files that
+        need reading are queued in disk order (see ``io_order``), window
+        by window. ``on_hashed(rel_path, digest)`` is called for every
+        file as its digest becomes known, with the results lock held.
+        """
+        ref_hashes, ref_stats = reference or ({}, {})
+        self._pending_trees = {}  # Only the trees of this scan are kept for saving
+        work = queue.PriorityQueue(maxsize=self.max_workers * PIPELINE_DEPTH_PER_WORKER)
+        sequence = itertools.count()  # FIFO among equal priorities
+        lock = threading.Lock()
+        self._file_count = 0
+        self._processed_count = 0
+        reused = 0
+        hashing = self.progress("hash")
+
+        def process_file(rel_path, full_path, size):
+            if store is not None and self._stores_blocks(size):
+                try:
+                    st = os.stat(full_path)
+                    return self._backup_file(store, rel_path, full_path, None), hashed_signature(st)
+                except (OSError, IOError):
+                    return None, None
+            if store is not None and size >= self.large_file_threshold:
+                # Tree hashing reads chunks in parallel, so store separately
+                file_hash, signature = self.hash_file_with_stat(full_path)
+                if file_hash:
+                    try:
+                        file_hash = store.add_file(rel_path, full_path, file_hash, self.digest_for)
+                    except (OSError, IOError):
+                        return None, None
+                return file_hash, signature
+            if store is not None:
+                try:
+                    file_hash, st = store.ingest(rel_path, full_path)
+                    return file_hash, hashed_signature(st)
+                except (OSError, IOError):
+                    return None, None
+            return self.hash_file_with_stat(full_path)
+
+        def worker():
+            try:
+                while (batch := work.get()[2]) is not None:
+                    results = []
+                    for rel_path, full_path, size in batch:
+                        try:
+                            file_hash, signature = process_file(rel_path, full_path, size)
+                        except Exception:
+                            file_hash, signature = None, None  # Silently skip problematic files
+                        results.append((rel_path, file_hash, signature))
+                    with lock:
+                        for rel_path, file_hash, signature in results:
+                            if file_hash:  # Only store if hash was successful
+                                state[rel_path] = file_hash
+                                stats[rel_path] = signature
+                                if progress is not None:
+                                    progress.record(rel_path, file_hash, signature)
+                                if on_hashed is not None:
+                                    on_hashed(rel_path, file_hash)
+                        before = self._processed_count
+                        self._processed_count += len(results)
+                        if self._processed_count // 100 > before // 100:
+                            print(f"Processed {self._processed_count}/{self._file_count} files...")
+                        hashing.report(self._processed_count)
+            except BaseException:
+                # Keep taking tasks up to the stop marker, so the walk never
+                # blocks on a queue nobody drains; the error is raised once
+                # the pool is done
+                while work.get()[2] is not None:
+                    pass
+                raise
+
+        def needing_reads():
+            nonlocal reused
+            for rel_path, full_path, st in entries:
+                # Stat fast path: unchanged signature means unchanged content
+                signature = stat_signature(st)
+                if (not paranoid and rel_path in ref_hashes
+                        and ref_stats.get(rel_path) == signature
+                        and (store is None or self._record_stored(store, rel_path,
+                                                                  ref_hashes[rel_path], st))):
+                    with lock:
+                        state[rel_path] = ref_hashes[rel_path]
+                        stats[rel_path] = signature
+                        if on_hashed is not None:
+                            on_hashed(rel_path, ref_hashes[rel_path])
+                    reused += 1
+                    continue
+                yield rel_path, full_path, st
+
+        key = disk_order.order_key(self.io_order)
+        ordered = disk_order.in_disk_order(
+            needing_reads(), key and (lambda entry: key(entry[1], entry[2].st_dev, entry[2].st_ino)))
+
+        # Use ThreadPoolExecutor for parallel file processing
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            workers = [executor.submit(worker) for _ in range(self.max_workers)]
+            batch, batch_bytes = [], 0
+            try:
+                for rel_path, full_path, st in ordered:
+                    with lock:
+                        self._file_count += 1
+                    if st.st_size >= SMALL_FILE_BYTES:
+                        # Blocks while workers catch up; biggest files go first
+                        work.put((-st.st_size, next(sequence), [(rel_path, full_path, st.st_size)]))
+                        continue
+                    batch.append((rel_path, full_path, st.st_size))
+                    batch_bytes += st.st_size
+                    if len(batch) >= BATCH_MAX_FILES or batch_bytes >= BATCH_MAX_BYTES:
+                        work.put((0, next(sequence), batch))
+                        batch, batch_bytes = [], 0
+                if batch:
+                    work.put((0, next(sequence), batch))
+            finally:
+                for _ in workers:
+                    work.put((math.inf, next(sequence), None))
+        for future in workers:
+            future.result()  # A failed worker dropped files: fail rather than report them deleted
+
+        hashing.finish(self._processed_count)
+        self.emit("counts", phase="hash", hashed=self._file_count, reused=reused)
+        if reused:
+            print(f"Reused {reused} unchanged files, hashed {self._file_count} files.")
+        else:
+            print(f"Hashed {self._file_count} files.")
+
+    def scan_directory(self, reference=None, paranoid=False):
+        """Use the fast scanning method"""
+        return self.scan_directory_fast(reference=reference, paranoid=paranoid)
+
+    def save_snapshot(self, single_pass_backup=False):
+        """Save snapshot with progress indication
+
+        With ``single_pass_backup`` every file is read once, feeding the
+        hasher and the backup store together, so backup_files is not needed.
+
+        Hashed files are logged as the scan goes (see scan_progress); if it
+        is interrupted, the next call resumes instead of starting over, and
+        until one completes load_snapshot refuses the old snapshot. Snapshot
+        files are replaced atomically and fsynced.
+        """
+        self.backup_dir.mkdir(parents=True, exist_ok=True)
+        self.checkpoints.clear()  # They belong to the previous session
+        self.stat_cache = None
+        print("Creating workspace snapshot...")
+        reference = None
+        if self.index:
+            self.index.load()
+            reference = self.index.reference()
+        progress = self._scan_progress()
+        resumed = progress.load()
+        if resumed:
+            print(f"Resuming an interrupted scan: {len(resumed[0])} files already hashed.")
+            if reference is None:
+                reference = resumed
+            else:
+                for path, digest in resumed[0].items():
+                    reference[0][path] = digest
+                    reference[1][path] = resumed[1][path]
+        progress.start(resume=resumed is not None)
+        store = None
+        if single_pass_backup:
+            print(f"Backing up to {self.backup_dir} while hashing...")
+            store = self.store = ObjectStore(self.backup_dir, FileCopier(self.copy_strategy),
+                                             self.compression, self.cache_hints)
+        try:
+            self.snapshot, self.snapshot_stats = self.scan_directory_fast(
+                reference=reference, store=store, progress=progress)
+        finally:
+            progress.close()  # Keep what was hashed if the scan didn't finish
+        if self.index:
+            self.index.update(self.snapshot, self.snapshot_stats)
+            self.index.save()
+        
+        print("Saving snapshot data...")
+        self._save_trees(digest for _, digest in self.snapshot.items())
+        replace_durably(self.snapshot_file, lambda tmp: snapshot_format.write_snapshot(
+            tmp, self.snapshot, self.snapshot_stats))
+        self._write_json(self.session_file, self.hash_settings(), indent=2)
+        print(f"Snapshot saved with {len(self.snapshot)} files.")
+        self.emit("counts", phase="snapshot", files=len(self.snapshot))
+        if store is not None:
+            self._finish_backup()
+        progress.discard()
+
+    def _scan_progress(self):
+        return ScanProgress(self.backup_dir, {"home": str(self.home), "settings": self.hash_settings()})
+
+    @staticmethod
+    def _write_json(path, data, **kwargs):
+        def write(tmp):
+            with open(tmp, 'w') as f:
+                json.dump(data, f, **kwargs)
+        replace_durably(path, write)
+
+    def _finish_backup(self):
+        self._save_trees(entry["digest"] for entry in self.store.manifest.values())
+        self.store.save_manifest()
+        pruned = self.store.prune()
+        self._prune_trees()
+        print(f"Backup complete! Backed up {len(self.store.manifest)} files.")
+        print(f"Backup store: {self.store.summary()}")
+        if pruned:
+            print(f"Removed {pruned} stale objects from earlier sessions.")
+
+    def export_snapshot_json(self, path=None):
+        """Write the current snapshot as JSON (the pre-binary format)"""
+        path = Path(path) if path else self.snapshot_json_file
+        data = {
+            "version": SNAPSHOT_VERSION,
+            "files": dict(self.snapshot.items()),
+            "stats": {rel_path: list(self.snapshot_stats[rel_path])
+                      for rel_path in self.snapshot if rel_path in self.snapshot_stats},
+        }
+        self._write_json(path, data, indent=2)
+        print(f"Snapshot exported to {path}.")
+
+    def _load_session_settings(self):
+        """Hash the way the snapshot was hashed, whatever we were started with"""
+        try:
+            with open(self.session_file, 'r') as f:
+                settings = json.load(f)
+        except (OSError, ValueError):
+            return
+        policy = settings.get("large_file_policy", self.large_file_policy)
+        threshold = settings.get("large_file_threshold", self.large_file_threshold)
+        if (policy, threshold) != (self.large_file_policy, self.large_file_threshold):
+            print(f"Using the snapshot's large file policy: {policy} (>= {threshold} bytes)")
+            self.large_file_policy, self.large_file_threshold = policy, threshold
+            if self.index:
+                self.index.settings = self.hash_settings()
+
+    def load_snapshot(self, path=None):
+        """Load snapshot with error handling
+
+        The format is detected from the file: binary snapshots are mapped
+        into memory, JSON ones (older sessions or exports) are parsed.
+        Raises SnapshotFormatError if there is no usable snapshot, rather
+        than carrying on with an empty one that would make every file look
+        added: when it is missing, unreadable or corrupt, or when the
+        session's scan was interrupted and has not been resumed.
+        """
+        if path is None:
+            if self._scan_progress().exists():
+                raise snapshot_format.SnapshotFormatError(
+                    "The session's snapshot scan was interrupted; run start_session.py again to finish it")
+            path = self.snapshot_file if self.snapshot_file.exists() else self.snapshot_json_file
+        self._load_session_settings()
+        self._sorted_snapshot = None
+        self.stat_cache = None
+        try:
+            if snapshot_format.is_binary_snapshot(path):
+                self.snapshot = snapshot_format.BinarySnapshot(path)
+                self.snapshot_stats = self.snapshot.stats
+                print(f"Loaded snapshot with {len(self.snapshot)} files.")
+                return
+            with open(path, 'r') as f:
+                data = json.load(f)
+            if "version" in data:
+                self.snapshot = CompactSnapshot(data["files"], data["stats"])
+                self.snapshot_stats = self.snapshot.stats
+            else:
+                # Version 1 snapshots are a bare path -> hash map
+                self.snapshot = CompactSnapshot(data)
+                self.snapshot_stats = {}
+            print(f"Loaded snapshot with {len(self.snapshot)} files.")
+        except FileNotFoundError as e:
+            raise snapshot_format.SnapshotFormatError(
+                f"No snapshot at {path}; start a session first") from e
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            self.snapshot = {}
+            self.snapshot_stats = {}
+            raise snapshot_format.SnapshotFormatError(f"Error loading snapshot {path}: {e}") from e
+
+    def backup_files(self):
+        """Backup files with progress indication
+
+        Files are stored from the worker pool, so compression (when
+        enabled) runs in parallel too.
+        """
+        if not self.snapshot:
+            print("No files to backup.")
+            return
+        
+        print(f"Backing up {len(self.snapshot)} files to {self.backup_dir}...")
+        backed_up = 0
+        backing_up = self.progress("backup", len(self.snapshot))
+        copier = FileCopier(self.copy_strategy)
+        self.store = ObjectStore(self.backup_dir, copier, self.compression, self.cache_hints)
+
+        def backup_one(item):
+            rel_path, file_hash = item
+            src = self.home / rel_path
+            # Smudged (racy) or since-modified files can't be trusted to
+            # still match the snapshot hash, so the store rehashes the copy
+            trusted = self.snapshot_stats.get(rel_path)
+            try:
+                if not src.exists():
+                    return False
+                if trusted is None or trusted != stat_signature(src.stat()):
+                    file_hash = None
+                self._backup_file(self.store, rel_path, src, file_hash)
+                return True
+            except (OSError, IOError, shutil.Error):
+                return False  # Skip problematic files
+
+        key = disk_order.order_key(self.io_order)
+
+        def disk_position(item):
+            signature = self.snapshot_stats.get(item[0])
+            return key(str(self.home / item[0]), 0, signature[2] if signature else 0)
+
+        items = disk_order.in_disk_order(self.snapshot.items(), key and disk_position)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # Bounded windows keep the number of pending futures small
+            while window := list(itertools.islice(items, self.max_workers * PIPELINE_DEPTH_PER_WORKER)):
+                for done in executor.map(backup_one, window):
+                    if done:
+                        backed_up += 1
+                        if backed_up % 50 == 0:
+                            print(f"Backed up {backed_up}/{len(self.snapshot)} files...")
+                        backing_up.report(backed_up)
+        
+        backing_up.finish(backed_up)
+        self.emit("counts", phase="backup", files=backed_up)
+        self._finish_backup()
+        print(f"Backup {copier.summary()}")
+
+    def begin_session(self, watch=False, single_pass=False):
+        """Snapshot and back up the workspace, as start_session.py does
+
+        With ``watch`` the change watcher starts first, so no write can slip
+        past both it and the scan.
+        """
+        if watch:
+            self.start_watcher()
+        if single_pass:
+            print("Creating snapshot and backup in one pass...")
+            self.save_snapshot(single_pass_backup=True)
+        else:
+            print("Creating snapshot...")
+            self.save_snapshot()
+
+            print("Creating backup...")
+            self.backup_files()
+
+    def session_settings(self):
+        """How snapshots are taken, as start_session.py reports it"""
+        return {
+            "max_depth": self.max_depth,
+            "max_workers": self.max_workers,
+            "storage_type": self.storage_type,
+            "walk_workers": self.walk_workers,
+            "io_order": self.io_order,
+            "backup_dir": str(self.backup_dir),
+            "compression": self.compression,
+            "index_file": str(self.index.index_file) if self.index else None,
+            "large_file_threshold": self.large_file_threshold,
+            "large_file_policy": self.large_file_policy,
+            "large_file_backup": self.large_file_backup,
+        }
+
+    def revert_changes(self, added, modified, deleted, keep=()):
+        """Undo every change whose path is not in ``keep``; returns RestoreResults"""
+        keep = set(keep)
+        plan = self.plan_restore(remove=[path for path in added if path not in keep],
+                                 restore=[path for path in list(modified) + list(deleted)
+                                          if path not in keep])
+        if not plan:
+            return []
+        print(f"Reverting {len(plan)} files...")
+        results = plan.execute()
+        for result in results:
+            if result.status == "failed":
+                self.emit("error", path=result.path, message=f"Could not {result.action}: {result.detail}")
+        self.emit("counts", phase="restore", **Counter(result.status for result in results))
+        return results
+
+    def end_session(self):
+        """Stop the watcher and forget the session's checkpoints"""
+        self.stop_watcher()
+        self.checkpoints.clear()
+
+    def start_watcher(self):
+        """Start the inotify change journal; call before save_snapshot"""
+        return change_watcher.start_watcher(self)
+
+    def stop_watcher(self):
+        change_watcher.stop_watcher(self)
+
+    def detect_changes(self, paranoid=False):
+        """Fast change detection with progress indication
+
+        Only files whose stat signature differs from the snapshot are
+        rehashed; pass ``paranoid=True`` to rehash every file. When a change
+        watcher is running, only the paths it journaled are verified and the
+        rest of the tree is never visited. Otherwise the whole tree is
+        scanned and compared with the snapshot. ``changed_directories``
+        lists the directories directly containing changes afterwards.
+        """
+        print("Detecting changes...")
+        reference = self.stat_cache or (self.snapshot, self.snapshot_stats)
+        journal = None if paranoid else change_watcher.read_journal(self)
+        if journal is not None and self.snapshot_stats:
+            # The index keeps its start-of-session entries; files changed
+            # since then fail their stat check and are rehashed next time
+            current, _, previous = self.journaled_changes(journal)
+        else:
+            current, current_stats = self.scan_directory(reference=reference, paranoid=paranoid)
+            self._remember_rescan(current, current_stats)
+            previous = self.snapshot
+        added, modified, deleted = [], [], []
+
+        # Find added and modified files
+        for path, hash_val in current.items():
+            if path not in previous:
+                added.append(path)
+            elif previous[path] != hash_val:
+                modified.append(path)
+
+        # Find deleted files
+        for path in previous:
+            if path not in current:
+                deleted.append(path)
+
+        self.changed_directories = sorted({path.rpartition("/")[0] for path in added + modified + deleted})
+        print(f"Changes detected - Added: {len(added)}, Modified: {len(modified)}, Deleted: {len(deleted)}")
+        self.emit("changes", added=added, modified=modified, deleted=deleted)
+        if self.changed_directories:
+            print(f"Changes are in {len(self.changed_directories)} directories.")
+        return added, modified, deleted
+
+    def iter_changes(self, paranoid=False):
+        """Yield ``(kind, path, old_digest, new_digest)`` for each change as it is found
+
+        ``kind`` is "added", "modified" or "deleted"; ``old_digest`` is None
+        for added files and ``new_digest`` for deleted ones. Added and
+        modified files come out while the rescan runs, in the order their
+        hashes finish; deletions follow once the whole tree has been
+        walked. With a change watcher running only the journaled paths
+        are checked, as in detect_changes. Closing the generator early
+        stops the rescan.
+        """
+        journal = None if paranoid else change_watcher.read_journal(self)
+        if journal is not None and self.snapshot_stats:
+            current, _, previous = self.journaled_changes(journal)
+            for path, digest in current.items():
+                if previous.get(path) != digest:
+                    yield ("added" if path not in previous else "modified"), path, previous.get(path), digest
+            for path, digest in previous.items():
+                if path not in current:
+                    yield "deleted", path, digest, None
+            return
+
+        reference = self.stat_cache or (self.snapshot, self.snapshot_stats)
+        snapshot = self.snapshot
+        current = CompactSnapshot()
+        current_stats = current.stats
+        found = queue.Queue(maxsize=CHANGE_QUEUE_SIZE)
+        stopped = threading.Event()
+        done = object()
+
+        def put(item):
+            while not stopped.is_set():
+                try:
+                    found.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass  # The consumer is busy; hashing waits for it
+
+        def hashed(rel_path, digest):
+            old_digest = snapshot.get(rel_path)
+            if old_digest != digest:
+                put(("added" if old_digest is None else "modified", rel_path, old_digest, digest))
+
+        def entries():
+            for entry in self.iter_workspace_files():
+                if stopped.is_set():
+                    return
+                yield entry
+
+        def scan():
+            try:
+                print(f"Scanning workspace (max depth: {self.max_depth})...")
+                self._hash_entries(entries(), reference, paranoid, current, current_stats,
+                                   on_hashed=hashed)
+            except BaseException as e:
+                put(e)
+            finally:
+                put(done)
+
+        scanner = threading.Thread(target=scan, daemon=True)
+        scanner.start()
+        try:
+            while (item := found.get()) is not done:
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            stopped.set()
+            scanner.join()
+
+        self._remember_rescan(current, current_stats)
+        for path, digest in snapshot.items():
+            if path not in current:
+                yield "deleted", path, digest, None
+
+    def _remember_rescan(self, current, current_stats):
+        """Keep a full rescan's stat data for the next one"""
+        self.stat_cache = (current, current_stats)
+        if self.index:
+            # Restored files get a new inode/ctime, so they are rehashed next time
+            self.index.update(current, current_stats)
+            self.index.save()
+
+    def checkpoint(self, name):
+        """Save the workspace as checkpoint ``name``, relative to the current one
+
+        Only files changed since the current checkpoint (or the session
+        start) are backed up and recorded, so with a change watcher the
+        cost follows what was touched, not the size of the workspace.
+        Returns the number of changed paths recorded.
+        """
+        log = self.checkpoints
+        log.validate(name)
+        parent = log.head()
+        overlay, _ = log.overlay(parent)
+        print(f"Creating checkpoint '{name}' (since {parent or 'session start'})...")
+        added, modified, deleted, current, current_stats = self.changes_since(overlay, overlay.keys())
+
+        store = ObjectStore(self.backup_dir, FileCopier(self.copy_strategy), self.compression,
+                            self.cache_hints)
+        files = {rel_path: None for rel_path in deleted}
+        failed = []
+
+        def save_one(rel_path):
+            src = self.home / rel_path
+            signature = current_stats[rel_path]
+            try:
+                # Trust the fresh hash only if the file hasn't moved on since
+                unchanged = stat_signature(os.stat(src)) == signature
+                digest = self._backup_file(store, rel_path, src, current[rel_path] if unchanged else None)
+            except (OSError, IOError, shutil.Error):
+                failed.append(rel_path)
+                return
+            if not unchanged:
+                signature = (-1,) + tuple(signature[1:])  # Rehash on the next comparison
+            files[rel_path] = [digest, *signature]
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            list(executor.map(save_one, added + modified))
+        self._save_trees(entry["digest"] for entry in store.manifest.values())
+        log.save(name, parent, files, store.manifest)
+        log.set_head(name)
+        print(f"Checkpoint '{name}' saved - Added: {len(added)}, Modified: {len(modified)}, "
+              f"Deleted: {len(deleted)} ({store.summary()})")
+        if failed:
+            print(f"Warning: {len(failed)} files could not be backed up and keep their "
+                  f"earlier version in this checkpoint: {', '.join(sorted(failed)[:5])}")
+        return len(files)
+
+    def rollback(self, name=None):
+        """Put the workspace back to checkpoint ``name`` (None: the session start)
+
+        Any checkpoint can be the target, including ones taken after the
+        current one. Returns the RestoreResult of every file touched.
+        """
+        log = self.checkpoints
+        name = name or ""
+        overlay, manifest = log.overlay(name)
+        target = f"checkpoint '{name}'" if name else "the session start"
+        print(f"Rolling back to {target}...")
+        added, modified, deleted, _, _ = self.changes_since(overlay, log.touched_paths())
+
+        # Restore through the session manifest with the checkpoint's entries on top
+        self.store = None
+        self.open_store().manifest.update(manifest)
+        try:
+            results = self.plan_restore(remove=added, restore=modified + deleted).execute()
+        finally:
+            self.store = None
+        log.set_head(name)
+        return results
+
+    def open_store(self):
+        """The backup store with its manifest loaded, for restores"""
+        if self.store is None:
+            self.store = ObjectStore(self.backup_dir, FileCopier(self.copy_strategy))
+            self.store.load_manifest()
+        return self.store
+
+    def restore_path(self, rel_path):
+        """Restore one file from the backup, replacing it atomically
+
+        Returns "restored", "patched" (only changed blocks rewritten) or
+        "missing" when there is no backup of ``rel_path``; raises OSError
+        if the restore fails. The parent directory must exist.
+        """
+        store = self.open_store()
+        target_file = self.home / rel_path
+        if rel_path in store.manifest:
+            if self._restore_changed_blocks(rel_path, target_file):
+                return "patched"
+            return "restored" if store.restore(rel_path, target_file) else "missing"
+        backup_file = self.backup_dir / rel_path  # Pre-object-store layout
+        if backup_file.exists():
+            replace_atomically(target_file, lambda tmp: store.copier.copy(backup_file, tmp))
+            return "restored"
+        return "missing"
+
+    def restore_file(self, rel_path):
+        """Restore file with error handling"""
+        try:
+            (self.home / rel_path).parent.mkdir(parents=True, exist_ok=True)
+            return self.restore_path(rel_path) != "missing"
+        except (OSError, IOError, shutil.Error):
+            return False
+
+    def _restore_changed_blocks(self, rel_path, target_file):
+        """Patch a large file from its block digests instead of copying it
+
+        Compares the target's current chunk digests with those taken at
+        snapshot time and rewrites only the chunks that differ. The patch goes
+        to a reflink clone of the target, or where the filesystem can't
+        clone, to a copy of it, which is then renamed over the target. Only
+        with ``patch_in_place`` is a target without reflinks patched where
+        it is; a repeated restore then completes an interrupted one.
+        Returns False when the file isn't large or has no recorded chunk
+        digests, leaving the caller to copy it whole.
+        """
+        entry = self.store.manifest[rel_path]
+        tree = self.store.block_digests(rel_path)
+        if tree is None:
+            if entry.get("size", 0) < self.large_file_threshold or not self.store.has(entry["digest"]):
+                return False
+            tree = self.load_tree(entry["digest"])
+            if tree is None:
+                return False
+        elif not all(self.store.has(block.hex()) for block in tree):
+            return False
+
+        try:
+            with open(target_file, 'rb') as f:
+                if not stat_module.S_ISREG(os.fstat(f.fileno()).st_mode):
+                    return False
+        except (OSError, IOError):
+            return False  # Missing: nothing to patch, copy it whole
+
+        def patch(path):
+            with open(path, 'rb') as f:
+                chunks = self.hash_chunks(f.fileno(), os.fstat(f.fileno()).st_size)
+            current = [chunks[i:i + 16] for i in range(0, len(chunks), 16)]
+            return self.store.restore_blocks(rel_path, path, current, tree, TREE_CHUNK_SIZE)
+
+        def patch_copy(tmp):
+            if not self.store.copier.clone(target_file, tmp):
+                if self.patch_in_place:
+                    raise _CloneUnsupported
+                self.store.copier.copy(target_file, tmp)
+            return patch(tmp)
+
+        try:
+            written = replace_atomically(target_file, patch_copy)
+        except _CloneUnsupported:
+            written = patch(target_file)
+        print(f"Restored {rel_path} by rewriting {format_bytes(written)} "
+              f"of {format_bytes(entry.get('size', written))}.")
+        return True
+
+    def plan_restore(self, remove=(), restore=()):
+        """A RestorePlan deleting ``remove`` and restoring ``restore``"""
+        return RestorePlan(self, remove, restore)
+
+    def remove_file(self, rel_path):
+        """Remove file with error handling"""
+        target_file = self.home / rel_path
+        try:
+            if target_file.exists():
+                target_file.unlink()
+                return True
+        except (OSError, IOError):
+            pass
+        return False
@@ -0,0 +1,231 @@
+"""Compact binary snapshot format, loaded through mmap.
+
+Layout (all integers little-endian):
+
+    header      magic, version, digest size, hash algorithm name, entry
+                count and the offset of each section below
+    offsets     (count + 1) uint64 offsets into the path blob
+    paths       UTF-8 paths (surrogate-escaped), sorted bytewise, no separators
+    digests     count * digest_size raw digest bytes
+    stats       count * 4 int64: size, mtime_ns, inode, ctime_ns
+
+The writer streams each section straight to disk and patches the header
+at the end. The reader maps the file and binary-searches the sorted path
+table, so opening a snapshot costs the same whether it has a hundred
+entries or ten million. Version 2 files, which add a directory table after
+the file table, still load; their directory table is ignored.
+"""
+import mmap
+import struct
+import sys
+from array import array
+from collections.abc import ItemsView, Mapping
+
+MAGIC = b"SWSNAPB\0"
+FORMAT_VERSION = 1
+READABLE_VERSIONS = (1, 2)
+HASH_ALGORITHM = "md5"
+DIGEST_SIZE = 16
+
+HEADER = struct.Struct("<8sHH16sQQQQQ")
+STAT_ENTRY = struct.Struct("<4q")
+MISSING_STAT = (-1, 0, 0, 0)  # Never equals a real signature, forcing a rehash
+
+
+class SnapshotFormatError(ValueError):
+    """The file is not a binary snapshot this version can read"""
+
+
+def _encode(path):
+    return path.encode("utf-8", "surrogateescape")
+
+
+def is_binary_snapshot(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def write_snapshot(path, hashes, stats):
+    """Stream ``hashes``/``stats`` (path -> hex digest / signature) to ``path``"""
+    keys = sorted(hashes, key=_encode)
+    with open(path, "wb") as f:
+        f.write(b"\0" * HEADER.size)  # Patched once section offsets are known
+
+        path_offset = f.tell()
+        offsets = array("Q", [0])
+        position = 0
+        for key in keys:
+            encoded = _encode(key)
+            f.write(encoded)
+            position += len(encoded)
+            offsets.append(position)
+
+        offsets_offset = f.tell()
+        if sys.byteorder == "big":
+            offsets.byteswap()
+        offsets.tofile(f)
+
+        digest_offset = f.tell()
+        for key in keys:
+            digest = bytes.fromhex(hashes[key])
+            if len(digest) != DIGEST_SIZE:
+                raise SnapshotFormatError(f"Unexpected digest size for {key}")
+            f.write(digest)
+
+        stat_offset = f.tell()
+        for key in keys:
+            f.write(STAT_ENTRY.pack(*(stats.get(key) or MISSING_STAT)))
+
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, DIGEST_SIZE,
+                            HASH_ALGORITHM.encode().ljust(16, b"\0"), len(keys),
+                            offsets_offset, path_offset, digest_offset, stat_offset))
+
+
+class BinarySnapshot(Mapping):
+    """Read-only path -> hex digest mapping backed by an mmapped snapshot"""
+
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # Empty file
+            self._file.close()
+            raise SnapshotFormatError(f"{path} is empty")
+        if len(self._map) < HEADER.size:
+            self.close()
+            raise SnapshotFormatError(f"{path} is truncated")
+        (magic, version, digest_size, algorithm, self._count, self._offsets_at,
+         self._paths_at, self._digests_at, self._stats_at) = HEADER.unpack_from(self._map, 0)
+        self.algorithm = algorithm.rstrip(b"\0").decode()
+        if magic != MAGIC or version not in READABLE_VERSIONS:
+            self.close()
+            raise SnapshotFormatError(f"{path} is not a version {FORMAT_VERSION} binary snapshot")
+        if self.algorithm != HASH_ALGORITHM or digest_size != DIGEST_SIZE:
+            self.close()
+            raise SnapshotFormatError(f"{path} uses {self.algorithm}, expected {HASH_ALGORITHM}")
+        if self._stats_at + self._count * STAT_ENTRY.size > len(self._map):
+            self.close()
+            raise SnapshotFormatError(f"{path} is truncated")
+        self.stats = _StatView(self)
+
+    def close(self):
+        if getattr(self, "_map", None) is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def _offset(self, index):
+        return struct.unpack_from("<Q", self._map, self._offsets_at + 8 * index)[0]
+
+    def _path_bytes(self, index):
+        start = self._paths_at + self._offset(index)
+        end = self._paths_at + self._offset(index + 1)
+        return self._map[start:end]
+
+    def _lower_bound(self, target):
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._path_bytes(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find(self, path):
+        """Index of ``path`` in the sorted table, or -1"""
+        target = _encode(path)
+        index = self._lower_bound(target)
+        if index < self._count and self._path_bytes(index) == target:
+            return index
+        return -1
+
+    def prefix_range(self, prefix):
+        """``(start, end)`` indexes of the paths starting with ``prefix``"""
+        encoded = _encode(prefix)
+        start = self._lower_bound(encoded)
+        if not encoded:
+            return start, self._count
+        # The smallest byte string greater than every string with the prefix
+        end = encoded.rstrip(b"\xff")
+        end = end[:-1] + bytes([end[-1] + 1]) if end else None
+        return start, self._lower_bound(end) if end else self._count
+
+    def iter_under(self, rel_path):
+        """(path, hex digest, stat) for ``rel_path`` and everything below it"""
+        index = self.find(rel_path)
+        if index >= 0:
+            yield rel_path, self.digest_at(index), self.stat_at(index)
+        start, end = self.prefix_range(rel_path + "/" if rel_path else "")
+        for index in range(start, end):
+            yield self.path_at(index), self.digest_at(index), self.stat_at(index)
+
+    def digest_at(self, index):
+        start = self._digests_at + index * DIGEST_SIZE
+        return self._map[start:start + DIGEST_SIZE].hex()
+
+    def stat_at(self, index):
+        return STAT_ENTRY.unpack_from(self._map, self._stats_at + index * STAT_ENTRY.size)
+
+    def path_at(self, index):
+        return self._path_bytes(index).decode("utf-8", "surrogateescape")
+
+    def __getitem__(self, path):
+        index = self.find(path)
+        if index < 0:
+            raise KeyError(path)
+        return self.digest_at(index)
+
+    def __contains__(self, path):
+        return isinstance(path, str) and self.find(path) >= 0
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        for index in range(self._count):
+            yield self.path_at(index)
+
+    def items(self):
+        return _ItemsView(self)
+
+    def iter_items(self):
+        """(path, hex digest) pairs in table order without per-key searches"""
+        for index in range(self._count):
+            yield self.path_at(index), self.digest_at(index)
+
+    def iter_entries(self):
+        """(path, hex digest, stat) triples in table order"""
+        for index in range(self._count):
+            yield self.path_at(index), self.digest_at(index), self.stat_at(index)
+
+
+class _ItemsView(ItemsView):
+    def __iter__(self):
+        return self._mapping.iter_items()
+
+
+class _StatView(Mapping):
+    """path -> stat signature view over a BinarySnapshot"""
+
+    def __init__(self, snapshot):
+        self._snapshot = snapshot
+
+    def __getitem__(self, path):
+        index = self._snapshot.find(path)
+        if index < 0:
+            raise KeyError(path)
+        return self._snapshot.stat_at(index)
+
+    def __contains__(self, path):
+        return path in self._snapshot
+
+    def __len__(self):
+        return len(self._snapshot)
+
+    def __iter__(self):
+        return iter(self._snapshot)
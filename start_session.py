@@ -1,28 +1,114 @@
-from secure_workspace import SecureWorkspace
-import time
-
-def main():
-    print("Initializing Secure Workspace (Optimized)...")
-    start_time = time.time()
-    
-    sw = SecureWorkspace(max_depth=3, max_workers=4)
-    
-    print("Creating snapshot...")
-    sw.save_snapshot()
-    
-    print("Creating backup...")
-    sw.backup_files()
-    
-    end_time = time.time()
-    duration = end_time - start_time
-    
-    print(f"Secure session started successfully in {duration:.2f} seconds!")
-    print("You may now work freely in your workspace.")
-    print("\nPerformance settings:")
-    print(f"- Scanning depth: {sw.max_depth} levels from home directory")
-    print(f"- Parallel threads: {sw.max_workers}")
-    print("- Large files (>100MB) are automatically skipped")
-    print("- System directories are excluded for speed")
-
-if __name__ == "__main__":
-    main()
+from secure_workspace import SecureWorkspace
+import workspace_daemon
+import workspace_events
+import argparse
+import sys
+import time
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Start a secure workspace session")
+    parser.add_argument("--no-index", action="store_true",
+                        help="ignore the persistent hash index and hash every file")
+    parser.add_argument("--watch", action="store_true",
+                        help="journal changed paths with inotify so stopping skips the full rescan")
+    parser.add_argument("--backup-dir",
+                        help="where to keep backups (default: $SECURE_WORKSPACE_BACKUP_DIR or the temp dir); "
+                             "put it on the same filesystem as home for reflink backups")
+    parser.add_argument("--copy-strategy", default="auto",
+                        choices=["auto", "reflink", "copy_file_range", "copy"],
+                        help="first backup copy strategy to try")
+    parser.add_argument("--single-pass", action="store_true",
+                        help="back up each file in the same read that hashes it "
+                             "(best when reflinks are not available)")
+    parser.add_argument("--workers", type=int,
+                        help="hashing threads (default: sized from CPU count and storage type)")
+    parser.add_argument("--walk-workers", type=int,
+                        help="threads listing directories (default: 16 on network filesystems, "
+                             "1 on spinning disks, otherwise up to 8 by CPU count)")
+    parser.add_argument("--large-files", default="track", choices=["track", "stat-only", "skip"],
+                        help="large files: hash as parallel chunk trees, compare by metadata only, or ignore")
+    parser.add_argument("--large-file-mb", type=int, default=100,
+                        help="size at which the large file policy applies (default: 100)")
+    parser.add_argument("--large-file-backup", default="blocks", choices=["blocks", "whole"],
+                        help="back up tracked large files as deduplicated 4 MB blocks, "
+                             "or copy them whole (cheap with reflinks)")
+    parser.add_argument("--compress", choices=["zlib", "lzma"],
+                        help="compress backup objects (worth it when the backup dir is on tmpfs); "
+                             "already-compressed files are stored as they are")
+    parser.add_argument("--io-order", default="auto", choices=["auto", "none", "inode", "extent"],
+                        help="order file reads by inode or physical extent "
+                             "(default: extent on spinning disks, none on SSDs, inode otherwise)")
+    parser.add_argument("--no-cache-hints", action="store_true",
+                        help="don't fadvise reads or drop hashed files from the page cache")
+    parser.add_argument("--export-json", action="store_true",
+                        help="also write the snapshot as snapshot.json for other tools")
+    parser.add_argument("--no-daemon", action="store_true",
+                        help="run in this process even if workspace_daemon.py is running")
+    parser.add_argument("--events", action="store_true",
+                        help="write progress, counts, changes and errors as JSON lines on stdout "
+                             "(see workspace_events.py)")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    on_event = None
+    if args.events:
+        on_event = workspace_events.JsonLinesSink(sys.stdout)
+        sys.stdout = workspace_events.PrintedLines(on_event)  # Printed lines become log events
+    print("Initializing Secure Workspace (Optimized)...")
+    start_time = time.time()
+
+    options = dict(max_depth=3, max_workers=args.workers, use_index=not args.no_index,
+                   copy_strategy=args.copy_strategy, large_file_policy=args.large_files,
+                   large_file_threshold=args.large_file_mb * 1024 * 1024,
+                   large_file_backup=args.large_file_backup, compression=args.compress,
+                   io_order=args.io_order, cache_hints=not args.no_cache_hints,
+                   walk_workers=args.walk_workers)
+    client = None if args.no_daemon else workspace_daemon.connect(args.backup_dir)
+
+    try:
+        if client is not None:
+            print("Starting the session in the running daemon...")
+            settings = client.call("start", on_event=on_event, options=options, watch=args.watch,
+                                   single_pass=args.single_pass, export_json=args.export_json)["settings"]
+        else:
+            sw = SecureWorkspace(backup_dir=args.backup_dir, on_event=on_event, **options)
+            sw.begin_session(watch=args.watch, single_pass=args.single_pass)
+            if args.export_json:
+                sw.export_snapshot_json()
+            settings = sw.session_settings()
+    except KeyboardInterrupt:
+        if client is not None:
+            print("\nInterrupted. The daemon carries on starting the session.")
+        else:
+            print("\nInterrupted. Run start_session.py again to resume where the scan stopped.")
+        sys.exit(130)
+    except workspace_daemon.DaemonError as e:
+        print(f"Error: {e}")
+        if on_event is not None:
+            on_event(workspace_events.event("error", message=str(e)))
+        sys.exit(1)
+    
+    end_time = time.time()
+    duration = end_time - start_time
+    
+    print(f"Secure session started successfully in {duration:.2f} seconds!")
+    print("You may now work freely in your workspace.")
+    print_settings(settings)
+
+def print_settings(settings):
+    print("\nPerformance settings:")
+    print(f"- Scanning depth: {settings['max_depth']} levels from home directory")
+    print(f"- Parallel threads: {settings['max_workers']} ({settings['storage_type']} storage), "
+          f"{settings['walk_workers']} listing directories")
+    print(f"- Read order: {settings['io_order']}")
+    compressed = f" ({settings['compression']} compressed)" if settings['compression'] else ""
+    print(f"- Backup directory: {settings['backup_dir']}{compressed}")
+    if settings['index_file']:
+        print(f"- Hash index: {settings['index_file']}")
+    print(f"- Large files (>={settings['large_file_threshold'] // (1024 * 1024)}MB): "
+          f"{settings['large_file_policy']}, backed up as {settings['large_file_backup']}")
+    print("- System directories are excluded for speed")
+
+if __name__ == "__main__":
+    main()
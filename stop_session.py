@@ -1,61 +1,129 @@
-from secure_workspace import SecureWorkspace
-import os
-
-CHOICE_FILE = "user_choices.txt"
-
-def load_user_choices():
-    if not os.path.exists(CHOICE_FILE):
-        return set()
-    with open(CHOICE_FILE, "r") as f:
-        content = f.read().strip()
-    if content.lower() == "all":
-        return "all"
-    elif content.lower() == "none":
-        return set()
-    else:
-        try:
-            indices = [int(x.strip()) - 1 for x in content.split(",") if x.strip().isdigit()]
-            return set(indices)
-        except:
-            return set()
-
-def apply_decision(files, keep_indices):
-    keep = set()
-    if keep_indices == "all":
-        return set(files)
-    for i in keep_indices:
-        if 0 <= i < len(files):
-            keep.add(files[i])
-    return keep
-
-def main():
-    print("Stopping Secure Workspace...")
-    sw = SecureWorkspace()
-    sw.load_snapshot()
-
-    added, modified, deleted = sw.detect_changes()
-
-    keep_added = apply_decision(added, load_user_choices()) if added else set()
-    keep_modified = apply_decision(modified, load_user_choices()) if modified else set()
-    skip_deleted = apply_decision(deleted, load_user_choices()) if deleted else set()
-
-    for f in added:
-        if f not in keep_added:
-            sw.remove_file(f)
-
-    for f in modified:
-        if f not in keep_modified:
-            sw.restore_file(f)
-
-    for f in deleted:
-        if f not in skip_deleted:
-            sw.restore_file(f)
-
-    # Cleanup
-    if os.path.exists(CHOICE_FILE):
-        os.remove(CHOICE_FILE)
-
-    print("\nSession cleaned up. Goodbye!")
-
-if __name__ == "__main__":
-    main()
+from secure_workspace import SecureWorkspace
+from restore_plan import RestoreResult, summarize
+from snapshot_format import SnapshotFormatError
+import workspace_daemon
+import workspace_events
+import argparse
+import json
+import os
+import sys
+
+CHOICE_FILE = "user_choices.txt"
+
+def load_user_choices():
+    if not os.path.exists(CHOICE_FILE):
+        return set()
+    with open(CHOICE_FILE, "r") as f:
+        content = f.read().strip()
+    if content.lower() == "all":
+        return "all"
+    elif content.lower() == "none":
+        return set()
+    else:
+        try:
+            indices = [int(x.strip()) - 1 for x in content.split(",") if x.strip().isdigit()]
+            return set(indices)
+        except:
+            return set()
+
+def apply_decision(files, keep_indices):
+    keep = set()
+    if keep_indices == "all":
+        return set(files)
+    for i in keep_indices:
+        if 0 <= i < len(files):
+            keep.add(files[i])
+    return keep
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Stop a secure workspace session")
+    parser.add_argument("--paranoid", action="store_true",
+                        help="rehash every file instead of trusting unchanged stat data")
+    parser.add_argument("--backup-dir",
+                        help="backup directory used by start_session.py "
+                             "(default: $SECURE_WORKSPACE_BACKUP_DIR or the temp dir)")
+    parser.add_argument("--walk-workers", type=int,
+                        help="threads listing directories (default: 16 on network filesystems, "
+                             "1 on spinning disks, otherwise up to 8 by CPU count)")
+    parser.add_argument("--io-order", default="auto", choices=["auto", "none", "inode", "extent"],
+                        help="order file reads by inode or physical extent "
+                             "(default: extent on spinning disks, none on SSDs, inode otherwise)")
+    parser.add_argument("--no-cache-hints", action="store_true",
+                        help="don't fadvise reads or drop hashed files from the page cache")
+    parser.add_argument("--patch-in-place", action="store_true",
+                        help="where reflinks are unavailable, patch large files in place instead of "
+                             "a copy (less I/O, but an interrupted stop leaves them half restored)")
+    parser.add_argument("--no-daemon", action="store_true",
+                        help="run in this process even if workspace_daemon.py is running")
+    parser.add_argument("--events", action="store_true",
+                        help="write progress, counts, changes and errors as JSON lines on stdout "
+                             "(see workspace_events.py)")
+    parser.add_argument("--keep-from-stdin", action="store_true",
+                        help="after detecting changes, read the paths to keep as one JSON list "
+                             "on stdin instead of from user_choices.txt (end of input keeps all)")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    on_event = None
+    if args.events:
+        on_event = workspace_events.JsonLinesSink(sys.stdout)
+        sys.stdout = workspace_events.PrintedLines(on_event)  # Printed lines become log events
+    print("Stopping Secure Workspace...")
+    options = dict(io_order=args.io_order, cache_hints=not args.no_cache_hints,
+                   walk_workers=args.walk_workers)
+    client = None if args.no_daemon else workspace_daemon.connect(args.backup_dir)
+    try:
+        if client is not None:
+            changes = client.call("detect", on_event=on_event, options=options, paranoid=args.paranoid)
+            added, modified, deleted = changes["added"], changes["modified"], changes["deleted"]
+        else:
+            sw = SecureWorkspace(backup_dir=args.backup_dir, on_event=on_event,
+                                 patch_in_place=args.patch_in_place, **options)
+            sw.load_snapshot()
+            added, modified, deleted = sw.detect_changes(paranoid=args.paranoid)
+    except (SnapshotFormatError, workspace_daemon.DaemonError) as e:
+        # Comparing against no snapshot would revert every file as "added"
+        print(f"Error: {e}")
+        print("Nothing was changed.")
+        if on_event is not None:
+            on_event(workspace_events.event("error", message=str(e)))
+        sys.exit(1)
+
+    if args.keep_from_stdin:
+        sys.stdout.flush()  # The caller decides once it has seen the changes event
+        line = sys.stdin.readline()
+        keep = set(json.loads(line)) if line.strip() else set(added) | set(modified) | set(deleted)
+    else:
+        keep = set()
+        keep |= apply_decision(added, load_user_choices()) if added else set()
+        keep |= apply_decision(modified, load_user_choices()) if modified else set()
+        keep |= apply_decision(deleted, load_user_choices()) if deleted else set()
+
+    if client is not None:
+        try:
+            outcome = client.call("stop", on_event=on_event, keep=sorted(keep), changes=changes,
+                                  patch_in_place=args.patch_in_place)
+        except workspace_daemon.DaemonError as e:
+            print(f"Error: {e}")
+            if on_event is not None:
+                on_event(workspace_events.event("error", message=str(e)))
+            sys.exit(1)
+        results = [RestoreResult(**result) for result in outcome["results"]]
+    else:
+        results = sw.revert_changes(added, modified, deleted, keep)
+        sw.end_session()
+    if results:
+        for result in results:
+            if result.status == "failed" or (result.action == "restore" and result.status == "missing"):
+                print(f"- {result.action} {result.path}: {result.status} {result.detail}".rstrip())
+        print(f"Revert complete: {summarize(results)}.")
+
+    # Cleanup
+    if os.path.exists(CHOICE_FILE):
+        os.remove(CHOICE_FILE)
+
+    print("\nSession cleaned up. Goodbye!")
+
+if __name__ == "__main__":
+    main()
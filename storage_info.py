@@ -0,0 +1,97 @@
+"""Best-effort detection of the storage behind a path, for sizing I/O work."""
+import os
+
+NETWORK_FILESYSTEMS = {
+    "nfs", "nfs4", "cifs", "smb3", "smbfs", "fuse.sshfs", "sshfs", "9p",
+    "ceph", "fuse.ceph", "glusterfs", "fuse.glusterfs", "lustre", "afs",
+    "fuse.rclone", "davfs", "fuse.davfs2",
+}
+
+
+def filesystem_type(path):
+    """fstype of the mount containing ``path`` (Linux), or None"""
+    path = os.path.realpath(path)
+    best, best_type = "", None
+    try:
+        with open("/proc/self/mountinfo", "r") as f:
+            for line in f:
+                fields = line.split()
+                if "-" not in fields:
+                    continue
+                mount_point = fields[4].replace("\\040", " ")
+                fstype = fields[fields.index("-") + 1]
+                inside = path == mount_point or path.startswith(mount_point.rstrip("/") + "/")
+                if inside and len(mount_point) >= len(best):
+                    best, best_type = mount_point, fstype
+    except OSError:
+        return None
+    return best_type
+
+
+def is_rotational(path):
+    """True for spinning disks, False for SSDs, None if unknown"""
+    try:
+        st = os.stat(path)
+        device = os.path.realpath(f"/sys/dev/block/{os.major(st.st_dev)}:{os.minor(st.st_dev)}")
+    except OSError:
+        return None
+    # Partitions don't have a queue directory of their own; their disk does
+    for candidate in (device, os.path.dirname(device)):
+        try:
+            with open(os.path.join(candidate, "queue", "rotational"), "r") as f:
+                return f.read().strip() == "1"
+        except OSError:
+            continue
+    return None
+
+
+def storage_type(path):
+    """Classify ``path`` as network, hdd, ssd or unknown"""
+    if filesystem_type(path) in NETWORK_FILESYSTEMS:
+        return "network"
+    rotational = is_rotational(path)
+    if rotational is None:
+        return "unknown"
+    return "hdd" if rotational else "ssd"
+
+
+def cpu_count():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def default_worker_count(path):
+    """Hashing threads to use for ``path``: returns (count, storage type)
+
+    Spinning disks get few threads because concurrent readers turn
+    sequential reads into seeks; network filesystems get many because each
+    read mostly waits on round trips; local SSDs scale with the CPUs that
+    do the hashing.
+    """
+    kind = storage_type(path)
+    cpus = cpu_count()
+    if kind == "hdd":
+        count = 2
+    elif kind == "network":
+        count = min(32, max(8, cpus * 4))
+    elif kind == "ssd":
+        count = min(32, max(4, cpus * 2))
+    else:
+        count = min(16, max(4, cpus))
+    return count, kind
+
+
+def default_walk_workers(kind):
+    """Directory listing threads for storage of type ``kind``
+
+    Listing is mostly waiting on readdir and stat, so network filesystems
+    get many threads; a spinning disk gets one, as parallel listings
+    would only make it seek.
+    """
+    if kind == "hdd":
+        return 1
+    if kind == "network":
+        return 16
+    return min(8, max(2, cpu_count()))
@@ -0,0 +1,22 @@
+"""The backup directory is never part of the workspace it backs up"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from secure_workspace import SecureWorkspace  # noqa: E402
+
+
+def test_relative_backup_dir_inside_home(tmp_path, monkeypatch):
+    for i in range(5):
+        (tmp_path / f"file{i}.txt").write_text(f"content {i}\n")
+    monkeypatch.chdir(tmp_path)
+    workspace = SecureWorkspace(home_dir=".", backup_dir="bk", use_index=False, max_workers=1,
+                                io_order="none")
+    assert workspace.backup_dir == tmp_path.resolve() / "bk"
+    workspace.save_snapshot()
+    workspace.backup_files()
+    assert sorted(workspace.snapshot) == [f"file{i}.txt" for i in range(5)]
+
+    (tmp_path / "file0.txt").write_text("changed\n")
+    assert workspace.detect_changes() == ([], ["file0.txt"], [])
@@ -0,0 +1,86 @@
+"""Hashing keeps going when a file fails; see SecureWorkspace._hash_entries"""
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from secure_workspace import SecureWorkspace  # noqa: E402
+
+
+def make_tree(root, count):
+    for i in range(count):
+        directory = root / f"dir{i % 10}"
+        directory.mkdir(exist_ok=True)
+        (directory / f"file{i}.txt").write_text(f"content {i}\n")
+
+
+def scan(workspace, timeout=60):
+    """scan_directory_fast, failing instead of hanging if the pipeline stalls"""
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(scan=workspace.scan_directory_fast()),
+                              daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "scan hung"
+    return result["scan"]
+
+
+@pytest.mark.skipif(hasattr(os, "geteuid") and os.geteuid() == 0, reason="root reads any file")
+def test_unreadable_file_is_skipped(tmp_path):
+    make_tree(tmp_path, 20)
+    unreadable = tmp_path / "dir3" / "file3.txt"
+    unreadable.chmod(0)
+    try:
+        workspace = SecureWorkspace(home_dir=str(tmp_path), use_index=False, max_workers=1,
+                                    io_order="none")
+        hashes, stats = scan(workspace)
+    finally:
+        unreadable.chmod(0o644)
+    assert len(hashes) == 19
+    assert "dir3/file3.txt" not in hashes
+    assert set(stats) == set(hashes)
+
+
+def test_failing_file_does_not_stop_the_worker(tmp_path, monkeypatch):
+    make_tree(tmp_path, 1300)
+    workspace = SecureWorkspace(home_dir=str(tmp_path), use_index=False, max_workers=1,
+                                io_order="none")
+    hash_file_with_stat = workspace.hash_file_with_stat
+
+    def failing(path):
+        if path.endswith(os.sep + "file7.txt"):
+            raise ValueError("unexpected failure")
+        return hash_file_with_stat(path)
+
+    monkeypatch.setattr(workspace, "hash_file_with_stat", failing)
+    hashes, stats = scan(workspace)
+    assert len(hashes) == 1299
+    assert "dir7/file7.txt" not in hashes
+    assert set(stats) == set(hashes)
+
+
+def test_failing_worker_raises_instead_of_hanging(tmp_path):
+    make_tree(tmp_path, 1300)
+
+    def on_event(message):
+        if message["event"] == "progress" and message["phase"] == "hash":
+            raise RuntimeError("consumer failed")  # Raised in a hashing worker
+
+    workspace = SecureWorkspace(home_dir=str(tmp_path), use_index=False, max_workers=1,
+                                io_order="none", on_event=on_event)
+    errors = []
+
+    def run():
+        try:
+            workspace.scan_directory_fast()
+        except RuntimeError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(60)
+    assert not thread.is_alive(), "scan hung"
+    assert errors
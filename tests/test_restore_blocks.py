@@ -0,0 +1,40 @@
+"""Large files restored block by block are replaced atomically"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from secure_workspace import TREE_CHUNK_SIZE, SecureWorkspace  # noqa: E402
+
+
+def restore_modified(tmp_path, monkeypatch, **options):
+    home = tmp_path / "home"
+    home.mkdir()
+    original = bytes(range(256)) * (3 * TREE_CHUNK_SIZE // 256)
+    big = home / "big.bin"
+    big.write_bytes(original)
+    workspace = SecureWorkspace(home_dir=str(home), backup_dir=str(tmp_path / "backup"),
+                                use_index=False, max_workers=1, io_order="none",
+                                large_file_threshold=TREE_CHUNK_SIZE, **options)
+    workspace.save_snapshot()
+    workspace.backup_files()
+
+    with open(big, "r+b") as f:
+        f.seek(TREE_CHUNK_SIZE + 10)
+        f.write(b"changed")
+    inode = os.stat(big).st_ino
+    # As on a filesystem without reflinks
+    monkeypatch.setattr(type(workspace.open_store().copier), "clone", lambda self, src, dst: False)
+    assert workspace.restore_path("big.bin") == "patched"
+    assert big.read_bytes() == original
+    return inode, os.stat(big).st_ino
+
+
+def test_patch_replaces_the_file(tmp_path, monkeypatch):
+    before, after = restore_modified(tmp_path, monkeypatch)
+    assert before != after  # Patched a copy and renamed it over the file
+
+
+def test_patch_in_place_on_request(tmp_path, monkeypatch):
+    before, after = restore_modified(tmp_path, monkeypatch, patch_in_place=True)
+    assert before == after
@@ -0,0 +1,47 @@
+"""Resuming a scan progress log; see scan_progress.ScanProgress"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scan_progress import ScanProgress  # noqa: E402
+
+HEADER = {"home": "/home/user", "settings": {"algorithm": "md5"}}
+DIGESTS = {name: f"{i:032x}" for i, name in enumerate(["a.txt", "b.txt", "c.txt", "d.txt"])}
+SIGNATURE = [3, 1700000000000000000, 42, 1700000000000000000]
+
+
+def test_resume_after_torn_line(tmp_path):
+    progress = ScanProgress(str(tmp_path), HEADER)
+    progress.start(resume=False)
+    progress.record("a.txt", DIGESTS["a.txt"], SIGNATURE)
+    progress.record("b.txt", DIGESTS["b.txt"], SIGNATURE)
+    progress.close()
+    with open(progress.path, "a") as f:
+        f.write('["c.txt", "00')  # The crash hit mid-write
+
+    progress = ScanProgress(str(tmp_path), HEADER)
+    hashes, _ = progress.load()
+    assert sorted(hashes) == ["a.txt", "b.txt"]
+    progress.start(resume=True)
+    progress.record("c.txt", DIGESTS["c.txt"], SIGNATURE)
+    progress.record("d.txt", DIGESTS["d.txt"], SIGNATURE)
+    progress.close()
+
+    hashes, stats = ScanProgress(str(tmp_path), HEADER).load()
+    assert dict(hashes.items()) == DIGESTS
+    assert list(stats["d.txt"]) == SIGNATURE
+
+
+def test_resume_keeps_complete_log(tmp_path):
+    progress = ScanProgress(str(tmp_path), HEADER)
+    progress.start(resume=False)
+    progress.record("a.txt", DIGESTS["a.txt"], SIGNATURE)
+    progress.close()
+
+    progress.start(resume=True)
+    progress.record("b.txt", DIGESTS["b.txt"], SIGNATURE)
+    progress.close()
+
+    hashes, _ = ScanProgress(str(tmp_path), HEADER).load()
+    assert sorted(hashes) == ["a.txt", "b.txt"]
@@ -0,0 +1,31 @@
+"""Chunk trees are kept only for large files a snapshot or backup records"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from secure_workspace import RACY_MTIME_WINDOW_NS, TREE_CHUNK_SIZE, SecureWorkspace  # noqa: E402
+
+
+def test_trees_follow_the_snapshot(tmp_path):
+    home = tmp_path / "home"
+    home.mkdir()
+    big = home / "big.bin"
+    big.write_bytes(b"a" * (2 * TREE_CHUNK_SIZE))
+    workspace = SecureWorkspace(home_dir=str(home), backup_dir=str(tmp_path / "backup"),
+                                use_index=False, max_workers=1, io_order="none",
+                                large_file_threshold=TREE_CHUNK_SIZE)
+    workspace.save_snapshot()
+    workspace.backup_files()
+    first = workspace.snapshot["big.bin"]
+    assert sorted(os.listdir(workspace.tree_dir)) == [first]
+
+    time.sleep(RACY_MTIME_WINDOW_NS / 1e9)
+    big.write_bytes(b"b" * (2 * TREE_CHUNK_SIZE))
+    assert workspace.detect_changes() == ([], ["big.bin"], [])
+    assert sorted(os.listdir(workspace.tree_dir)) == [first]  # A rescan records nothing
+
+    workspace.save_snapshot()
+    workspace.backup_files()
+    assert sorted(os.listdir(workspace.tree_dir)) == [workspace.snapshot["big.bin"]]
@@ -0,0 +1,425 @@
+"""Resident daemon that keeps a SecureWorkspace loaded between actions.
+
+Spawning ``python3 start_session.py``/``stop_session.py`` per action pays
+for the imports, the snapshot load and a cold rescan every time. The
+daemon keeps one ``SecureWorkspace`` per backup directory in memory, with
+its snapshot and the stat cache of its last rescan, so a repeated detect
+only stats the tree and rehashes what was touched since.
+
+Clients talk JSON-RPC 2.0 over the Unix socket ``backup_dir/daemon.sock``
+(mode 0600), one JSON object per line in each direction:
+
+    -> {"jsonrpc": "2.0", "id": 1, "method": "detect", "params": {"paranoid": false}}
+    <- {"jsonrpc": "2.0", "method": "log", "params": {"line": "Detecting changes..."}}
+    <- {"jsonrpc": "2.0", "id": 1, "result": {"added": [...], "modified": [...], "deleted": [...]}}
+
+Methods: ``status``, ``start`` (options, watch, single_pass, export_json),
+``detect`` (options, paranoid), ``changes`` (options, paranoid: streams
+each change as a ``change`` event and returns the counts), ``stop``
+(options, paranoid, keep, patch_in_place, and optionally the ``changes`` a
+client showed its user) and ``shutdown``.
+``options`` are SecureWorkspace arguments, used when the daemon has to
+create its workspace (by default, those of the last ``start``). Output the
+workspace prints while serving a request is forwarded to that client as
+``log`` notifications, and its events (see workspace_events) as ``event``
+notifications. Requests that touch the
+workspace run one at a time.
+
+    python workspace_daemon.py [--backup-dir DIR]
+"""
+import argparse
+import inspect
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from pathlib import Path
+
+from checkpoint_log import CheckpointError
+from restore_plan import summarize
+import workspace_events
+from secure_workspace import SecureWorkspace, default_backup_dir
+from snapshot_format import SnapshotFormatError
+
+SOCKET_NAME = "daemon.sock"
+
+# SecureWorkspace arguments a client may pass (backup_dir is the daemon's)
+WORKSPACE_OPTIONS = {
+    "home_dir", "max_depth", "max_workers", "use_index", "copy_strategy", "large_file_policy",
+    "large_file_threshold", "large_file_backup", "compression", "io_order", "cache_hints",
+    "walk_workers",
+}
+
+# JSON-RPC error codes
+PARSE_ERROR = -32700
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+WORKSPACE_ERROR = -32000  # The request was valid but the workspace refused it
+
+
+class InvalidParams(ValueError):
+    """A request's parameters don't fit its method"""
+
+
+def socket_path(backup_dir=None):
+    backup_dir = Path(backup_dir).expanduser() if backup_dir else default_backup_dir()
+    return backup_dir / SOCKET_NAME
+
+
+class DaemonError(RuntimeError):
+    """An error response from the daemon"""
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+class _Connection:
+    """One client socket; sends are serialized across threads"""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.reader = sock.makefile('r', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def send(self, message):
+        data = (json.dumps(message) + "\n").encode()
+        with self._lock:
+            self.sock.sendall(data)
+
+
+class _LogRouter:
+    """sys.stdout stand-in sending printed lines to the client being served
+
+    Requests that print run one at a time, so one "current" client is
+    enough, and prints from the workspace's worker threads follow it too.
+    """
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+        self.client = None
+        self._partial = ""
+        self._lock = threading.Lock()
+
+    def write(self, text):
+        with self._lock:
+            client = self.client
+            if client is None:
+                return self.fallback.write(text)
+            lines = (self._partial + text).split("\n")
+            self._partial = lines.pop()
+        for line in lines:
+            try:
+                client.send({"jsonrpc": "2.0", "method": "log", "params": {"line": line}})
+            except OSError:
+                pass  # The client went away; the request still finishes
+        return len(text)
+
+    def flush(self):
+        self.fallback.flush()
+
+    def event(self, message):
+        """Forward a workspace event to the client being served"""
+        with self._lock:
+            client = self.client
+        if client is not None:
+            try:
+                client.send({"jsonrpc": "2.0", "method": "event", "params": message})
+            except OSError:
+                pass
+
+    def serve(self, client):
+        with self._lock:
+            self.client, self._partial = client, ""
+
+    def release(self):
+        with self._lock:
+            if self._partial and self.client is not None:
+                try:
+                    self.client.send({"jsonrpc": "2.0", "method": "log",
+                                      "params": {"line": self._partial}})
+                except OSError:
+                    pass
+            self.client, self._partial = None, ""
+
+
+class WorkspaceDaemon:
+    """Serves workspace requests for one backup directory"""
+
+    def __init__(self, backup_dir=None):
+        self.backup_dir = Path(backup_dir).expanduser() if backup_dir else default_backup_dir()
+        self.socket_path = socket_path(self.backup_dir)
+        self.workspace = None
+        self._snapshot_id = None  # _snapshot_identity() when the workspace's snapshot was loaded
+        self.options = {}  # Those of the last session started here
+        self._busy = threading.Lock()  # One workspace request at a time
+        self._log = _LogRouter(sys.stdout)
+        self._server = None
+
+    def serve_forever(self):
+        self.backup_dir.mkdir(parents=True, exist_ok=True)
+        if _responding(self.socket_path):
+            raise RuntimeError(f"A daemon is already serving {self.socket_path}")
+        if self.socket_path.exists():
+            self.socket_path.unlink()  # Left behind by a daemon that died
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o177)  # Only this user may connect
+        try:
+            self._server.bind(str(self.socket_path))
+        finally:
+            os.umask(umask)
+        self._server.listen()
+        sys.stdout = self._log
+        print(f"Secure Workspace daemon listening on {self.socket_path} (pid {os.getpid()})")
+        try:
+            while True:
+                try:
+                    sock, _ = self._server.accept()
+                except OSError:
+                    break  # Shut down by rpc_shutdown, once its response was sent
+                threading.Thread(target=self._serve_client, args=(sock,), daemon=True).start()
+        finally:
+            sys.stdout = self._log.fallback
+            self._server.close()
+            try:
+                self.socket_path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def _serve_client(self, sock):
+        client = _Connection(sock)
+        try:
+            for line in client.reader:
+                if not line.strip():
+                    continue
+                response = self._respond(client, line)
+                if response is not None:
+                    client.send(response)
+        except OSError:
+            pass  # Client disconnected
+        finally:
+            sock.close()
+
+    def _respond(self, client, line):
+        try:
+            request = json.loads(line)
+            method, params = request["method"], request.get("params") or {}
+        except (ValueError, KeyError, TypeError) as e:
+            return _error(None, PARSE_ERROR, f"Malformed request: {e}")
+        request_id = request.get("id")
+        handler = getattr(self, f"rpc_{method}", None) if isinstance(method, str) else None
+        if handler is None:
+            return _error(request_id, METHOD_NOT_FOUND, f"Unknown method: {method}")
+        try:
+            if not isinstance(params, dict):
+                raise TypeError("params must be an object")
+            inspect.signature(handler).bind(**params)
+        except TypeError as e:
+            return _error(request_id, INVALID_PARAMS, str(e))
+        try:
+            if method == "status":
+                result = handler(**params)
+            else:
+                with self._busy:
+                    self._log.serve(client)
+                    try:
+                        result = handler(**params)
+                        if self.workspace is not None:  # It may have saved the snapshot itself
+                            self._snapshot_id = self._snapshot_identity()
+                    finally:
+                        self._log.release()
+        except InvalidParams as e:
+            return _error(request_id, INVALID_PARAMS, str(e))
+        except (SnapshotFormatError, CheckpointError, ValueError, OSError) as e:
+            return _error(request_id, WORKSPACE_ERROR, str(e))
+        except Exception as e:
+            traceback.print_exc()  # A bug: keep the details in the daemon's own log
+            return _error(request_id, INTERNAL_ERROR, f"Internal error: {type(e).__name__}: {e}")
+        if request_id is None:
+            return None  # A notification: no response wanted
+        return {"jsonrpc": "2.0", "id": request_id, "result": result}
+
+    def _workspace(self, options, load=True):
+        """The resident workspace, created (and its snapshot loaded) on first use
+
+        A workspace whose snapshot file was replaced since it was loaded (by
+        a session started without the daemon) is dropped and loaded again.
+        """
+        if self.workspace is not None and self._snapshot_id != self._snapshot_identity():
+            print("The session's snapshot changed outside the daemon; loading it again.")
+            self.workspace = None
+        if self.workspace is None:
+            self.workspace = self._create(self.options if options is None else options)
+            if load:
+                try:
+                    self.workspace.load_snapshot()
+                except SnapshotFormatError:
+                    self.workspace = None
+                    raise
+            self._snapshot_id = self._snapshot_identity()
+        return self.workspace
+
+    def _snapshot_identity(self):
+        """(inode, mtime) of the snapshot file; every save replaces it"""
+        for path in (self.workspace.snapshot_file, self.workspace.snapshot_json_file):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            return st.st_ino, st.st_mtime_ns
+        return None
+
+    def _create(self, options):
+        unknown = set(options or {}) - WORKSPACE_OPTIONS
+        if unknown:
+            raise InvalidParams(f"Unknown workspace options: {', '.join(sorted(unknown))}")
+        return SecureWorkspace(backup_dir=self.backup_dir, on_event=self._log.event, **(options or {}))
+
+    def rpc_status(self):
+        sw = self.workspace
+        return {
+            "pid": os.getpid(),
+            "backup_dir": str(self.backup_dir),
+            "busy": self._busy.locked(),
+            "loaded": sw is not None,
+            "home": str(sw.home) if sw else None,
+            "files": len(sw.snapshot) if sw else None,
+        }
+
+    def rpc_start(self, options=None, watch=False, single_pass=False, export_json=False):
+        self.workspace = self._create(options)  # A new session: start from the given options
+        self.options = options or {}
+        start = time.time()
+        self.workspace.begin_session(watch=watch, single_pass=single_pass)
+        if export_json:
+            self.workspace.export_snapshot_json()
+        return {"seconds": time.time() - start, "files": len(self.workspace.snapshot),
+                "settings": self.workspace.session_settings()}
+
+    def rpc_detect(self, options=None, paranoid=False):
+        added, modified, deleted = self._workspace(options).detect_changes(paranoid=paranoid)
+        return {"added": added, "modified": modified, "deleted": deleted}
+
+    def rpc_changes(self, options=None, paranoid=False):
+        counts = {"added": 0, "modified": 0, "deleted": 0}
+        for change in self._workspace(options).iter_changes(paranoid=paranoid):
+            self._log.event(workspace_events.change(*change))
+            counts[change[0]] += 1
+        return counts
+
+    def rpc_stop(self, options=None, paranoid=False, keep=(), changes=None, patch_in_place=False):
+        sw = self._workspace(options)
+        sw.patch_in_place = patch_in_place
+        if changes is None:
+            changes = self.rpc_detect(paranoid=paranoid)
+        results = sw.revert_changes(changes.get("added", []), changes.get("modified", []),
+                                    changes.get("deleted", []), keep)
+        sw.end_session()
+        self.workspace = None  # The session is over
+        return {"results": [result._asdict() for result in results], "summary": summarize(results)}
+
+    def rpc_shutdown(self):
+        # Stop accepting once this response is on its way
+        threading.Timer(0.1, self._server.shutdown, args=(socket.SHUT_RDWR,)).start()
+        return True
+
+
+def _error(request_id, code, message):
+    return {"jsonrpc": "2.0", "id": request_id, "error": {"code": code, "message": message}}
+
+
+def _responding(path):
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(str(path))
+        return True
+    except OSError:
+        return False
+
+
+class DaemonClient:
+    """Calls a running daemon; see ``connect`` and ``ensure_daemon``"""
+
+    def __init__(self, sock):
+        self._connection = _Connection(sock)
+        self._ids = iter(range(1, sys.maxsize))
+
+    def call(self, method, on_log=print, on_event=None, **params):
+        """Run ``method`` and return its result
+
+        Log lines go to ``on_log`` and workspace events to ``on_event``.
+        """
+        request_id = next(self._ids)
+        self._connection.send({"jsonrpc": "2.0", "id": request_id, "method": method, "params": params})
+        for line in self._connection.reader:
+            message = json.loads(line)
+            if message.get("method") == "log":
+                if on_log is not None:
+                    on_log(message["params"]["line"])
+            elif message.get("method") == "event":
+                if on_event is not None:
+                    on_event(message["params"])
+            elif message.get("id") == request_id:
+                if "error" in message:
+                    raise DaemonError(message["error"]["code"], message["error"]["message"])
+                return message["result"]
+        raise DaemonError(WORKSPACE_ERROR, "The daemon closed the connection")
+
+    def close(self):
+        self._connection.sock.close()
+
+
+def connect(backup_dir=None):
+    """A client for the daemon serving ``backup_dir``, or None if none is running"""
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(str(socket_path(backup_dir)))
+    except OSError:
+        sock.close()
+        return None
+    return DaemonClient(sock)
+
+
+def ensure_daemon(backup_dir=None, timeout=10):
+    """Connect to the daemon for ``backup_dir``, starting one if needed
+
+    Returns None if no daemon could be reached (e.g. without Unix sockets).
+    """
+    client = connect(backup_dir)
+    if client is not None or not hasattr(socket, "AF_UNIX"):
+        return client
+    command = [sys.executable, os.path.abspath(__file__)]
+    if backup_dir:
+        command += ["--backup-dir", str(backup_dir)]
+    subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                     stderr=subprocess.DEVNULL, start_new_session=True)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        client = connect(backup_dir)
+        if client is not None:
+            return client
+        time.sleep(0.05)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve Secure Workspace requests over a Unix socket")
+    parser.add_argument("--backup-dir",
+                        help="backup directory to serve (default: $SECURE_WORKSPACE_BACKUP_DIR or the temp dir)")
+    args = parser.parse_args()
+    try:
+        WorkspaceDaemon(args.backup_dir).serve_forever()
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Machine-readable events describing what a SecureWorkspace is doing.
+
+A workspace created with ``on_event`` calls it with one dict per event,
+alongside the lines it prints for people. ``event`` names the kind:
+
+    {"event": "progress", "phase": "hash", "done": 1200, "total": 5000}
+    {"event": "counts", "phase": "snapshot", "files": 5000}
+    {"event": "changes", "added": [...], "modified": [...], "deleted": [...]}
+    {"event": "change", "kind": "modified", "path": "notes/todo.txt",
+     "old_digest": "9e10...", "new_digest": "52c8..."}
+    {"event": "error", "path": "notes/todo.txt", "message": "Permission denied"}
+    {"event": "log", "line": "Detecting changes..."}
+
+Progress is reported at most every ``PROGRESS_INTERVAL`` seconds per
+phase, plus once when the phase ends, so a consumer sees a steady trickle
+however many files go by. ``total`` is None while it is still growing
+(hashing starts before the walk has found every file).
+
+``change`` events stream the items of ``iter_changes()`` one at a time
+(list_changes.py). ``start_session.py --events`` and
+``stop_session.py --events`` write the stream as JSON lines on stdout,
+with their printed output as ``log`` events; the daemon forwards it as
+``event`` notifications.
+"""
+import json
+import threading
+import time
+
+EVENT_KINDS = ("progress", "counts", "changes", "change", "error", "log")
+PROGRESS_INTERVAL = 0.25  # Seconds between progress events of one phase
+
+
+def event(kind, /, **fields):
+    return {"event": kind, **fields}
+
+
+def change(kind, path, old_digest, new_digest):
+    """The ``change`` event for one item of ``SecureWorkspace.iter_changes()``"""
+    return event("change", kind=kind, path=path, old_digest=old_digest, new_digest=new_digest)
+
+
+def parse_event(line):
+    """The event on a JSON line, or None for anything else (e.g. a traceback)"""
+    try:
+        message = json.loads(line)
+    except ValueError:
+        return None
+    return message if isinstance(message, dict) and "event" in message else None
+
+
+class Progress:
+    """Rate-limited progress events for one phase; callers serialize calls"""
+
+    def __init__(self, emit, phase, total=None, interval=PROGRESS_INTERVAL):
+        self.emit = emit
+        self.phase = phase
+        self.total = total
+        self.interval = interval
+        self._sent_at = 0.0
+
+    def report(self, done, total=None):
+        now = time.monotonic()
+        if now - self._sent_at >= self.interval:
+            self._sent_at = now
+            self.emit("progress", phase=self.phase, done=done, total=total or self.total)
+
+    def finish(self, done):
+        self.emit("progress", phase=self.phase, done=done, total=done)
+
+
+class JsonLinesSink:
+    """``on_event`` callback writing each event as a JSON line to ``stream``"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._lock = threading.Lock()  # Events come from worker threads too
+
+    def __call__(self, message):
+        line = json.dumps(message) + "\n"
+        with self._lock:
+            self.stream.write(line)
+            self.stream.flush()
+
+
+class PrintedLines:
+    """sys.stdout stand-in turning printed lines into ``log`` events"""
+
+    def __init__(self, on_event):
+        self.on_event = on_event
+        self._partial = ""
+        self._lock = threading.Lock()
+
+    def write(self, text):
+        with self._lock:
+            lines = (self._partial + text).split("\n")
+            self._partial = lines.pop()
+        for line in lines:
+            self.on_event(event("log", line=line))
+        return len(text)
+
+    def flush(self):
+        with self._lock:
+            line, self._partial = self._partial, ""
+        if line:
+            self.on_event(event("log", line=line))